@@ -0,0 +1,88 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import uuid
+from datetime import datetime
+
+import pytz
+
+# Runs the server in process, on stores in a temporary directory
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "server", "ap_server")
+STORE_DIR = tempfile.mkdtemp()
+os.environ["THREAD_STORE_PATH"] = os.path.join(STORE_DIR, "threads.sqlite3")
+os.environ["STORE_PATH"] = os.path.join(STORE_DIR, "store.sqlite3")
+os.environ["RUN_STORE_PATH"] = os.path.join(STORE_DIR, "runs.sqlite3")
+os.environ["HIL_SPILL_DIR"] = os.path.join(STORE_DIR, "hil_sessions")
+sys.path.insert(0, SERVER_DIR)
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+from models import MultitaskStrategy, Run, Status  # noqa: E402
+from run_util import run_executor  # noqa: E402
+from storage_util.run_store import get_run_store  # noqa: E402
+
+
+async def story_agent(input_query: str):
+    # Stands in for the LLM backends, which need credentials.
+    return {"type": "text", "content": f"A story: {input_query}", "role": "assistant"}
+
+
+def leave_run(thread_id: str, owner: str) -> str:
+    """Stores a run left pending by `owner`, as a process killed before it ran it would"""
+    now = datetime.now(pytz.UTC)
+    run = Run(run_id=uuid.uuid4(), thread_id=thread_id, assistant_id="autogen", created_at=now, updated_at=now,
+              status=Status.pending, metadata={}, kwargs={"input": {"query": "a cat"}},
+              multitask_strategy=MultitaskStrategy.reject)
+    get_run_store().put(run, owner)
+    return str(run.run_id)
+
+
+def run_status(run_id: str) -> str:
+    with sqlite3.connect(os.environ["RUN_STORE_PATH"]) as connection:
+        return connection.execute("SELECT status FROM runs WHERE run_id = ?", (run_id,)).fetchone()[0]
+
+
+def test_runs_recovered_after_restart():
+    """Test that a restarted server interrupts the runs of dead processes, and only those"""
+    print("=== Testing Run Recovery After a Restart ===")
+    run_executor.BACKENDS["autogen"] = story_agent
+    body = {"assistant_id": "autogen", "input": {"messages": [{"content": "write a story about a cat"}]}}
+    with TestClient(main.create_app()) as client:
+        crashed_thread = client.post("/threads", json={}).json()["thread_id"]
+        live_thread = client.post("/threads", json={}).json()["thread_id"]
+        # A run of this process' executor that never ended, as if the server had been killed
+        own_run = leave_run(crashed_thread, run_executor.get_run_executor().owner)
+
+    boot_id = run_executor.get_boot_id()
+    # A run of a worker process that exited
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    dead_run = leave_run(crashed_thread, f"{boot_id}:{exited.pid}:{uuid.uuid4()}")
+    # A run of a worker process that is still running
+    live = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+    live_run = leave_run(live_thread, f"{boot_id}:{live.pid}:{uuid.uuid4()}")
+    try:
+        with TestClient(main.create_app()) as client:
+            assert run_status(own_run) == "interrupted", run_status(own_run)
+            assert run_status(dead_run) == "interrupted", run_status(dead_run)
+            assert run_status(live_run) == "pending", run_status(live_run)
+            print("✅ Runs of stopped processes interrupted, runs of running processes kept")
+
+            response = client.post(f"/threads/{crashed_thread}/runs/wait", json=body)
+            assert response.status_code == 200, f"{response.status_code} - {response.text}"
+            assert response.json()["messages"][-1]["content"] == "A story: write a story about a cat"
+            print("✅ Thread of the crashed runs accepts runs again")
+
+            response = client.post(f"/threads/{live_thread}/runs", json=body)
+            assert response.status_code == 409, f"{response.status_code} - {response.text}"
+            print("✅ Thread with a run in another process still rejects runs")
+    finally:
+        live.kill()
+        live.wait()
+
+
+if __name__ == "__main__":
+    test_runs_recovered_after_restart()
@@ -1,10 +1,8 @@
 # Description: This file contains a sample graph that makes a stateless request to the autogen server
 # which is instrumented to use human-in-the-loop.
 # 1. Start the server: python3 server/ap_server/main.py
-# 2. Start the client: python3 client/rest_human_in_loop_autogen.py
-# 3. Monitor the server logs, after running the client. When prompted, as below - enter 'APPROVE' on the server terminal.
-# 2025-02-13 10:14:49,183 - INFO - source='user_proxy' models_usage=None request_id='2e4386bb-0f69-4eaf-936d-7d6e4f48d4d1' content='' type='UserInputRequestedEvent'
-# APPROVE
+# 2. Start the client: python3 client/rest_human_in_loop_autogen_interrupt_node.py
+# 3. When the client asks, answer Yes to approve the text or No to ask the assistant for another version.
 
 import json
 import logging
@@ -46,32 +44,61 @@ class GraphState(TypedDict):
     messages: Annotated[List[BaseMessage], add_messages]
 
 
-# Graph node that makes a stateless request to the autogen server
+def iter_sse_events(response):
+    """Yields the (event, data) pairs of an SSE response."""
+    event_type, data = None, None
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith("event:"):
+            event_type = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data = line[len("data:"):].strip()
+        elif not line:
+            if event_type and data:
+                yield event_type, data
+            event_type, data = None, None
+
+
+# Graph node that resumes the suspended autogen run with the human input
 def node_autogen_resume(
     state: GraphState,
-) -> Command[Literal["exception_node", END]]:
+) -> Command[Literal["human_node", "exception_node", END]]:
 
-    headers = {"accept": "application/json", "Content-Type": "application/json"}
+    headers = {"accept": "text/event-stream", "Content-Type": "application/json"}
 
+    # The autogen team ends the conversation when the human says APPROVE.
+    human_input = "APPROVE" if state["human_input"] == "Yes" else state["human_input"]
     payload = {
         "agent_id": "hitl",
-        "input": {"messages": [HumanMessage(state["human_input"]).model_dump()]},
+        "input": {"messages": [HumanMessage(human_input).model_dump()]},
         "model": "gpt-4o",
         "thread_id": state["thread_id"]
     }
     try:
-        # Continue the process with user input and task ID
-        response = requests.post(url=url_continue, headers=headers, json=payload)
+        # Continue the process with user input and thread ID, the rest of the run is streamed back.
+        response = requests.post(url=url_continue, headers=headers, json=payload, stream=True)
         # Handle HTTP errors (4xx, 5xx)
         if response.status_code != 200:
             error_message = f"HTTP Error: {response.status_code} - {response.text}"
             return Command(
                 goto="exception_node", update={"exception_text": error_message}
             )
-        resp_json = response.json()
-        message = resp_json["choices"][0]["message"]
-        log.debug(f"Server response: {message["content"]}")
-        return Command(goto=END, update={"messages": [AIMessage(message["content"]).model_dump()]})
+        messages: List[BaseMessage] = []
+        for event_type, data in iter_sse_events(response):
+            if event_type == "error":
+                return Command(goto="exception_node", update={"exception_text": data})
+            if event_type != "updates":
+                continue
+            event_data = json.loads(data)
+            if event_data.get("type") == "__interrupt__":
+                # The assistant revised the text and asks for approval again.
+                message_to_approve = event_data["data"]["messages"][0]["content"]
+                log.debug(f"\nServer asks: {message_to_approve}\n")
+                return Command(goto="human_node", update={"text_to_approve": message_to_approve,
+                                                          "messages": messages})
+            for message in event_data["data"].get("messages", []):
+                log.debug(f"Server response: {message['content']}")
+                messages.append(AIMessage(message["content"]).model_dump())
+        return Command(goto=END, update={"messages": messages})
     except Exception as e:
         return Command(goto="exception_node", update={"exception_text": str(e)})
 
@@ -233,9 +260,13 @@ for chunk in graph.stream(inputs, config=config, stream_mode="updates"):
         print(chunk)
 
 state = graph.get_state(config)
-print(f"{state.values["text_to_approve"]}\n\n")
-human_input = input("Do you APPROVE this text (Yes/No)? ")
-
-# Resume using Command
-for chunk in graph.stream(Command(resume=human_input), config=config, stream_mode="updates"):
-    print(chunk)
+# Keep asking until the text is approved, every No gives the assistant another turn.
+while state.next:
+    print(f"{state.values["text_to_approve"]}\n\n")
+    human_input = input("Do you APPROVE this text (Yes/No)? ")
+
+    # Resume using Command
+    for chunk in graph.stream(Command(resume=human_input), config=config, stream_mode="updates"):
+        if "__interrupt__" not in chunk:
+            print(chunk)
+    state = graph.get_state(config)
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+
+from autogen_core import CancellationToken
+
+from autogen_agent_util.assistant_agent import get_assistant_agent
+from autogen_agent_util.llm_util import get_model_client
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+class AgentPool:
+    """
+    A bounded pool of reusable, pre-warmed AssistantAgent instances.
+
+    Agents are built on a small set of long-lived model clients, so the underlying HTTP
+    connection pools (and their TLS sessions) survive across requests. An agent is checked
+    out for the duration of a single run and its model context is reset before it goes
+    back to the pool, so no conversation state leaks between requests.
+
+    Attributes:
+        max_size (int): Maximum number of agents alive at any time.
+        num_clients (int): Number of model clients shared by the agents.
+        warm_size (int): Number of agents created ahead of the first request.
+        model_client_stream (bool): Whether the agents stream model tokens.
+    """
+
+    def __init__(self, max_size: int = 8, num_clients: int = 2, warm_size: int = 1,
+                 model_client_stream: bool = False):
+        self.max_size = max(1, max_size)
+        self.num_clients = max(1, min(num_clients, self.max_size))
+        self.warm_size = max(0, min(warm_size, self.max_size))
+        self.model_client_stream = model_client_stream
+        self._model_clients = []
+        self._client_index = 0
+        self._idle = []
+        self._created = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._checkouts = 0
+        self._discarded = 0
+        self._condition = asyncio.Condition()
+
+    def _next_model_client(self):
+        # Create model clients lazily, then hand them out round-robin.
+        if len(self._model_clients) < self.num_clients:
+            model_client = get_model_client()
+            if model_client is None:
+                raise RuntimeError("Model client could not be initialized.")
+            self._model_clients.append(model_client)
+            return model_client
+        self._client_index = (self._client_index + 1) % self.num_clients
+        return self._model_clients[self._client_index]
+
+    def get_model_client(self):
+        """
+        Returns one of the pool's long-lived model clients, for agents that live outside the pool.
+        """
+        return self._next_model_client()
+
+    def _create_agent(self):
+        agent_assistant, _ = get_assistant_agent(self._next_model_client(), self.model_client_stream)
+        if agent_assistant is None:
+            raise RuntimeError("AssistantAgent could not be initialized.")
+        self._created += 1
+        return agent_assistant
+
+    def warm_up(self):
+        """
+        Creates idle agents up to `warm_size` so the first requests do not pay for construction.
+        Errors are logged rather than raised, the pool falls back to creating agents on demand.
+        """
+        try:
+            while self._created < self.warm_size:
+                self._idle.append(self._create_agent())
+            logging.info(f"Agent pool warmed up with {self._created} agent(s).")
+        except Exception as e:
+            logging.error(f"An error occurred while warming up the agent pool: {e}")
+
+    async def _checkout(self):
+        async with self._condition:
+            self._waiting += 1
+            try:
+                await self._condition.wait_for(lambda: self._idle or self._created < self.max_size)
+            finally:
+                self._waiting -= 1
+            agent_assistant = self._idle.pop() if self._idle else self._create_agent()
+            self._in_use += 1
+            self._checkouts += 1
+            return agent_assistant
+
+    async def _checkin(self, agent_assistant):
+        # Clear the model context so the next run starts from a clean agent.
+        try:
+            await agent_assistant.on_reset(CancellationToken())
+            healthy = True
+        except Exception as e:
+            logging.error(f"An error occurred while resetting a pooled agent, discarding it: {e}")
+            healthy = False
+
+        async with self._condition:
+            self._in_use -= 1
+            if healthy:
+                self._idle.append(agent_assistant)
+            else:
+                self._created -= 1
+                self._discarded += 1
+            self._condition.notify()
+
+    @asynccontextmanager
+    async def acquire(self):
+        """
+        Checks out an agent for the duration of a run.
+
+        Yields:
+            tuple: The pooled AssistantAgent instance and a fresh CancellationToken for the run.
+        """
+        agent_assistant = await self._checkout()
+        try:
+            yield agent_assistant, CancellationToken()
+        finally:
+            await self._checkin(agent_assistant)
+
+    def stats(self):
+        """
+        Returns the current size and occupancy of the pool.
+
+        Returns:
+            dict: Pool limits and counters.
+        """
+        return {
+            "max_size": self.max_size,
+            "model_clients": len(self._model_clients),
+            "size": self._created,
+            "idle": len(self._idle),
+            "in_use": self._in_use,
+            "waiting": self._waiting,
+            "checkouts": self._checkouts,
+            "discarded": self._discarded,
+        }
+
+
+_agent_pools = {}
+
+
+def get_agent_pool(streaming: bool = False):
+    """
+    Returns the process-wide AgentPool, creating it on first use.
+
+    Streaming runs get their own pool of agents created with `model_client_stream=True`.
+    Each pool is sized from the AUTOGEN_AGENT_POOL_SIZE, AUTOGEN_MODEL_CLIENT_POOL_SIZE and
+    AUTOGEN_AGENT_POOL_WARM environment variables.
+
+    Args:
+        streaming (bool, optional): Return the pool of token-streaming agents.
+
+    Returns:
+        AgentPool: The shared agent pool.
+    """
+    agent_pool = _agent_pools.get(streaming)
+    if agent_pool is None:
+        agent_pool = AgentPool(
+            max_size=int(os.getenv("AUTOGEN_AGENT_POOL_SIZE", "8")),
+            num_clients=int(os.getenv("AUTOGEN_MODEL_CLIENT_POOL_SIZE", "2")),
+            warm_size=int(os.getenv("AUTOGEN_AGENT_POOL_WARM", "1")),
+            model_client_stream=streaming,
+        )
+        _agent_pools[streaming] = agent_pool
+    return agent_pool
@@ -7,7 +7,7 @@ from autogen_agent_util.llm_util import get_model_client
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 
-def get_assistant_agent():
+def get_assistant_agent(model_client=None, model_client_stream: bool = False):
     """
     Initializes and returns an instance of AssistantAgent and a CancellationToken.
 
@@ -16,6 +16,12 @@ def get_assistant_agent():
     the cancellation of tasks. If any exception occurs during the initialization,
     it logs the error and returns None for both the agent and the cancellation token.
 
+    Args:
+        model_client (optional): An existing model client to share with the agent.
+            A new client is created from the environment when not provided.
+        model_client_stream (bool, optional): If True, the agent streams model tokens as
+            ModelClientStreamingChunkEvent messages.
+
     Returns:
         tuple: A tuple containing the AssistantAgent instance and the CancellationToken instance.
                If an error occurs, both values in the tuple will be None.
@@ -25,7 +31,8 @@ def get_assistant_agent():
         agent_assistant = AssistantAgent(
             name="assistant",
             system_message="You are a helpful short story assistant. Provide the moral of the story and introduce a new character.",
-            model_client=get_model_client(),
+            model_client=model_client or get_model_client(),
+            model_client_stream=model_client_stream,
         )
         # Create a cancellation token to manage the cancellation of tasks.
         cancellation_token = CancellationToken()
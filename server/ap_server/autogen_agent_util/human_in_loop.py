@@ -1,17 +1,11 @@
 import logging
-from typing import Any
+from autogen_agentchat.base import TaskResult
 from autogen_agentchat.messages import TextMessage
-from autogen_agentchat.teams import RoundRobinGroupChat
-from autogen_agentchat.conditions import TextMentionTermination
-from autogen_agentchat.ui import Console
 from fastapi import HTTPException
-import uuid
 from fastapi import APIRouter
 
-from autogen_agent_util.assistant_agent import get_assistant_agent
-from autogen_agent_util.user_proxy_agent import get_user_proxy_agent
+from autogen_agent_util.session_registry import get_session_registry
 from autogen_agentchat.messages import UserInputRequestedEvent
-from langgraph.types import interrupt
 
 
 # Configure logging
@@ -21,96 +15,123 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(
 router = APIRouter(tags=["Stateless Runs"])
 
 
-paused_tasks = {}
-# Send the input query to the AssistantAgent and await the response.
-assistant_agent, cancellation_token = get_assistant_agent()
-user_proxy_agent = get_user_proxy_agent()
-termination = TextMentionTermination("APPROVE")
-team = RoundRobinGroupChat(
-    [assistant_agent, user_proxy_agent], termination_condition=termination
-)
-history: list[Any] = []
+async def stream_session_events(session):
+    """
+    Streams the messages of the current run of a session until it asks for human input or ends.
+
+    Args:
+        session (HumanInLoopSession): The session whose run is streamed.
 
+    Yields:
+        dict: The updates and interrupts of the conversation, tagged with the thread_id.
 
-async def autogen_agent_human_in_loop(input_query: str):
+    Raises:
+        HTTPException: If the run fails or produces an unknown message.
+    """
+    events = session.events
+    last_content = ""
+    while True:
+        message_autogen = await events.get()
+        if message_autogen is None:
+            await get_session_registry().release(session)
+            return
+        if isinstance(message_autogen, Exception):
+            raise HTTPException(status_code=500, detail=f"Error in autogen_agent: {str(message_autogen)}")
+
+        if isinstance(message_autogen, UserInputRequestedEvent):
+            log.info(f"Interrupt message: {message_autogen}")
+            # The run stays suspended on the user proxy until /runs/continue provides the input,
+            # unless the registry spills paused sessions (the spill completes before the interrupt is sent).
+            await get_session_registry().release(session)
+            yield {
+                "node": "autogen",
+                "type": "__interrupt__",
+                "thread_id": session.thread_id,
+                "mode": "updates",
+                "data": {"__interrupt__": "human approval",
+                         "messages": [{"role": "assistant", "content": last_content}]}
+            }
+            return
+        elif isinstance(message_autogen, TextMessage):
+            if message_autogen.source == "assistant":
+                last_content = message_autogen.content
+                log.info(f"AI message: {message_autogen}")
+                yield {
+                    "node": "autogen",
+                    "type": "updates",
+                    "thread_id": session.thread_id,
+                    "mode": "updates",
+                    "data": {"messages": [{"role": "assistant", "content": message_autogen.content}]},
+                }
+            else:
+                log.info(f"User message: {message_autogen}")
+        elif isinstance(message_autogen, TaskResult):
+            log.info(f"Conversation finished: {message_autogen.stop_reason}")
+        else:
+            raise HTTPException(status_code=500, detail=f"Unknown message type: {message_autogen}")
+
+
+async def autogen_agent_human_in_loop(input_query: str, thread_id: str = None):
     """
     Asynchronously processes an input query using the AssistantAgent and UserProxyAgent with human-in-loop
     and returns the response content.
-    Server expects the user to enter "APPROVE" on server terminal, to end the conversation.
+
+    Each thread gets its own team from the session registry, so concurrent conversations never share
+    agents or message history. When the user proxy asks for input the run is suspended, an interrupt
+    is yielded and the stream ends; `continue_process` resumes the same run.
 
     Args:
         input_query (str): The input query from the user.
+        thread_id (str, optional): The thread of the conversation. A new one is created if not provided.
 
-    Returns:
-        str: The content of the response message from the AssistantAgent.
+    Yields:
+        dict: The updates and interrupts of the conversation, tagged with the thread_id.
 
     Raises:
         HTTPException: If an error occurs during the processing of the input query.
     """
     try:
-        # Run the conversation and stream to the console.
-
-        if team._is_running:
-            await team.reset()
-        stream = team.run_stream(task=input_query)
-        async for message_autogen in stream:
-            history.append(message_autogen)
-            if isinstance(message_autogen, UserInputRequestedEvent):
-                task_id = str(uuid.uuid4())  # Optional: task_id
-                paused_tasks["task_id"] = {"status": "waiting_for_input"}
-                log.info(f"Interrupt message: {message_autogen}")
-                yield {
-                    "node": "autogen",
-                    "type": "__interrupt__",
-                    "thread_id": task_id,
-                    "mode": "updates",
-                    "data": {"__interrupt__": "human approval",
-                             "messages": [{"role": "assistant", "content": history[-2].content}]}
-                }
-            elif isinstance(message_autogen, TextMessage):
-                if message_autogen.source == "assistant":
-                    log.info(f"AI message: {message_autogen}")
-                    yield {
-                        "node": "autogen",
-                        "type": "updates",
-                        "thread_id": "",
-                        "mode": "updates",
-                        "data": {"messages": [{"role": "assistant", "content": message_autogen.content}]},
-                    }
-                else:
-                    log.info(f"User message: {message_autogen}")
-            else:
-                raise HTTPException(status_code=500, detail=f"Unknown message type: {message_autogen}")
+        session = await get_session_registry().get_or_create(thread_id)
 
+        # A new query replaces a run that is still suspended or in flight on this thread.
+        await session.stop()
+        session.start(input_query)
+        async for event_data in stream_session_events(session):
+            yield event_data
+
+    except HTTPException:
+        raise
     except Exception as e:
         # Raise an HTTPException with status code 500 if an error occurs.
         raise HTTPException(status_code=500, detail=f"Error in autogen_agent: {str(e)}")
 
 
-async def continue_process(user_input: str):  # Changed to dict to match client format
-    # Resume processing with user input
-    log.info(f"Server: Continuing task with input: {user_input}")
-    response = await assistant_agent.on_messages(
-        [TextMessage(content=user_input, source="user")], cancellation_token
-    )
-    history.append(response.chat_message.content)
-    # Return the content of the response message
-    common_response = {
-        "object": response.chat_message.type,
-        "choices": [
-            {
-                "message": {
-                    "role": response.chat_message.source,
-                    "content": response.chat_message.content,
-                }
-            }
-        ],
-        "usage": {
-            "prompt_tokens": response.chat_message.models_usage.prompt_tokens,
-            "completion_tokens": response.chat_message.models_usage.completion_tokens,
-            "total_tokens": response.chat_message.models_usage.prompt_tokens
-            + response.chat_message.models_usage.completion_tokens,
-        },
-    }
-
-    return common_response
+async def continue_process(user_input: str, thread_id: str = None):
+    """
+    Resumes the suspended run of a thread with the human input.
+
+    The thread and its state are checked before anything is streamed, so an unknown thread or a
+    thread that is not waiting for input fails with a plain HTTP error.
+
+    Args:
+        user_input (str): The human input, "APPROVE" ends the conversation.
+        thread_id (str): The thread of the conversation.
+
+    Returns:
+        AsyncGenerator: The rest of the run, in the format of `autogen_agent_human_in_loop`.
+
+    Raises:
+        HTTPException: 404 if the thread has no session, 409 if it is not waiting for input.
+    """
+    log.info(f"Server: Continuing task {thread_id} with input: {user_input}")
+    session = await get_session_registry().get(thread_id) if thread_id else None
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"No human-in-the-loop session for thread {thread_id}")
+
+    try:
+        session.provide_input(user_input)
+    except HTTPException:
+        # Hand a rehydrated session back to the store, so other workers still find it.
+        await get_session_registry().release(session)
+        raise
+    return stream_session_events(session)
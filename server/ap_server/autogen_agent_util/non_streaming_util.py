@@ -1,7 +1,7 @@
 from autogen_agentchat.messages import TextMessage
 from fastapi import HTTPException
 
-from autogen_agent_util.assistant_agent import get_assistant_agent
+from autogen_agent_util.agent_pool import get_agent_pool
 
 
 async def autogen_agent(input_query: str):
@@ -18,10 +18,10 @@ async def autogen_agent(input_query: str):
         HTTPException: If an error occurs during the processing of the input query.
     """
     try:
-        # Send the input query to the AssistantAgent and await the response.
-        assistant_agent, cancellation_token = get_assistant_agent()
-        response = await assistant_agent.on_messages([TextMessage(content=input_query, source="user")],
-                                                     cancellation_token)
+        # Check out a pooled AssistantAgent, send the input query and await the response.
+        async with get_agent_pool().acquire() as (assistant_agent, cancellation_token):
+            response = await assistant_agent.on_messages([TextMessage(content=input_query, source="user")],
+                                                         cancellation_token)
     except Exception as e:
         # Raise an HTTPException with status code 500 if an error occurs.
         raise HTTPException(status_code=500, detail=f"Error in autogen_agent: {str(e)}")
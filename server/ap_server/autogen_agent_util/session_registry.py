@@ -0,0 +1,390 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+
+from autogen_agentchat.conditions import TextMentionTermination
+from autogen_agentchat.messages import TextMessage
+from autogen_agentchat.teams import RoundRobinGroupChat
+from autogen_core import CancellationToken
+from fastapi import HTTPException
+
+from autogen_agent_util.agent_pool import get_agent_pool
+from autogen_agent_util.assistant_agent import get_assistant_agent
+from autogen_agent_util.session_store import SessionSpillStore
+from autogen_agent_util.user_proxy_agent import get_user_proxy_agent
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+class HumanInLoopSession:
+    """
+    A human-in-the-loop conversation: the team that runs it and its bookkeeping.
+
+    The team runs in a background task that pushes its messages to `events`. When the user proxy
+    asks for input, the run is suspended on a future instead of a blocking `input()` call, and
+    `provide_input` resumes the same run, so the conversation context is never rebuilt.
+
+    Attributes:
+        thread_id (str): The thread the conversation belongs to.
+        assistant_agent (AssistantAgent): The assistant of the team.
+        user_proxy_agent (UserProxyAgent): The user proxy of the team.
+        team (RoundRobinGroupChat): The team running the conversation.
+        status (str): One of "idle", "running" or "waiting_for_input".
+        events (asyncio.Queue): The messages of the current run, ended by None.
+        last_active (float): Monotonic time of the last activity.
+    """
+
+    def __init__(self, thread_id: str):
+        self.thread_id = thread_id
+        self.assistant_agent, self.cancellation_token = get_assistant_agent(get_agent_pool().get_model_client())
+        if self.assistant_agent is None:
+            raise HTTPException(status_code=500, detail="AssistantAgent could not be initialized.")
+        self.user_proxy_agent = get_user_proxy_agent(self.wait_for_input)
+        self.team = RoundRobinGroupChat(
+            [self.assistant_agent, self.user_proxy_agent], termination_condition=TextMentionTermination("APPROVE")
+        )
+        self.status = "idle"
+        self.events = None
+        self.run_task = None
+        self._run_cancellation_token = None
+        self._input_future = None
+        self.created_at = time.time()
+        self.last_active = time.monotonic()
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+    async def wait_for_input(self, prompt: str, cancellation_token: CancellationToken = None) -> str:
+        """
+        Input function of the user proxy: suspends the run until `provide_input` is called.
+        """
+        future = asyncio.get_running_loop().create_future()
+        if cancellation_token is not None:
+            cancellation_token.link_future(future)
+        self._input_future = future
+        self.status = "waiting_for_input"
+        try:
+            return await future
+        finally:
+            self._input_future = None
+            self.status = "running"
+            self.touch()
+
+    def provide_input(self, user_input: str):
+        """
+        Resumes the suspended run with the human input.
+
+        A session restored from a spill has no suspended run any more, the input starts the next
+        run of the restored team instead, which picks the conversation up at the same turn.
+
+        Raises:
+            HTTPException: 409 if the conversation is not waiting for input.
+        """
+        if self._input_future is not None and not self._input_future.done():
+            # Drop what an interrupted stream did not read, the resumed stream starts after the interrupt.
+            while not self.events.empty():
+                self.events.get_nowait()
+            self._input_future.set_result(user_input)
+        elif self.status == "waiting_for_input" and (self.run_task is None or self.run_task.done()):
+            self.start(TextMessage(content=user_input, source=self.user_proxy_agent.name))
+        else:
+            raise HTTPException(status_code=409, detail=f"Thread {self.thread_id} is not waiting for input.")
+
+    def start(self, task):
+        """
+        Starts a run of the team in the background, its messages go to a new `events` queue.
+        """
+        self.events = asyncio.Queue()
+        self._run_cancellation_token = CancellationToken()
+        self.status = "running"
+        self.run_task = asyncio.create_task(self._run(task, self.events, self._run_cancellation_token))
+
+    async def _run(self, task: str, events: asyncio.Queue, cancellation_token: CancellationToken):
+        try:
+            async for message in self.team.run_stream(task=task, cancellation_token=cancellation_token):
+                self.touch()
+                events.put_nowait(message)
+        except asyncio.CancelledError:
+            if not cancellation_token.is_cancelled():
+                raise
+            logging.info(f"Cancelled the run of human-in-the-loop session {self.thread_id}.")
+        except Exception as e:
+            events.put_nowait(e)
+        finally:
+            self.status = "idle"
+            events.put_nowait(None)
+
+    def close(self):
+        """
+        Cancels the current run, if any. The team is left stopped with its conversation intact.
+        """
+        if self._run_cancellation_token is not None:
+            self._run_cancellation_token.cancel()
+        if self._input_future is not None and not self._input_future.done():
+            self._input_future.cancel()
+
+    async def stop(self):
+        """
+        Cancels the current run, if any, and waits until the team has stopped.
+        """
+        self.close()
+        if self.run_task is not None:
+            await asyncio.gather(self.run_task, return_exceptions=True)
+            self.run_task = None
+
+    async def spill(self) -> dict:
+        """
+        Stops the session and serializes it, a suspended run is cancelled at the user proxy turn.
+
+        Returns:
+            dict: The thread_id, status, creation time and autogen team state of the session.
+        """
+        status = "waiting_for_input" if self.status == "waiting_for_input" else "idle"
+        await self.stop()
+        return {
+            "thread_id": self.thread_id,
+            "status": status,
+            "created_at": self.created_at,
+            "team_state": await self.team.save_state(),
+        }
+
+    async def restore(self, record: dict):
+        """
+        Loads a record written by `spill` into this session's team.
+        """
+        await self.team.load_state(record["team_state"])
+        self.status = record["status"]
+        self.created_at = record["created_at"]
+        self.touch()
+
+
+class SessionRegistry:
+    """
+    Registry of human-in-the-loop sessions keyed by thread_id.
+
+    Live sessions are kept in least-recently-used order, so lookups, touches and evictions are O(1).
+    Sessions idle for longer than `spill_after` seconds, and the least recently used session once
+    `max_sessions` is reached, are spilled to the `store` and dropped from memory: memory follows the
+    active conversations, while paused ones wait on disk. A spilled session is rehydrated on its next
+    lookup, and is dropped for good once it has been on disk for longer than `idle_ttl` seconds.
+
+    With `spill_on_pause`, a session is spilled as soon as its run pauses for input or ends, so only
+    running sessions live in memory. That is what lets several worker processes share the sessions
+    through the store: a conversation can be continued on any worker.
+
+    Attributes:
+        max_sessions (int): Maximum number of live sessions.
+        idle_ttl (float): Seconds after which a spilled session expires.
+        spill_after (float): Seconds of inactivity after which a live session is spilled.
+        store (SessionSpillStore): Where spilled sessions are kept.
+        spill_on_pause (bool): Spill sessions as soon as they stop running.
+    """
+
+    def __init__(self, max_sessions: int = 100, idle_ttl: float = 3600, spill_after: float = 300,
+                 store: SessionSpillStore = None, spill_on_pause: bool = False):
+        self.max_sessions = max(1, max_sessions)
+        self.idle_ttl = idle_ttl
+        self.spill_after = spill_after
+        self.store = store or SessionSpillStore()
+        self.spill_on_pause = spill_on_pause
+        self._sessions = OrderedDict()
+        self._spilling = {}
+        self._created = 0
+        self._spilled_idle = 0
+        self._spilled_capacity = 0
+        self._spilled_pause = 0
+        self._rehydrated = 0
+        self._expired = 0
+        self._hits = 0
+        self._misses = 0
+
+    async def get(self, thread_id: str):
+        """
+        Returns the session of a thread and marks it as recently used, or None.
+        A spilled session is rehydrated into memory.
+        """
+        session = self._sessions.get(thread_id)
+        if session is not None:
+            # Touch the session first, so the sweep below does not spill it.
+            self._sessions.move_to_end(thread_id)
+            session.touch()
+        await self.spill_idle()
+        if session is None:
+            session = await self._rehydrate(thread_id)
+        if session is None:
+            self._misses += 1
+            return None
+        self._hits += 1
+        return session
+
+    async def get_or_create(self, thread_id: str = None) -> HumanInLoopSession:
+        """
+        Returns the session of a thread, creating it (and a thread_id if needed) on a miss.
+
+        Raises:
+            HTTPException: 503 if the registry is full of running sessions.
+        """
+        thread_id = thread_id or str(uuid.uuid4())
+        session = await self.get(thread_id)
+        if session is not None:
+            return session
+
+        await self._make_room()
+        session = HumanInLoopSession(thread_id)
+        self._sessions[thread_id] = session
+        self._created += 1
+        return session
+
+    def remove(self, thread_id: str):
+        """
+        Drops the session of a thread, live or spilled, if any.
+
+        Returns:
+            HumanInLoopSession: The removed live session or None.
+        """
+        self.store.delete(thread_id)
+        session = self._sessions.pop(thread_id, None)
+        if session is not None:
+            session.close()
+        return session
+
+    async def _rehydrate(self, thread_id: str):
+        # Wait for a spill of this thread that is still being written.
+        spilling = self._spilling.get(thread_id)
+        if spilling is not None:
+            await asyncio.shield(spilling)
+        record = await asyncio.to_thread(self.store.take, thread_id)
+        if record is None:
+            return None
+
+        await self._make_room()
+        session = HumanInLoopSession(thread_id)
+        try:
+            await session.restore(record)
+        except Exception as e:
+            logging.error(f"Could not rehydrate the human-in-the-loop session of thread {thread_id}: {e}")
+            await asyncio.to_thread(self.store.save, thread_id, record)
+            return None
+        self._sessions[thread_id] = session
+        self._rehydrated += 1
+        logging.info(f"Rehydrated human-in-the-loop session {thread_id}.")
+        return session
+
+    async def _spill(self, thread_id: str, session: HumanInLoopSession):
+        # The session leaves the registry first, so no request picks it up while it is being stopped.
+        del self._sessions[thread_id]
+        spilling = asyncio.get_running_loop().create_future()
+        self._spilling[thread_id] = spilling
+        try:
+            record = await session.spill()
+            await asyncio.to_thread(self.store.save, thread_id, record)
+            logging.info(f"Spilled human-in-the-loop session {thread_id}.")
+        except Exception as e:
+            logging.error(f"Could not spill the human-in-the-loop session of thread {thread_id}: {e}")
+        finally:
+            del self._spilling[thread_id]
+            spilling.set_result(None)
+
+    async def release(self, session: HumanInLoopSession):
+        """
+        Called when the run of a session pauses for input or ends. With `spill_on_pause` the session
+        is spilled right away, so the next request of the thread can be served by any worker.
+        """
+        if self.spill_on_pause and self._sessions.get(session.thread_id) is session:
+            await self._spill(session.thread_id, session)
+            self._spilled_pause += 1
+
+    async def spill_idle(self):
+        """
+        Spills the live sessions idle for longer than `spill_after`. The oldest sessions come first,
+        so the scan stops at the first session that is still fresh. Running sessions stay in memory.
+        """
+        deadline = time.monotonic() - self.spill_after
+        idle = []
+        for thread_id, session in self._sessions.items():
+            if session.last_active > deadline:
+                break
+            if session.status != "running":
+                idle.append((thread_id, session))
+        for thread_id, session in idle:
+            await self._spill(thread_id, session)
+            self._spilled_idle += 1
+
+    async def _make_room(self):
+        if len(self._sessions) < self.max_sessions:
+            return
+        for thread_id, session in self._sessions.items():
+            if session.status != "running":
+                await self._spill(thread_id, session)
+                self._spilled_capacity += 1
+                return
+        raise HTTPException(status_code=503, detail="Too many human-in-the-loop sessions are running.")
+
+    async def expire_spilled(self):
+        """
+        Drops the spilled sessions older than `idle_ttl`.
+        """
+        self._expired += await asyncio.to_thread(self.store.expire, self.idle_ttl)
+
+    async def run_sweeper(self, interval: float = 60):
+        """
+        Spills idle sessions and expires old spilled sessions every `interval` seconds, so memory is
+        released even when no request arrives. Meant to run as a background task.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.spill_idle()
+                await self.expire_spilled()
+            except Exception as e:
+                logging.error(f"An error occurred while sweeping human-in-the-loop sessions: {e}")
+
+    def stats(self):
+        """
+        Returns the size, hit, spill and rehydration counters of the registry.
+        """
+        statuses = {}
+        for session in self._sessions.values():
+            statuses[session.status] = statuses.get(session.status, 0) + 1
+        return {
+            "max_sessions": self.max_sessions,
+            "idle_ttl": self.idle_ttl,
+            "spill_after": self.spill_after,
+            "sessions": len(self._sessions),
+            "statuses": statuses,
+            "spilled_sessions": self.store.count(),
+            "created": self._created,
+            "hits": self._hits,
+            "misses": self._misses,
+            "spilled_idle": self._spilled_idle,
+            "spilled_capacity": self._spilled_capacity,
+            "spilled_pause": self._spilled_pause,
+            "rehydrated": self._rehydrated,
+            "expired": self._expired,
+        }
+
+
+_session_registry = None
+
+
+def get_session_registry():
+    """
+    Returns the process-wide SessionRegistry, configured from HIL_MAX_SESSIONS, HIL_SESSION_IDLE_TTL
+    (seconds), HIL_SPILL_AFTER (seconds), HIL_SPILL_DIR and HIL_SPILL_ON_PAUSE. Sessions are spilled
+    on pause by default when the server runs several workers (WEB_CONCURRENCY).
+    """
+    global _session_registry
+    if _session_registry is None:
+        _session_registry = SessionRegistry(
+            max_sessions=int(os.getenv("HIL_MAX_SESSIONS", "100")),
+            idle_ttl=float(os.getenv("HIL_SESSION_IDLE_TTL", "3600")),
+            spill_after=float(os.getenv("HIL_SPILL_AFTER", "300")),
+            store=SessionSpillStore(os.getenv("HIL_SPILL_DIR", "hil_sessions")),
+            spill_on_pause=os.getenv("HIL_SPILL_ON_PAUSE", str(int(os.getenv("WEB_CONCURRENCY", "1")) > 1)).lower()
+            in ("1", "true", "yes"),
+        )
+    return _session_registry
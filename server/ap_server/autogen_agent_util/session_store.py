@@ -0,0 +1,116 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+class SessionSpillStore:
+    """
+    A local store for spilled human-in-the-loop sessions, one JSON file per thread. The directory can
+    be shared by the worker processes of the server.
+
+    Files are named after a hash of the thread_id, so any thread_id maps to a safe file name,
+    and are written to a temporary file first, so a crash never leaves a half-written session.
+
+    Attributes:
+        directory (str): The directory holding the spilled sessions.
+    """
+
+    def __init__(self, directory: str = "hil_sessions"):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, thread_id: str) -> str:
+        name = hashlib.sha256(thread_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{name}.json")
+
+    def save(self, thread_id: str, record: dict):
+        """
+        Writes the record of a spilled session, replacing any previous one.
+        """
+        path = self._path(thread_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f)
+        os.replace(tmp_path, path)
+
+    def load(self, thread_id: str):
+        """
+        Reads the record of a spilled session.
+
+        Returns:
+            dict: The record, or None if the thread has no spilled session.
+        """
+        try:
+            with open(self._path(thread_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except json.JSONDecodeError as e:
+            logging.error(f"Discarding unreadable spilled session of thread {thread_id}: {e}")
+            self.delete(thread_id)
+            return None
+
+    def take(self, thread_id: str):
+        """
+        Reads and removes the record of a spilled session in one step. The file is renamed before it
+        is read, so when several processes share the directory only one of them gets the session.
+
+        Returns:
+            dict: The record, or None if the thread has no spilled session.
+        """
+        path = self._path(thread_id)
+        claimed_path = f"{path}.{os.getpid()}.claimed"
+        try:
+            os.rename(path, claimed_path)
+        except FileNotFoundError:
+            return None
+        try:
+            with open(claimed_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except json.JSONDecodeError as e:
+            logging.error(f"Discarding unreadable spilled session of thread {thread_id}: {e}")
+            return None
+        finally:
+            os.remove(claimed_path)
+
+    def delete(self, thread_id: str):
+        """
+        Drops the spilled session of a thread, if any.
+        """
+        try:
+            os.remove(self._path(thread_id))
+        except FileNotFoundError:
+            pass
+
+    def expire(self, max_age: float) -> int:
+        """
+        Drops the spilled sessions written more than `max_age` seconds ago.
+
+        Returns:
+            int: The number of sessions dropped.
+        """
+        deadline = time.time() - max_age
+        expired = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    if entry.stat().st_mtime < deadline:
+                        os.remove(entry.path)
+                        expired += 1
+                except FileNotFoundError:
+                    pass
+        return expired
+
+    def count(self) -> int:
+        """
+        Returns the number of spilled sessions.
+        """
+        with os.scandir(self.directory) as entries:
+            return sum(1 for entry in entries if entry.name.endswith(".json"))
@@ -1,15 +1,60 @@
-import time
+import logging
 
-from autogen_agentchat.messages import TextMessage
+from autogen_agentchat.base import Response
+from autogen_agentchat.messages import ModelClientStreamingChunkEvent, TextMessage
 from fastapi import HTTPException
 
-from autogen_agent_util.assistant_agent import get_assistant_agent
+from autogen_agent_util.agent_pool import get_agent_pool
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+def sse_event(event: str, data: str) -> str:
+    """
+    Formats an SSE frame. Every line of a multi-line payload gets its own `data:` field,
+    so newlines inside model tokens do not terminate the frame early.
+
+    Args:
+        event (str): The SSE event name.
+        data (str): The payload of the event.
+
+    Returns:
+        str: The SSE frame.
+    """
+    data_lines = "".join(f"data: {line}\n" for line in data.split("\n"))
+    return f"event: {event}\n{data_lines}\n"
+
+
+async def autogen_agent_token_stream(input_query: str):
+    """
+    Asynchronously processes an input query using a token-streaming AssistantAgent.
+
+    Args:
+        input_query (str): The input query from the user.
+
+    Yields:
+        str: The model tokens of the response, as soon as they arrive from the model client.
+    """
+    # Check out a pooled token-streaming AssistantAgent and CancellationToken for the whole stream.
+    async with get_agent_pool(streaming=True).acquire() as (assistant_agent, cancellation_token):
+        # Send the input query to the AssistantAgent and get a stream of responses.
+        stream_output = assistant_agent.on_messages_stream([TextMessage(content=input_query, source="user")],
+                                                           cancellation_token)
+        async for response in stream_output:
+            if isinstance(response, ModelClientStreamingChunkEvent):
+                yield response.content
+            elif isinstance(response, Response):
+                logging.info(f"Streamed response usage: {response.chat_message.models_usage}")
 
 
 async def autogen_agent_streaming(input_query: str):
     """
     Asynchronously processes an input query using the AssistantAgent and streams the response content.
 
+    The agent streams model tokens, and each token chunk is yielded as an SSE frame as soon as
+    it arrives from the model client.
+
     Args:
         input_query (str): The input query from the user.
 
@@ -20,24 +65,15 @@ async def autogen_agent_streaming(input_query: str):
         HTTPException: If an error occurs during the processing of the input query.
     """
     try:
-        # Initialize the AssistantAgent and CancellationToken.
-        assistant_agent, cancellation_token = get_assistant_agent()
-        # Send the input query to the AssistantAgent and get a stream of responses.
-        stream_output = assistant_agent.on_messages_stream([TextMessage(content=input_query, source="user")],
-                                                           cancellation_token)
-
         # Yield the start status of the story.
-        yield "event: updates\ndata: [Start of the story]\n\n"
-        time.sleep(2)
+        yield sse_event("updates", "[Start of the story]")
 
-        # Iterate over the streamed responses and yield each response content.
-        async for response in stream_output:
-            print(response)
-            yield f"event: updates\ndata: {response.chat_message.content}\n\n"
-        time.sleep(2)
+        # Iterate over the streamed token chunks and yield each one.
+        async for token in autogen_agent_token_stream(input_query):
+            yield sse_event("updates", token)
 
         # Yield the end status of the story.
-        yield "event: updates\ndata: [End of the story]\n\n"
+        yield sse_event("updates", "[End of the story]")
     except Exception as e:
         # Raise an HTTPException with status code 500 if an error occurs.
         raise HTTPException(status_code=500, detail=f"Error in autogen_agent: {str(e)}")
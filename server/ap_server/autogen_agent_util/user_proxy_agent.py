@@ -6,6 +6,16 @@ from autogen_agentchat.agents import UserProxyAgent
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 
-def get_user_proxy_agent():
-    user_proxy = UserProxyAgent("user_proxy", input_func=input)  # Use input() to get user input from console.
-    return user_proxy
\ No newline at end of file
+def get_user_proxy_agent(input_func=input):
+    """
+    Creates the UserProxyAgent of a human-in-the-loop team.
+
+    Args:
+        input_func (callable, optional): The sync or async function that returns the human input.
+            Defaults to input(), which reads from the server console.
+
+    Returns:
+        UserProxyAgent: The user proxy agent.
+    """
+    user_proxy = UserProxyAgent("user_proxy", input_func=input_func)
+    return user_proxy
@@ -0,0 +1,166 @@
+import logging
+import os
+from collections import OrderedDict
+
+from llama_stack_client import AsyncLlamaStackClient, NotFoundError
+from llama_stack_client.types.agent_create_params import AgentConfig
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+class AgentCache:
+    """
+    An LRU cache of registered LlamaStack agents.
+
+    Registering an agent costs a round-trip to the LlamaStack server, so agents are created
+    once per distinct configuration and their ids reused; a request then only pays for
+    `create_session` and `create_turn`. One `AsyncLlamaStackClient` is kept per server URL so
+    its connection pool is shared by every cached agent.
+
+    The cache is only used from the event loop, so its bookkeeping needs no locking.
+
+    Attributes:
+        max_size (int): Maximum number of registered agents kept alive.
+    """
+
+    def __init__(self, max_size: int = 32):
+        self.max_size = max(1, max_size)
+        self._agent_ids = OrderedDict()
+        self._clients = {}
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @staticmethod
+    def make_key(base_url: str, agent_config: AgentConfig):
+        """
+        Builds the cache key of an agent configuration.
+
+        Args:
+            base_url (str): The base URL of the LlamaStack server.
+            agent_config (AgentConfig): The agent configuration.
+
+        Returns:
+            tuple: A hashable key made of the server, model, instructions, toolgroups and shields.
+        """
+        return (
+            base_url,
+            agent_config["model"],
+            agent_config["instructions"],
+            repr(agent_config.get("toolgroups") or []),
+            tuple(agent_config.get("input_shields") or []),
+            tuple(agent_config.get("output_shields") or []),
+        )
+
+    def get_client(self, base_url: str) -> AsyncLlamaStackClient:
+        """
+        Returns the shared AsyncLlamaStackClient for a server URL.
+        """
+        client = self._clients.get(base_url)
+        if client is None:
+            client = AsyncLlamaStackClient(base_url=base_url)
+            self._clients[base_url] = client
+        return client
+
+    async def get_agent_id(self, base_url: str, agent_config: AgentConfig) -> str:
+        """
+        Returns the id of a registered agent for the configuration, registering it on a cache miss.
+
+        Args:
+            base_url (str): The base URL of the LlamaStack server.
+            agent_config (AgentConfig): The agent configuration.
+
+        Returns:
+            str: The id of the cached agent.
+        """
+        key = self.make_key(base_url, agent_config)
+        agent_id = self._agent_ids.get(key)
+        if agent_id is not None:
+            self._agent_ids.move_to_end(key)
+            self._hits += 1
+            return agent_id
+        self._misses += 1
+
+        response = await self.get_client(base_url).agents.create(agent_config=agent_config)
+        logging.info(f"Registered LlamaStack agent {response.agent_id} for model {agent_config['model']}.")
+
+        # Another request may have registered the same configuration meanwhile.
+        existing = self._agent_ids.get(key)
+        if existing is not None:
+            self._agent_ids.move_to_end(key)
+            return existing
+        self._agent_ids[key] = response.agent_id
+        while len(self._agent_ids) > self.max_size:
+            _, evicted = self._agent_ids.popitem(last=False)
+            self._evictions += 1
+            logging.info(f"Evicted LlamaStack agent {evicted} from the cache.")
+        return response.agent_id
+
+    async def create_session(self, base_url: str, agent_config: AgentConfig, session_name: str):
+        """
+        Creates a session on the cached agent of the configuration.
+
+        If the server no longer knows the agent (e.g. it was restarted), the cache entry is
+        invalidated and the agent registered again once.
+
+        Args:
+            base_url (str): The base URL of the LlamaStack server.
+            agent_config (AgentConfig): The agent configuration.
+            session_name (str): The name of the new session.
+
+        Returns:
+            tuple: The id of the cached agent and the id of the new session.
+        """
+        client = self.get_client(base_url)
+        agent_id = await self.get_agent_id(base_url, agent_config)
+        try:
+            response = await client.agents.session.create(agent_id=agent_id, session_name=session_name)
+        except NotFoundError:
+            logging.warning(f"LlamaStack agent {agent_id} is gone, registering it again.")
+            self.invalidate(base_url, agent_config)
+            agent_id = await self.get_agent_id(base_url, agent_config)
+            response = await client.agents.session.create(agent_id=agent_id, session_name=session_name)
+        return agent_id, response.session_id
+
+    def invalidate(self, base_url: str = None, agent_config: AgentConfig = None):
+        """
+        Drops cached agents so the next request registers them again.
+
+        Args:
+            base_url (str, optional): Only drop agents of this server.
+            agent_config (AgentConfig, optional): Only drop the agent of this configuration.
+                Requires `base_url`.
+        """
+        if agent_config is not None:
+            self._agent_ids.pop(self.make_key(base_url, agent_config), None)
+        elif base_url is not None:
+            for key in [key for key in self._agent_ids if key[0] == base_url]:
+                del self._agent_ids[key]
+        else:
+            self._agent_ids.clear()
+
+    def stats(self):
+        """
+        Returns the size and hit ratio counters of the cache.
+        """
+        return {
+            "max_size": self.max_size,
+            "size": len(self._agent_ids),
+            "hits": self._hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+        }
+
+
+_agent_cache = None
+
+
+def get_agent_cache():
+    """
+    Returns the process-wide AgentCache, sized from LLAMASTACK_AGENT_CACHE_SIZE.
+    """
+    global _agent_cache
+    if _agent_cache is None:
+        _agent_cache = AgentCache(max_size=int(os.getenv("LLAMASTACK_AGENT_CACHE_SIZE", "32")))
+    return _agent_cache
@@ -1,11 +1,12 @@
+import asyncio
 import os
 from dotenv import load_dotenv
-from llama_stack_client.lib.agents.agent import Agent
-from llama_stack_client.lib.agents.event_logger import EventLogger
+from fastapi import HTTPException
 from llama_stack_client.types.agent_create_params import AgentConfig
-from llama_stack_client import LlamaStackClient
 from termcolor import cprint
 
+from llamastack_agent_util.agent_cache import get_agent_cache
+
 # Load environment variables
 load_dotenv()
 
@@ -18,8 +19,8 @@ class LlamaAgent:
         self.base_url = base_url or os.environ.get("LLAMASTACK_SERVER_URL")
         self.model = model or os.environ.get("LLAMASTACK_INFERENCE_MODEL")
 
-        # Initialize LlamaStack client
-        self.client = LlamaStackClient(base_url=self.base_url)
+        # Share the async LlamaStack client of this server across requests
+        self.client = get_agent_cache().get_client(self.base_url)
         
         # Configure agent
         self.agent_config = AgentConfig(
@@ -31,33 +32,49 @@ class LlamaAgent:
             enable_session_persistence=False,
         )
         
-        # Create agent instance
-        self.agent = Agent(self.client, self.agent_config)
+        # The agent is registered once per configuration and reused from the cache
+        self.agent_id = None
 
-    def run(self, prompt: str):
+    async def run(self, prompt: str):
         """
-        Runs the agent with the provided user prompts and returns the responses.
+        Runs the agent with the provided user prompt and returns the response.
+        The turn is streamed on the async client, so no worker thread is held while the LLM runs, and
+        the response is read from the turn of its `turn_complete` event: like `Agent.create_turn`, the
+        turn is always streamed, as LlamaStack servers do not implement non-streaming agent turns.
         """
-        # Create a session for this run
-        session_id = self.agent.create_session("test_session")
+        # Create a session for this run on the cached agent
+        self.agent_id, session_id = await get_agent_cache().create_session(
+            self.base_url, self.agent_config, "test_session"
+        )
         cprint(f"User> {prompt}", "green")
-        response = self.agent.create_turn(
+        turn_response = await self.client.agents.turn.create(
+            agent_id=self.agent_id,
             messages=[
                 {
                     "role": "user",
                     "content": prompt,
-                    }
-               ],
-               session_id=session_id,
-               stream=False
-          )
+                }
+            ],
+            session_id=session_id,
+            stream=True,
+            allow_turn_resume=True,
+        )
 
-        return response.output_message.content
+        async for chunk in turn_response:
+            if hasattr(chunk, "error"):
+                raise HTTPException(status_code=500, detail=f"Error in llamastack agent: {chunk.error}")
+            payload = chunk.event.payload
+            if payload.event_type == "turn_complete":
+                return payload.turn.output_message.content
+            if payload.event_type == "turn_awaiting_input":
+                # The agent is configured without client tools, it has no tool call to resume.
+                raise HTTPException(status_code=500, detail="Llamastack agent turn awaits client tool results")
+        raise HTTPException(status_code=500, detail="Llamastack agent turn did not complete")
 
 # Example usage:
 if __name__ == "__main__":
-    # Initialize the LlamaAgent with a session name
-    llama_agent = LlamaAgent(session_name="test-session")
+    # Initialize the LlamaAgent
+    llama_agent = LlamaAgent()
 
     # Example user prompts
     user_prompts = [
@@ -65,9 +82,10 @@ if __name__ == "__main__":
         "What is the capital of France?"
     ]
 
-    # Run the agent with the user prompts and get responses
-    responses = llama_agent.run(user_prompts)
+    # Run the agent with each user prompt and output the responses
+    async def main():
+        for prompt in user_prompts:
+            response = await llama_agent.run(prompt)
+            cprint(f"Agent Response> {response}", "blue")
 
-    # Output the responses
-    for response in responses:
-        cprint(f"Agent Response> {response}", "blue")
+    asyncio.run(main())
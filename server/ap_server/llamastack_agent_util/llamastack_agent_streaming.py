@@ -1,15 +1,14 @@
 import asyncio
 import os
-import time
 
 from dotenv import load_dotenv
 from fastapi import HTTPException
-from llama_stack_client.lib.agents.agent import Agent
-from llama_stack_client.lib.agents.event_logger import EventLogger
+from llama_stack_client.lib.agents.event_logger import TurnStreamEventPrinter
 from llama_stack_client.types.agent_create_params import AgentConfig
-from llama_stack_client import LlamaStackClient
 from termcolor import cprint
 
+from llamastack_agent_util.agent_cache import get_agent_cache
+
 # Load environment variables from a .env file
 load_dotenv()
 
@@ -24,12 +23,12 @@ class LlamaAgentStreaming:
         The model to be used by the agent.
     base_url : str
         The base URL for the LlamaStack server.
-    client : LlamaStackClient
-        The client instance for interacting with the LlamaStack server.
+    client : AsyncLlamaStackClient
+        The shared async client instance for interacting with the LlamaStack server.
     agent_config : AgentConfig
         The configuration for the agent.
-    agent : Agent
-        The agent instance created with the provided configuration.
+    agent_id : str
+        The id of the cached agent registered for this configuration, set when a run starts.
     """
 
     def __init__(self, model: str = None, base_url: str = None):
@@ -47,8 +46,8 @@ class LlamaAgentStreaming:
         self.base_url = base_url or os.environ.get("LLAMASTACK_SERVER_URL")
         self.model = model or os.environ.get("LLAMASTACK_INFERENCE_MODEL")
 
-        # Initialize LlamaStack client
-        self.client = LlamaStackClient(base_url=self.base_url)
+        # Share the async LlamaStack client of this server across requests
+        self.client = get_agent_cache().get_client(self.base_url)
 
         # Configure agent
         self.agent_config = AgentConfig(
@@ -60,13 +59,16 @@ class LlamaAgentStreaming:
             enable_session_persistence=False,
         )
 
-        # Create agent instance
-        self.agent = Agent(self.client, self.agent_config)
+        # The agent is registered once per configuration and reused from the cache
+        self.agent_id = None
 
     async def run(self, prompt: str):
         """
         Runs the agent with the provided user prompts and returns the responses.
 
+        Chunks are read from the async client's stream, so the event loop is never blocked
+        while waiting for the next token.
+
         Parameters:
         ----------
         prompt : str
@@ -77,10 +79,13 @@ class LlamaAgentStreaming:
         str
             The response from the agent.
         """
-        # Create a session for this run
-        session_id = self.agent.create_session("test_session")
+        # Create a session for this run on the cached agent
+        self.agent_id, session_id = await get_agent_cache().create_session(
+            self.base_url, self.agent_config, "test_session"
+        )
         cprint(f"User> {prompt}", "green")
-        msg_output = self.agent.create_turn(
+        msg_output = await self.client.agents.turn.create(
+            agent_id=self.agent_id,
             messages=[
                 {
                     "role": "user",
@@ -91,10 +96,12 @@ class LlamaAgentStreaming:
             stream=True
         )
 
-        # Yield the start status of the story.
-        for log in EventLogger().log(msg_output):
+        # Format each chunk the same way EventLogger does and yield it as it arrives.
+        printer = TurnStreamEventPrinter()
+        async for chunk in msg_output:
             try:
-                yield f"{log}\n"
+                for log in printer.yield_printable_events(chunk):
+                    yield f"{log}\n"
             except Exception as e:
                 raise HTTPException(status_code=500, detail=f"Error in llamastack agent: {str(e)}")
 
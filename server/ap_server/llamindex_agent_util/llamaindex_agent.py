@@ -1,9 +1,10 @@
+import os
 import tiktoken
 from dotenv import load_dotenv
 from llama_index.core.agent import ReActAgent
 from llama_index.core.callbacks import CallbackManager, TokenCountingHandler
+from llama_index.core.llms import ChatMessage, MessageRole
 from llamindex_agent_util.llm_util import get_model_client
-from llama_index.core import Settings
 import logging
 
 load_dotenv()
@@ -11,16 +12,45 @@ load_dotenv()
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+# Execution mode of the llama_index assistant: "auto" chats with the LLM directly and only
+# falls back to the ReAct loop when tools are configured, "direct" and "react" force a mode.
+LLAMA_INDEX_AGENT_MODE = os.getenv("LLAMA_INDEX_AGENT_MODE", "auto")
 
-def llama_index_agent(input_query: str):
+
+def use_react(tools) -> bool:
     """
-    Processes an input query using the ReActAgent and returns the response content.
+    Decides whether a run goes through the ReAct loop or straight to the LLM.
+
+    Args:
+        tools (list): The tools configured for the run.
+
+    Returns:
+        bool: True if the ReActAgent should be used.
+    """
+    if LLAMA_INDEX_AGENT_MODE == "react":
+        return True
+    if LLAMA_INDEX_AGENT_MODE == "direct":
+        return False
+    return bool(tools)
+
+
+async def llama_index_agent(input_query: str, tools: list = None):
+    """
+    Asynchronously processes an input query with llama-index and returns the response content.
+
+    Without tools the conversation is sent straight to the LLM, which skips the ReAct system
+    prompt and the thought/action parsing. The ReActAgent is only used when tools are configured
+    (or LLAMA_INDEX_AGENT_MODE is "react").
+
+    The LLM and the token counter are scoped to this call and handed to the agent directly,
+    so concurrent runs never share or overwrite the global llama-index `Settings`.
 
     Args:
         input_query (str): The input query from the user.
+        tools (list, optional): The llama-index tools available to the ReActAgent.
 
     Returns:
-        str: The content of the response message from the ReActAgent.
+        dict: The content of the response message and its token usage.
 
     Raises:
         Exception: If an error occurs during the processing of the input query.
@@ -29,22 +59,72 @@ def llama_index_agent(input_query: str):
         token_counter = TokenCountingHandler(
             tokenizer=tiktoken.encoding_for_model("gpt-4o").encode
         )
+        callback_manager = CallbackManager([token_counter])
+        llm = get_model_client()
 
-        Settings.llm = get_model_client()
-        Settings.callback_manager = CallbackManager([token_counter])
-        # Initialize the ReActAgent with the model client and process the input query.
-        agent = ReActAgent.from_tools([], llm=get_model_client())
-        logging.info(f"llama index Agent initialized")
-        response = agent.chat(input_query + "Do no use ReActAgent tools to answer the question, just use the information provided in the input query for LLM")
+        if use_react(tools):
+            # Initialize the ReActAgent with a request-scoped model client and token counter.
+            agent = ReActAgent.from_tools(tools or [], llm=llm, callback_manager=callback_manager)
+            logging.info(f"llama index Agent initialized")
+            # Await the chat on the event loop instead of blocking it with the sync API.
+            response = await agent.achat(input_query)
+            message = agent.chat_history[-1]
+            content = response.response
+        else:
+            # Direct chat: the request-scoped callback manager still counts the tokens.
+            llm.callback_manager = callback_manager
+            response = await llm.achat([ChatMessage(role=MessageRole.USER, content=input_query)])
+            message = response.message
+            content = message.content
     except Exception as e:
         # Raise an Exception if an error occurs.
         raise Exception(f"Error in llama_index_agent: {str(e)}")
 
     # Return data to server in a common format
-    common_response = {"type": agent.chat_history[-1].blocks[0].block_type, "content": response.response, "role": agent.chat_history[-1].role.value, 
+    common_response = {"type": message.blocks[0].block_type, "content": content, "role": message.role.value,
                        "prompt_tokens": token_counter.prompt_llm_token_count,
                        "completion_tokens": token_counter.completion_llm_token_count}
     logging.info(f"prompt_tokens: {token_counter.prompt_llm_token_count}, completion_tokens: {token_counter.completion_llm_token_count}")
-    # Reset token counter
-    token_counter.reset_counts()
     return common_response
+
+
+async def llama_index_agent_stream(input_query: str, tools: list = None):
+    """
+    Asynchronously processes an input query with llama-index and streams the response content.
+
+    Uses the same direct/ReAct selection and request-scoped token counting as `llama_index_agent`.
+
+    Args:
+        input_query (str): The input query from the user.
+        tools (list, optional): The llama-index tools available to the ReActAgent.
+
+    Yields:
+        str: The response tokens, as soon as they arrive from the LLM.
+
+    Raises:
+        Exception: If an error occurs during the processing of the input query.
+    """
+    try:
+        token_counter = TokenCountingHandler(
+            tokenizer=tiktoken.encoding_for_model("gpt-4o").encode
+        )
+        callback_manager = CallbackManager([token_counter])
+        llm = get_model_client()
+
+        if use_react(tools):
+            agent = ReActAgent.from_tools(tools or [], llm=llm, callback_manager=callback_manager)
+            logging.info(f"llama index Agent initialized")
+            response = await agent.astream_chat(input_query)
+            async for token in response.async_response_gen():
+                yield token
+        else:
+            llm.callback_manager = callback_manager
+            response = await llm.astream_chat([ChatMessage(role=MessageRole.USER, content=input_query)])
+            async for chunk in response:
+                if chunk.delta:
+                    yield chunk.delta
+    except Exception as e:
+        # Raise an Exception if an error occurs.
+        raise Exception(f"Error in llama_index_agent: {str(e)}")
+
+    logging.info(f"prompt_tokens: {token_counter.prompt_llm_token_count}, completion_tokens: {token_counter.completion_llm_token_count}")
@@ -3,7 +3,9 @@
 from __future__ import annotations
 
 import os
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 from fastapi.responses import FileResponse
 import uvicorn
 
@@ -11,10 +13,56 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from routers import runs, stateless_runs, store, threads, human_in_loop, stateless_runs_llamastack
+from autogen_agent_util.agent_pool import get_agent_pool
+from autogen_agent_util.session_registry import get_session_registry
+from llamastack_agent_util.agent_cache import get_agent_cache
+from storage_util.item_store import close_item_store, get_item_store
+from storage_util.run_store import close_run_store
+from storage_util.thread_store import close_thread_store, get_thread_store
+from run_util.run_executor import close_run_executor, get_run_executor
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+
+def reclaim_thread_sessions(thread_ids: list):
+    # Drops the human-in-the-loop sessions, live or spilled, and the runs of collected threads.
+    registry = get_session_registry()
+    for thread_id in thread_ids:
+        registry.remove(thread_id)
+    get_run_executor().forget_threads(thread_ids)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pre-warm pooled agents so the first requests do not pay for client construction.
+    get_agent_pool().warm_up()
+    get_agent_pool(streaming=True).warm_up()
+    # Open the thread and item stores (and recover their indexes) before serving requests.
+    get_thread_store()
+    get_item_store()
+    # Spill idle human-in-the-loop sessions to disk even when no request arrives.
+    sweeper = asyncio.create_task(get_session_registry().run_sweeper())
+    # Delete expired store items in the background.
+    item_sweeper = asyncio.create_task(
+        get_item_store().run_sweeper(float(os.getenv("STORE_SWEEP_INTERVAL", "60")))
+    )
+    # Expire idle threads and reclaim the checkpoints and paused sessions of deleted ones in the background.
+    thread_sweeper = asyncio.create_task(get_thread_store().run_sweeper(
+        float(os.getenv("THREAD_SWEEP_INTERVAL", "60")), on_collect=reclaim_thread_sessions
+    ))
+    # Execute the background runs of threads with a bounded pool of workers.
+    get_run_executor().start()
+    yield
+    await close_run_executor()
+    sweeper.cancel()
+    item_sweeper.cancel()
+    thread_sweeper.cancel()
+    close_thread_store()
+    close_item_store()
+    close_run_store()
+
+
 def create_app():
     app = FastAPI(title="Agentic DB API", description="API for managing Agentic DB",
                   version="0.1.0")
@@ -22,6 +70,7 @@ def create_app():
     app = FastAPI(
         title="Agent Protocol",
         version="0.1.1",
+        lifespan=lifespan,
     )
 
     add_handlers(app)
@@ -50,6 +99,18 @@ def add_handlers(app: FastAPI):
     async def root():
         return {"message": "Gateway of the App"}
 
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return {
+            "autogen_agent_pool": get_agent_pool().stats(),
+            "autogen_streaming_agent_pool": get_agent_pool(streaming=True).stats(),
+            "llamastack_agent_cache": get_agent_cache().stats(),
+            "human_in_loop_sessions": get_session_registry().stats(),
+            "thread_store": get_thread_store().stats(),
+            "item_store": get_item_store().stats(),
+            "runs": get_run_executor().stats(),
+        }
+
     @app.get('/favicon.ico', include_in_schema=False)
     async def favicon():
         file_name = "favicon.ico"
@@ -58,7 +119,12 @@ def add_handlers(app: FastAPI):
 
 
 if __name__ == "__main__":
-    app = create_app()
     logging.info("Starting Agentic DB API...")
-    uvicorn.run(app, host="0.0.0.0", port=8123, log_level="info")
+    # Worker processes share the thread store and the spilled human-in-the-loop sessions on disk.
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    if workers > 1:
+        uvicorn.run("main:create_app", factory=True, workers=workers, host="0.0.0.0", port=8123, log_level="info")
+    else:
+        app = create_app()
+        uvicorn.run(app, host="0.0.0.0", port=8123, log_level="info")
     logging.info("Application shutdown")
@@ -12,6 +12,7 @@ from pydantic import AnyUrl, AwareDatetime, BaseModel, Field, RootModel, conint
 
 class Status(Enum):
     pending = "pending"
+    running = "running"
     error = "error"
     success = "success"
     timeout = "timeout"
@@ -28,9 +29,9 @@ class MultitaskStrategy(Enum):
 class Run(BaseModel):
     run_id: UUID = Field(..., description="The ID of the run.", title="Run Id")
     thread_id: UUID = Field(..., description="The ID of the thread.", title="Thread Id")
-    assistant_id: Optional[UUID] = Field(
+    assistant_id: Optional[Union[UUID, str]] = Field(
         None,
-        description="The assistant that was used for this run.",
+        description="The assistant or graph name that was used for this run.",
         title="Assistant Id",
     )
     created_at: AwareDatetime = Field(
@@ -41,7 +42,7 @@ class Run(BaseModel):
     )
     status: Status = Field(
         ...,
-        description="The status of the run. One of 'pending', 'error', 'success', 'timeout', 'interrupted'.",
+        description="The status of the run. One of 'pending', 'running', 'error', 'success', 'timeout', 'interrupted'.",
         title="Status",
     )
     metadata: Dict[str, Any] = Field(
@@ -161,6 +162,11 @@ class RunCreateStateless(BaseModel):
         None,
         description="The assistant ID or graph name to run. If using graph name, will default to first assistant created from that graph.",
     )
+    thread_id: Optional[str] = Field(
+        None,
+        description="The thread of a human-in-the-loop conversation to start or resume.",
+        title="Thread Id",
+    )
     input: Optional[Union[List[Dict[str, Any]], Dict[str, Any]]] = Field(
         None, description="The input to the graph.", title="Input"
     )
@@ -326,6 +332,12 @@ class StorePutRequest(BaseModel):
     value: Dict[str, Any] = Field(
         ..., description="A dictionary containing the item's data.", title="Value"
     )
+    ttl: Optional[float] = Field(
+        None,
+        description="Optional number of seconds the item lives, by default the TTL configured for its namespace.",
+        gt=0,
+        title="TTL",
+    )
 
 
 class StoreDeleteRequest(BaseModel):
@@ -360,6 +372,48 @@ class StoreSearchRequest(BaseModel):
         description="Number of items to skip before returning results (default is 0).",
         title="Offset",
     )
+    query: Optional[str] = Field(
+        None,
+        description="Optional natural language query, items are then ranked by similarity to it.",
+        title="Query",
+    )
+
+
+class StoreOperationType(Enum):
+    put = "put"
+    get = "get"
+    delete = "delete"
+
+
+class StoreBatchOperation(BaseModel):
+    op: StoreOperationType = Field(..., description="The operation to run.", title="Op")
+    namespace: List[str] = Field(
+        ...,
+        description="A list of strings representing the namespace path.",
+        title="Namespace",
+    )
+    key: str = Field(
+        ...,
+        description="The unique identifier for the item within the namespace.",
+        title="Key",
+    )
+    value: Optional[Dict[str, Any]] = Field(
+        None, description="The item's data, required for put operations.", title="Value"
+    )
+    ttl: Optional[float] = Field(
+        None,
+        description="Optional number of seconds a put item lives, by default the TTL configured for its namespace.",
+        gt=0,
+        title="TTL",
+    )
+
+
+class StoreBatchRequest(BaseModel):
+    operations: List[StoreBatchOperation] = Field(
+        ...,
+        description="The operations to run in order, in a single transaction.",
+        title="Operations",
+    )
 
 
 class StoreListNamespacesRequest(BaseModel):
@@ -410,8 +464,28 @@ class Item(BaseModel):
     )
 
 
+class SearchItem(Item):
+    score: Optional[float] = Field(
+        None, description="The similarity of the item to the search query, if one was given."
+    )
+
+
 class SearchItemsResponse(BaseModel):
-    items: List[Item]
+    items: List[SearchItem]
+
+
+class StoreBatchResult(BaseModel):
+    op: StoreOperationType
+    item: Optional[Item] = Field(
+        None, description="The stored item of a put, or the item read by a get (null if not found)."
+    )
+    deleted: Optional[bool] = Field(
+        None, description="Whether the item of a delete existed."
+    )
+
+
+class StoreBatchResponse(BaseModel):
+    results: List[StoreBatchResult]
 
 
 class ListNamespaceResponse(RootModel[List[List[str]]]):
@@ -19,6 +19,17 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(
 router = APIRouter(tags=["Stateless Runs"])
 
 
+def get_thread_id(body: RunCreateStateless):
+    """
+    Returns the human-in-the-loop thread of a run, from `thread_id` or `config.configurable.thread_id`.
+    """
+    if body.thread_id:
+        return str(body.thread_id)
+    configurable = (body.config.configurable if body.config else None) or {}
+    thread_id = configurable.get("thread_id")
+    return str(thread_id) if thread_id else None
+
+
 @router.post(
     "/runs/human_in_loop",
     response_model=Any,
@@ -111,7 +122,7 @@ async def human_in_the_loop_interrupt(
             try:
                 # Run the autogen agent with the extracted messages and awaits for
                 # stream outputs
-                async for event_data in autogen_agent_human_in_loop(human_input_content):
+                async for event_data in autogen_agent_human_in_loop(human_input_content, get_thread_id(body)):
                     if not headers_sent:
                         # Mark that headers are about to be sent
                         headers_sent = True
@@ -125,7 +136,7 @@ async def human_in_the_loop_interrupt(
                     raise HTTPException(status_code=500, detail=f"Error before sending SSE: {str(e)}")
                 else:
                     # Headers already sent; yield an error event.
-                    error_data = json.dumps({"error": {e}})
+                    error_data = json.dumps({"error": str(e)})
                     yield f"event: error\ndata: {error_data}\n\n"
                     return
 
@@ -195,11 +206,23 @@ async def run_human_in_loop_continue(
                 "Missing 'content' in the first message of 'input.messages'."
             )
         logging.info(f"Received human message: {human_input_content}")
-        # Run the autogen agent with the extracted query input and await the output of humnan_in_loop.
-        output_data = await continue_process(human_input_content)
-        log.info(f"Resume Output: {output_data}")
+        # Resume the suspended run; unknown or busy threads fail here, before any SSE is sent.
+        events = await continue_process(human_input_content, get_thread_id(body))
+
+        async def event_generator():
+            try:
+                # Stream the rest of the same team run, up to the next interrupt or its end.
+                async for event_data in events:
+                    event_mode = event_data["mode"]
+                    log.info(f"Resume stream from Autogen: {event_data}")
+                    yield f"event: {event_mode}\ndata: {json.dumps(event_data)}\n\n"
+            except Exception as e:
+                # Headers already sent; yield an error event.
+                logging.error(f"Error during streaming: {e}")
+                error_data = json.dumps({"error": str(e)})
+                yield f"event: error\ndata: {error_data}\n\n"
 
-        return output_data
+        return StreamingResponse(event_generator(), media_type="text/event-stream")
     except HTTPException as http_exc:
         # Log HTTP exceptions and re-raise them so that FastAPI can generate the appropriate response.
         logging.error("HTTP error during run processing: %s", http_exc.detail)
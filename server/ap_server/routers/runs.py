@@ -3,36 +3,78 @@
 
 from __future__ import annotations
 
-from fastapi import APIRouter
+import asyncio
+
+from fastapi import APIRouter, HTTPException
 
 from models import (
     Action,
     Any,
     ErrorResponse,
+    IfExists,
+    IfNotExists,
     Optional,
     Run,
     RunCreateStateful,
+    ThreadCreate,
     ThreadsThreadIdRunsGetResponse,
     UUID,
     Union,
 )
+from routers.threads import create_thread_threads_post
+from run_util.run_executor import get_run_executor
+from storage_util.run_store import get_run_store
+from storage_util.thread_store import get_thread_store
 
 router = APIRouter(tags=["Runs"])
 
 
+def check_thread(thread_id: UUID, if_not_exists: IfNotExists = IfNotExists.reject):
+    """
+    Checks that a thread exists, or creates it if `if_not_exists` is "create".
+
+    Raises:
+        HTTPException: 404 if the thread does not exist and is not created.
+    """
+    if str(thread_id) in get_thread_store():
+        return
+    if if_not_exists == IfNotExists.create:
+        create_thread_threads_post(ThreadCreate(thread_id=thread_id, if_exists=IfExists.do_nothing))
+        return
+    raise HTTPException(status_code=404, detail=f"Thread with ID {thread_id} not found")
+
+
+async def submit_run(thread_id: UUID, body: RunCreateStateful) -> Run:
+    # Stores the run and queues it on the executor, the agent is called later by one of its workers.
+    await asyncio.to_thread(check_thread, thread_id, body.if_not_exists)
+    return await get_run_executor().submit(str(thread_id), body)
+
+
+async def join_run(thread_id: UUID, run_id: UUID):
+    # Waits for the run to end and returns its output, the values of the thread after the run.
+    found = await get_run_executor().join(str(thread_id), str(run_id))
+    if found is None:
+        raise HTTPException(status_code=404, detail=f"Run with ID {run_id} not found")
+    run, output, error = found
+    if error is not None:
+        return {"__error__": {"error": run.status.value, "message": error}}
+    return output
+
+
 @router.get(
     "/threads/{thread_id}/runs",
     response_model=ThreadsThreadIdRunsGetResponse,
     responses={"404": {"model": ErrorResponse}, "422": {"model": ErrorResponse}},
     tags=["Runs"],
 )
-def list_runs_http_threads__thread_id__runs_get(
+async def list_runs_http_threads__thread_id__runs_get(
     thread_id: UUID, limit: Optional[int] = 10, offset: Optional[int] = 0
 ) -> Union[ThreadsThreadIdRunsGetResponse, ErrorResponse]:
     """
     List Runs
     """
-    pass
+    await asyncio.to_thread(check_thread, thread_id)
+    return await asyncio.to_thread(get_run_store().list, str(thread_id), limit or 10, offset or 0)
 
 
 @router.post(
@@ -45,13 +87,13 @@ def list_runs_http_threads__thread_id__runs_get(
     },
     tags=["Runs"],
 )
-def create_run_threads__thread_id__runs_post(
+async def create_run_threads__thread_id__runs_post(
     thread_id: UUID, body: RunCreateStateful = ...
 ) -> Union[Run, ErrorResponse]:
     """
     Create Background Run
     """
-    pass
+    return await submit_run(thread_id, body)
 
 
 @router.post(
@@ -83,13 +125,14 @@ def stream_run_threads__thread_id__runs_stream_post(
     },
     tags=["Runs"],
 )
-def wait_run_threads__thread_id__runs_wait_post(
+async def wait_run_threads__thread_id__runs_wait_post(
     thread_id: UUID, body: RunCreateStateful = ...
 ) -> Union[Any, ErrorResponse]:
     """
     Create Run, Wait for Output
     """
-    pass
+    run = await submit_run(thread_id, body)
+    return await join_run(thread_id, run.run_id)
 
 
 @router.get(
@@ -98,13 +141,16 @@ def wait_run_threads__thread_id__runs_wait_post(
     responses={"404": {"model": ErrorResponse}, "422": {"model": ErrorResponse}},
     tags=["Runs"],
 )
-def get_run_http_threads__thread_id__runs__run_id__get(
+async def get_run_http_threads__thread_id__runs__run_id__get(
     thread_id: UUID, run_id: UUID = ...
 ) -> Union[Run, ErrorResponse]:
     """
     Get Run
     """
-    pass
+    found = await asyncio.to_thread(get_run_store().get, str(thread_id), str(run_id))
+    if found is None:
+        raise HTTPException(status_code=404, detail=f"Run with ID {run_id} not found")
+    return found[0]
 
 
 @router.delete(
@@ -113,13 +159,15 @@ def get_run_http_threads__thread_id__runs__run_id__get(
     responses={"404": {"model": ErrorResponse}, "422": {"model": ErrorResponse}},
     tags=["Runs"],
 )
-def delete_run_threads__thread_id__runs__run_id__delete(
+async def delete_run_threads__thread_id__runs__run_id__delete(
     thread_id: UUID, run_id: UUID = ...
 ) -> Union[Any, ErrorResponse]:
     """
     Delete Run
     """
-    pass
+    # A run still queued or running is interrupted first.
+    if not await get_run_executor().cancel(str(thread_id), str(run_id), rollback=True):
+        raise HTTPException(status_code=404, detail=f"Run with ID {run_id} not found")
 
 
 @router.post(
@@ -128,16 +176,20 @@ def delete_run_threads__thread_id__runs__run_id__delete(
     responses={"404": {"model": ErrorResponse}, "422": {"model": ErrorResponse}},
     tags=["Runs"],
 )
-def cancel_run_http_threads__thread_id__runs__run_id__cancel_post(
+async def cancel_run_http_threads__thread_id__runs__run_id__cancel_post(
     thread_id: UUID,
     run_id: UUID = ...,
     wait: Optional[bool] = False,
-    action: Optional[Action1] = "interrupt",
+    action: Optional[Action] = "interrupt",
 ) -> Union[Any, ErrorResponse]:
     """
     Cancel Run
     """
-    pass
+    action = Action(action or "interrupt")
+    if not await get_run_executor().cancel(str(thread_id), str(run_id), rollback=action == Action.rollback):
+        raise HTTPException(status_code=404, detail=f"Run with ID {run_id} not found")
+    if wait and action == Action.interrupt:
+        await get_run_executor().join(str(thread_id), str(run_id))
 
 
 @router.get(
@@ -161,10 +213,10 @@ def stream_run_http_threads__thread_id__runs__run_id__join_get(
     responses={"404": {"model": ErrorResponse}, "422": {"model": ErrorResponse}},
     tags=["Runs"],
 )
-def join_run_http_threads__thread_id__runs__run_id__join_get(
+async def join_run_http_threads__thread_id__runs__run_id__join_get(
     thread_id: UUID, run_id: UUID = ...
 ) -> Union[Any, ErrorResponse]:
     """
     Wait for Run output
     """
-    pass
+    return await join_run(thread_id, run_id)
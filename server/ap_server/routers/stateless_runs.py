@@ -5,19 +5,44 @@ from __future__ import annotations
 from http import HTTPStatus
 import json
 import logging
+from uuid import uuid4
 
 from fastapi import APIRouter, HTTPException, Response, status
 from fastapi.responses import StreamingResponse
 
 from autogen_agent_util.non_streaming_util import autogen_agent
 from autogen_agent_util.human_in_loop import autogen_agent_human_in_loop
-from autogen_agent_util.streaming_util import autogen_agent_streaming
+from autogen_agent_util.streaming_util import autogen_agent_streaming, autogen_agent_token_stream
 from models import Any, ErrorResponse, RunCreateStateless, Union
-from langchain_core.messages import AIMessage
-from llamindex_agent_util.llamaindex_agent import llama_index_agent
+from routers.human_in_loop import get_thread_id
+from langchain_core.messages import AIMessage, AIMessageChunk
+from llamindex_agent_util.llamaindex_agent import llama_index_agent_stream
 
 router = APIRouter(tags=["Stateless Runs"])
 
+# Assistants that can be run through /runs/stream
+STREAMING_ASSISTANTS = ("autogen", "autogen_human_in_loop", "llama_index")
+
+
+def sse_json_event(event: str, data: Any) -> str:
+    """
+    Formats an SSE frame whose data is serialized as a single line of JSON.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def get_stream_modes(body: RunCreateStateless) -> set:
+    """
+    Returns the stream modes requested by a run as a set of strings, defaulting to "values".
+    """
+    stream_mode = body.stream_mode
+    if not stream_mode:
+        return {"values"}
+    if not isinstance(stream_mode, list):
+        stream_mode = [stream_mode]
+    # Defaults are not validated by pydantic, so modes may be plain strings.
+    return {getattr(mode, "value", mode) for mode in stream_mode}
+
 
 @router.post(
     "/runs",
@@ -125,51 +150,80 @@ def stream_run_stateless_runs_stream_post(
                     "Missing 'content' in the first message of 'input.messages'."
                 )
 
-            # Small helper function
-            async def run_autogen(human_input: str) -> str:
-                # Run the autogen agent with the extracted query input and await the output.
-                output_data = await autogen_agent(human_input)
-                return output_data
+            if assistant_id not in STREAMING_ASSISTANTS:
+                raise ValueError("Unrecognized Agent")
+
+            stream_modes = get_stream_modes(body)
+            run_id = str(uuid4())
+            message_id = f"run-{run_id}"
+            tags = (config or {}).get("tags") or []
 
-            async def run_autogen_human_in_loop(human_input: str) -> str:
-                # Run the autogen agent with the extracted query input and human_in_loop.
-                output_data = await autogen_agent_human_in_loop(human_input)
-                return output_data
+            async def token_stream(human_input: str):
+                # Stream the model tokens of the agent as they are produced.
+                if assistant_id == "autogen":
+                    async for token in autogen_agent_token_stream(human_input):
+                        yield token
+                else:
+                    async for token in llama_index_agent_stream(human_input):
+                        yield token
 
             # -----------------------------------------------
             # Define a generator function for SSE streaming.
             # -----------------------------------------------
             async def event_generator():
                 """
-                Generator function to yield SSE events with JSON-formatted data.
-                The event data is serialized as JSON and prefixed with 'data:'.
-                """
-                # Create a dictionary with the response information.
+                Generator function to yield LangGraph-compatible SSE events with JSON-formatted data.
 
-                if assistant_id == "autogen":
-                    common_response = await run_autogen(human_input_content)
-                    output_data = common_response["content"]
-                elif assistant_id == "autogen_human_in_loop":
-                    common_response = await run_autogen_human_in_loop(
-                        human_input_content
-                    )
-                    output_data = common_response["content"]
-                elif assistant_id == "llama_index":
-                    common_response = llama_index_agent(human_input_content)
-                    output_data = common_response["content"]
-                else:
-                    raise ValueError("Unrecognized Agent")
-
-                event_data = {
-                    "messages": [AIMessage(output_data).model_dump()],
-                }
-                # Serialize the dictionary as JSON and yield as an SSE event.
-
-                # The event name here, "updates" MUST match the stream_mode on the client
-                yield f"event: messages\ndata: {json.dumps(event_data)}\n\n"
-                # This is for interrupts
-                # yield f"event: updates\ndata: {json.dumps(event_data)}\n\n"
-                # If more events are needed, add additional yields here.
+                Message chunks are emitted as soon as the agent produces them ("messages-tuple" is
+                what RemoteGraph requests for stream_mode="messages"), followed by the final
+                "updates" and "values" events for the requested stream modes.
+                """
+                metadata = {"run_id": run_id, "langgraph_node": assistant_id, "tags": tags}
+                yield sse_json_event("metadata", {"run_id": run_id})
+
+                messages = []
+                try:
+                    if assistant_id == "autogen_human_in_loop":
+                        # Human-in-the-loop runs produce whole messages and interrupts.
+                        async for event_data in autogen_agent_human_in_loop(human_input_content,
+                                                                            get_thread_id(body)):
+                            if event_data["type"] == "__interrupt__":
+                                # Interrupts are always sent as "updates", RemoteGraph raises on them.
+                                interrupt = [{"value": event_data["data"], "resumable": True,
+                                              "ns": [assistant_id], "when": "during"}]
+                                yield sse_json_event("updates", {"__interrupt__": interrupt})
+                                continue
+                            content = event_data["data"]["messages"][0]["content"]
+                            message = AIMessage(content, id=f"{message_id}-{len(messages)}")
+                            messages.append(message)
+                            if "messages-tuple" in stream_modes:
+                                yield sse_json_event("messages", [message.model_dump(), metadata])
+                            elif "messages" in stream_modes:
+                                yield sse_json_event("messages/complete", [message.model_dump()])
+                    else:
+                        content = ""
+                        async for token in token_stream(human_input_content):
+                            content += token
+                            if "messages-tuple" in stream_modes:
+                                chunk = AIMessageChunk(content=token, id=message_id)
+                                yield sse_json_event("messages", [chunk.model_dump(), metadata])
+                            elif "messages" in stream_modes:
+                                partial = AIMessage(content, id=message_id)
+                                yield sse_json_event("messages/partial", [partial.model_dump()])
+                        message = AIMessage(content, id=message_id)
+                        messages.append(message)
+                        if "messages" in stream_modes and "messages-tuple" not in stream_modes:
+                            yield sse_json_event("messages/complete", [message.model_dump()])
+
+                    event_data = {"messages": [message.model_dump() for message in messages]}
+                    if "updates" in stream_modes:
+                        yield sse_json_event("updates", {assistant_id: event_data})
+                    if "values" in stream_modes:
+                        yield sse_json_event("values", event_data)
+                except Exception as e:
+                    # Headers are already sent, report the failure as an error event.
+                    logging.exception("An error occurred while streaming the run.")
+                    yield sse_json_event("error", {"error": type(e).__name__, "message": str(e)})
 
             # Return a StreamingResponse with the SSE generator and the proper content type.
             return StreamingResponse(event_generator(), media_type="text/event-stream")
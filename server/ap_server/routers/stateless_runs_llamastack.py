@@ -25,13 +25,13 @@ router = APIRouter(tags=["Stateless Runs_Llamastack"])
     },
     tags=["Stateless Runs_Llamastack"],
 )
-def wait_run_stateless_runs_wait_post(
+async def wait_run_stateless_runs_wait_post(
         body: RunCreateStateless, ) -> Union[Any, ErrorResponse]:
     """
     Create Run, Wait for Output
 
 
-    Synchronously processes a stateless run request and returns the result.
+    Asynchronously processes a stateless run request and returns the result.
 
     Args:
         body (RunCreateStateless): The request body containing the run details.
@@ -48,9 +48,9 @@ def wait_run_stateless_runs_wait_post(
 
     print(f"Received query: {query_input}")
 
-    # Run the autogen agent with the extracted query input and await the output.
+    # Run the llamastack agent with the extracted query input and await the output.
     agent: LlamaAgent = LlamaAgent()
-    output_data = agent.run(query_input)
+    output_data = await agent.run(query_input)
     print(f"Output: {output_data}")
 
     return {"query": query_input, "output": output_data}
@@ -80,7 +80,7 @@ def run_stateless_runs_post(body: RunCreateStateless) -> Union[Any, ErrorRespons
     },
     tags=["Stateless Runs_Llamastack"],
 )
-def stream_run_stateless_runs_stream_post(
+async def stream_run_stateless_runs_stream_post(
         body: RunCreateStateless,
 ) -> Union[str, ErrorResponse]:
     """
@@ -3,21 +3,25 @@
 
 from __future__ import annotations
 
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 
 from models import (
     ErrorResponse,
     Item,
     ListNamespaceResponse,
-    Namespace,
     Optional,
     SearchItemsResponse,
+    StoreBatchRequest,
+    StoreBatchResponse,
+    StoreBatchResult,
     StoreDeleteRequest,
     StoreListNamespacesRequest,
+    StoreOperationType,
     StorePutRequest,
     StoreSearchRequest,
     Union,
 )
+from storage_util.item_store import get_item_store
 
 router = APIRouter(tags=["Store"])
 
@@ -32,7 +36,7 @@ def put_item(body: StorePutRequest) -> Optional[ErrorResponse]:
     """
     Store or update an item.
     """
-    pass
+    get_item_store().put(body.namespace, body.key, body.value, body.ttl)
 
 
 @router.delete(
@@ -45,7 +49,7 @@ def delete_item(body: StoreDeleteRequest) -> Optional[ErrorResponse]:
     """
     Delete an item.
     """
-    pass
+    get_item_store().delete(body.namespace or [], body.key)
 
 
 @router.get(
@@ -55,12 +59,15 @@ def delete_item(body: StoreDeleteRequest) -> Optional[ErrorResponse]:
     tags=["Store"],
 )
 def get_item(
-    key: str, namespace: Optional[Namespace] = None
+    key: str, namespace: Optional[str] = None
 ) -> Union[Item, ErrorResponse]:
     """
-    Retrieve a single item.
+    Retrieve a single item. The namespace is passed as its dot-joined labels, like the langgraph_sdk client does.
     """
-    pass
+    item = get_item_store().get(namespace.split(".") if namespace else [], key)
+    if item is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+    return item
 
 
 @router.post(
@@ -71,9 +78,37 @@ def get_item(
 )
 def search_items(body: StoreSearchRequest) -> Union[SearchItemsResponse, ErrorResponse]:
     """
-    Search for items within a namespace prefix.
+    Search for items within a namespace prefix, ranked by similarity to the query if one is given.
     """
-    pass
+    items = get_item_store().search(body.namespace_prefix, body.filter, body.limit or 10, body.offset or 0,
+                                    body.query)
+    return SearchItemsResponse(items=items)
+
+
+@router.post(
+    "/store/items/batch",
+    response_model=StoreBatchResponse,
+    responses={"422": {"model": ErrorResponse}},
+    tags=["Store"],
+)
+def batch_items(body: StoreBatchRequest) -> Union[StoreBatchResponse, ErrorResponse]:
+    """
+    Run put, get and delete operations in a single transaction, results are returned in order.
+    """
+    for position, operation in enumerate(body.operations):
+        if operation.op == StoreOperationType.put and operation.value is None:
+            raise HTTPException(status_code=422, detail=f"Operation {position} is a put without a value")
+    results = get_item_store().batch(
+        [(operation.op.value, operation.namespace, operation.key, operation.value, operation.ttl)
+         for operation in body.operations]
+    )
+    response = []
+    for operation, result in zip(body.operations, results):
+        if operation.op == StoreOperationType.delete:
+            response.append(StoreBatchResult(op=operation.op, deleted=result))
+        else:
+            response.append(StoreBatchResult(op=operation.op, item=result))
+    return StoreBatchResponse(results=response)
 
 
 @router.post(
@@ -88,4 +123,5 @@ def list_namespaces(
     """
     List namespaces with optional match conditions.
     """
-    pass
+    return get_item_store().list_namespaces(body.prefix, body.suffix, body.max_depth,
+                                              body.limit or 100, body.offset or 0)
@@ -12,7 +12,7 @@ from enum import Enum
 from datetime import datetime
 import pytz
 from models import IfExists, Status1, CheckpointConfig
-from llamastack_agent_util.llamastack_utils import load_from_pickle, save_to_pickle
+from storage_util.thread_store import get_thread_store
 
 from models import (
     Any,
@@ -32,7 +32,6 @@ from models import (
 )
 
 router = APIRouter(tags=["Threads"])
-threads_db = {}
 
 @router.post(
     "/threads",
@@ -44,30 +43,25 @@ def create_thread_threads_post(body: ThreadCreate) -> Union[Thread, ErrorRespons
     """
     Create Thread
     """
+    thread_store = get_thread_store()
     # Generate thread_id if not provided
     thread_id = body.thread_id if body.thread_id else uuid4()
     
     # Check if thread already exists
-    if str(thread_id) in threads_db:
-        if body.if_exists == IfExists.raise_:
-            raise HTTPException(
-                status_code=409,
-                detail=f"Thread with ID {thread_id} already exists"
-            )
-        elif body.if_exists == IfExists.do_nothing:
-            return threads_db[str(thread_id)]
+    if str(thread_id) in thread_store:
+        return existing_thread_response(thread_id, body.if_exists)
         
     # Get current time with timezone
     current_time = datetime.now(pytz.UTC).isoformat()
     
-    # create new threadstate
+    # create new threadstate, the first checkpoint of the thread
     thread_state = ThreadState(
         values={"state": []},
         next=[], 
         checkpoint=CheckpointConfig(
             thread_id=str(thread_id),
-        checkpoint_ns=None,
-        checkpoint_id=None,
+        checkpoint_ns="",
+        checkpoint_id=str(uuid4()),
         checkpoint_map=None,
     ),  
     metadata={},  # Empty dictionary for 'metadata'
@@ -82,19 +76,35 @@ def create_thread_threads_post(body: ThreadCreate) -> Union[Thread, ErrorRespons
         updated_at=current_time,
         metadata=body.metadata or {},
         status=Status1.idle,  # Default status for new threads is 'idle'
-        values={"states": [thread_state]}  
+        values=thread_state.values  # The latest values, the states are kept as checkpoints
     )
     
-    # Store thread in database
-    threads_db[str(thread_id)] = new_thread
-    
-    # Persist using pickle or json in the absence of persistence database
-    print(threads_db)
-    save_to_pickle(threads_db,"threads_db.pkl")
+    # Store thread in database, the call returns once the thread is committed to disk
+    if not thread_store.create(new_thread, thread_state):
+        # Another request created the same thread in the meantime
+        return existing_thread_response(thread_id, body.if_exists)
 
     return new_thread
 
 
+def existing_thread_response(thread_id: UUID, if_exists: IfExists) -> Thread:
+    """
+    Handles the creation of a thread that already exists, according to `if_exists`.
+
+    Raises:
+        HTTPException: 409 unless `if_exists` is "do_nothing".
+    """
+    if if_exists == IfExists.do_nothing:
+        thread = get_thread_store().get(str(thread_id))
+        # None while a deleted thread with this id waits to be collected
+        if thread is not None:
+            return thread
+    raise HTTPException(
+        status_code=409,
+        detail=f"Thread with ID {thread_id} already exists"
+    )
+
+
 
 @router.post(
     "/threads/search",
@@ -108,7 +118,15 @@ def search_threads_threads_search_post(
     """
     Search Threads
     """
-    pass
+    # Status and metadata filters are answered by the thread store's secondary indexes
+    status = body.status.value if isinstance(body.status, Status1) else body.status
+    return get_thread_store().search(
+        status=status,
+        metadata=body.metadata,
+        values=body.values,
+        limit=body.limit or 10,
+        offset=body.offset or 0,
+    )
 
 
 @router.get(
@@ -123,15 +141,15 @@ def get_thread_threads__thread_id__get(thread_id: UUID) -> Union[Thread, ErrorRe
     """
     thread_id_str = str(thread_id)
     
+    thread = get_thread_store().get(thread_id_str)
+
     # Check if the thread exists in the database
-    if thread_id_str not in threads_db:
+    if thread is None:
         raise HTTPException(
             status_code=404,
             detail=f"Thread with ID {thread_id_str} not found"
         )
     
-    thread = threads_db[thread_id_str]
-    
     return thread
 
 
@@ -147,7 +165,13 @@ def delete_thread_threads__thread_id__delete(
     """
     Delete Thread
     """
-    pass
+    thread_id_str = str(thread_id)
+    # Only the thread row goes now, its checkpoints are reclaimed by the background sweeper
+    if not get_thread_store().delete(thread_id_str):
+        raise HTTPException(
+            status_code=404,
+            detail=f"Thread with ID {thread_id_str} not found"
+        )
 
 
 @router.patch(
@@ -162,13 +186,25 @@ def patch_thread_threads__thread_id__patch(
     """
     Patch Thread
     """
-    pass
+    thread_id_str = str(thread_id)
+    # Metadata is merged under the thread's lock, concurrent patches do not lose each other's keys
+    thread = get_thread_store().patch(thread_id_str, metadata=body.metadata)
+    if thread is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Thread with ID {thread_id_str} not found"
+        )
+    return thread
 
 
 @router.post(
     "/threads/{thread_id}/copy",
     response_model=Thread,
-    responses={"409": {"model": ErrorResponse}, "422": {"model": ErrorResponse}},
+    responses={
+        "404": {"model": ErrorResponse},
+        "409": {"model": ErrorResponse},
+        "422": {"model": ErrorResponse},
+    },
     tags=["Threads"],
 )
 def copy_thread_post_threads__thread_id__copy_post(
@@ -177,13 +213,21 @@ def copy_thread_post_threads__thread_id__copy_post(
     """
     Copy Thread
     """
-    pass
+    thread_id_str = str(thread_id)
+    # Copy-on-write: the copy shares the checkpoints of the source
+    new_thread = get_thread_store().copy(thread_id_str)
+    if new_thread is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Thread with ID {thread_id_str} not found"
+        )
+    return new_thread
 
 
 @router.get(
     "/threads/{thread_id}/history",
     response_model=ThreadsThreadIdHistoryGetResponse,
-    responses={"422": {"model": ErrorResponse}},
+    responses={"404": {"model": ErrorResponse}, "422": {"model": ErrorResponse}},
     tags=["Threads"],
 )
 def get_thread_history_threads__thread_id__history_get(
@@ -192,7 +236,15 @@ def get_thread_history_threads__thread_id__history_get(
     """
     Get Thread History
     """
-    pass
+    thread_id_str = str(thread_id)
+    thread_store = get_thread_store()
+    if thread_id_str not in thread_store:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Thread with ID {thread_id_str} not found"
+        )
+    # Keyset pagination: `before` is the checkpoint id the previous page ended with
+    return thread_store.history(thread_id_str, limit=limit or 10, before=before)
 
 
 @router.get(
@@ -201,6 +253,8 @@ def get_thread_history_threads__thread_id__history_get(
     responses={"422": {"model": ErrorResponse}},
     tags=["Threads"],
 )
+# sync function, run in the threadpool: reading the state first syncs the store with the other
+# workers, which queries the database and may reload the index
 def get_latest_thread_state_threads__thread_id__state_get(
     thread_id: UUID,
 ) -> Union[ThreadState, ErrorResponse]:
@@ -209,25 +263,23 @@ def get_latest_thread_state_threads__thread_id__state_get(
     """
         # Convert UUID to string for lookup
     thread_id_str = str(thread_id)
-    threads_db = load_from_pickle("threads_db.pkl")
-    print(threads_db)
+    # Served from the store's resident index, once the changes of other workers are replayed into it
+    thread_state_latest = get_thread_store().get_state(thread_id_str)
     
     # Check if the thread exists in our database
-    if thread_id_str not in threads_db:
+    if thread_state_latest is None:
         raise HTTPException(
             status_code=404,
             detail=f"Thread with ID {thread_id} not found"
         )
-    else:
-        thread_state_latest: ThreadState =  threads_db[thread_id_str].values["states"][-1]
-        
-        return thread_state_latest
+    
+    return thread_state_latest
     
 
 @router.post(
     "/threads/{thread_id}/state",
     response_model=ThreadStateUpdateResponse,
-    responses={"422": {"model": ErrorResponse}},
+    responses={"404": {"model": ErrorResponse}, "422": {"model": ErrorResponse}},
     tags=["Threads"],
 )
 def update_thread_state_threads__thread_id__state_post(
@@ -236,4 +288,19 @@ def update_thread_state_threads__thread_id__state_post(
     """
     Update Thread State
     """
-    pass
+    thread_id_str = str(thread_id)
+    thread_store = get_thread_store()
+    if thread_id_str not in thread_store:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Thread with ID {thread_id_str} not found"
+        )
+    checkpoint_id = body.checkpoint.checkpoint_id if body.checkpoint else None
+    # The new state is stored as a delta against its parent checkpoint
+    state = thread_store.update_state(thread_id_str, body.values or {}, checkpoint_id)
+    if state is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Checkpoint {checkpoint_id} of thread {thread_id_str} not found"
+        )
+    return ThreadStateUpdateResponse(checkpoint=state.checkpoint.model_dump())
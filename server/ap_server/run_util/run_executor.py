@@ -0,0 +1,379 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from datetime import datetime
+from uuid import uuid4
+
+import pytz
+from fastapi import HTTPException
+
+from autogen_agent_util.non_streaming_util import autogen_agent
+from llamastack_agent_util.llamastack_agent import LlamaAgent
+from llamindex_agent_util.llamaindex_agent import llama_index_agent
+from models import MultitaskStrategy, Run, RunCreateStateful, Status
+from storage_util.run_store import FINAL_STATUSES, RunStore, get_run_store
+from storage_util.thread_store import get_thread_store
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+async def run_llamastack(query: str) -> dict:
+    # LlamaAgent returns the bare content, wrap it like the other backends' responses.
+    return {"type": "text", "content": await LlamaAgent().run(query), "role": "assistant"}
+
+
+def get_boot_id() -> str:
+    """
+    Returns an id of the current boot of the machine, or "" where the platform has none.
+    """
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as boot_id:
+            return boot_id.read().strip()
+    except OSError:
+        return ""
+
+
+def process_alive(pid: int) -> bool:
+    """
+    Returns True if a process with this id is running on the machine.
+    """
+    if os.name == "nt":
+        # os.kill would terminate the process on Windows.
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        exit_code = ctypes.c_ulong()
+        try:
+            kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+            return exit_code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# The agents a run can be dispatched to, by assistant id. Each takes the query and returns a dict with
+# at least the "content" of the answer.
+BACKENDS = {
+    "autogen": autogen_agent,
+    "llama_index": llama_index_agent,
+    "llamastack": run_llamastack,
+}
+
+
+def get_query(run_input) -> str:
+    """
+    Returns the query of a run input: the content of the last of `messages`, or `query`, as the
+    stateless runs accept them.
+    """
+    if isinstance(run_input, list):
+        run_input = run_input[0] if run_input else {}
+    run_input = run_input or {}
+    messages = run_input.get("messages")
+    if isinstance(messages, list) and messages and isinstance(messages[-1], dict) and "content" in messages[-1]:
+        return messages[-1]["content"]
+    if "query" in run_input:
+        return run_input["query"]
+    raise HTTPException(status_code=422, detail="The run input needs `messages` with a `content` or a `query`.")
+
+
+class RunExecutor:
+    """
+    Executes the background runs of threads on the event loop, with a bounded number of workers.
+
+    A run is stored as pending and queued, the request returns at once, and one of `workers` worker
+    tasks later marks it running, calls the agent of its assistant and stores its output (or error),
+    so at most `workers` agent calls run at the same time whatever the number of requests. The runs
+    of a thread execute one after the other, in order: the queue holds threads that have runs ready,
+    and a worker takes one run of a thread at a time, so a busy thread never holds up the others.
+    The answer is appended to the `messages` of the thread, through a new checkpoint.
+
+    Runs are executed by the process that accepted them. Cancelling a run interrupts it whether it is
+    queued or running, and runs still queued or running when the executor stops are interrupted. Each
+    run is stored with the executor as owner, identified by the boot of the machine, the process id and
+    an id of the executor, and on start an executor interrupts the runs left pending or running by
+    owners that are gone: an earlier executor of its own process, a process that is no longer running
+    or a previous boot. The runs of the other live worker processes are left alone.
+
+    Attributes:
+        store (RunStore): Where runs are persisted.
+        workers (int): Maximum number of runs executing at the same time.
+        max_queued (int): Maximum number of runs waiting for a worker.
+    """
+
+    def __init__(self, store: RunStore, workers: int = 4, max_queued: int = 1000):
+        self.store = store
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self._ready = None
+        self._worker_tasks = []
+        self._thread_runs = {}
+        self._queued = 0
+        self._running = {}
+        self._done = {}
+        self._scheduled = {}
+        self._statuses = {}
+        self._boot_id = get_boot_id()
+        self.owner = f"{self._boot_id}:{os.getpid()}:{uuid4()}"
+
+    def start(self):
+        """
+        Starts the workers, on the running event loop, after interrupting the runs of owners that are gone.
+        """
+        gone = [owner for owner in self.store.owners() if self._owner_gone(owner)]
+        if gone:
+            count = self.store.interrupt_owners(gone)
+            logging.info(f"Interrupted {count} runs left behind by stopped processes")
+        self._ready = asyncio.Queue()
+        self._worker_tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    def _owner_gone(self, owner: str) -> bool:
+        # Runs stored without an owner predate owners, no live executor runs them.
+        if owner is None:
+            return True
+        boot_id, _, rest = owner.partition(":")
+        pid, _, _ = rest.partition(":")
+        if boot_id != self._boot_id or not pid.isdigit():
+            return True
+        if int(pid) == os.getpid():
+            return owner != self.owner
+        return not process_alive(int(pid))
+
+    async def stop(self):
+        """
+        Stops the workers, and interrupts the runs still queued or running.
+        """
+        # The runs not ended yet, taken first as the cancelled workers let go of theirs.
+        run_ids = list(self._done)
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        for handle in self._scheduled.values():
+            handle.cancel()
+        for run_id in run_ids:
+            await asyncio.to_thread(self.store.transition, run_id, ("pending", "running"), "interrupted")
+        self._done.clear()
+
+    async def submit(self, thread_id: str, body: RunCreateStateful) -> Run:
+        """
+        Stores a new run of a thread and queues it, applying the multitask strategy of the request to the
+        runs of the thread that are still pending or running.
+
+        Raises:
+            HTTPException: 409 if the thread has active runs and the strategy is "reject", 422 for an
+            unknown assistant, 503 if too many runs are queued.
+        """
+        if body.assistant_id is None or str(body.assistant_id) not in BACKENDS:
+            raise HTTPException(status_code=422, detail=f"Unknown assistant {body.assistant_id}, "
+                                                        f"expected one of {', '.join(BACKENDS)}.")
+        get_query(body.input)
+        strategy = body.multitask_strategy or MultitaskStrategy.reject
+        strategy = MultitaskStrategy(strategy)
+        active = await asyncio.to_thread(self.store.active, thread_id)
+        if active and strategy == MultitaskStrategy.reject:
+            raise HTTPException(status_code=409, detail=f"Thread {thread_id} already has a run in progress.")
+        if active and strategy in (MultitaskStrategy.interrupt, MultitaskStrategy.rollback):
+            for run_id in active:
+                await self.cancel(thread_id, run_id, rollback=strategy == MultitaskStrategy.rollback)
+        if self._queued >= self.max_queued:
+            raise HTTPException(status_code=503, detail="Too many runs are queued.")
+
+        now = datetime.now(pytz.UTC)
+        run = Run(
+            run_id=uuid4(),
+            thread_id=thread_id,
+            assistant_id=str(body.assistant_id),
+            created_at=now,
+            updated_at=now,
+            status=Status.pending,
+            metadata=body.metadata or {},
+            kwargs={"input": body.input, "config": body.config.model_dump() if body.config else None},
+            multitask_strategy=strategy,
+        )
+        await asyncio.to_thread(self.store.put, run, self.owner)
+        run_id = str(run.run_id)
+        self._done[run_id] = asyncio.Event()
+        self._queued += 1
+        if body.after_seconds:
+            self._scheduled[run_id] = asyncio.get_running_loop().call_later(
+                body.after_seconds, self._enqueue, thread_id, run_id, run
+            )
+        else:
+            self._enqueue(thread_id, run_id, run)
+        return run
+
+    def _enqueue(self, thread_id: str, run_id: str, run: Run):
+        self._scheduled.pop(run_id, None)
+        runs = self._thread_runs.get(thread_id)
+        if runs is None:
+            # The thread has no run queued or running, it becomes ready.
+            self._thread_runs[thread_id] = deque([(run_id, run)])
+            self._ready.put_nowait(thread_id)
+        else:
+            runs.append((run_id, run))
+
+    async def _work(self):
+        while True:
+            thread_id = await self._ready.get()
+            runs = self._thread_runs[thread_id]
+            run_id, run = runs.popleft()
+            self._queued -= 1
+            try:
+                await self._execute(thread_id, run_id, run)
+            finally:
+                if runs:
+                    # Back at the end of the queue, the threads with runs take turns.
+                    self._ready.put_nowait(thread_id)
+                else:
+                    del self._thread_runs[thread_id]
+
+    async def _execute(self, thread_id: str, run_id: str, run: Run):
+        done = self._done.get(run_id)
+        try:
+            # A run cancelled or deleted while queued is skipped.
+            if not await asyncio.to_thread(self.store.transition, run_id, ("pending",), "running"):
+                return
+            task = asyncio.create_task(self._call(thread_id, run), name=thread_id)
+            self._running[run_id] = task
+            try:
+                # A cancelled worker cancels its run, a cancelled run lets the worker go on.
+                await asyncio.wait({task})
+            except asyncio.CancelledError:
+                task.cancel()
+                raise
+            finally:
+                del self._running[run_id]
+            if task.cancelled():
+                status, output, error = "interrupted", None, None
+            elif task.exception() is not None:
+                exception = task.exception()
+                status, output, error = "error", None, getattr(exception, "detail", None) or str(exception)
+                logging.error(f"Run {run_id} of thread {thread_id} failed: {error}")
+            else:
+                status, output, error = "success", task.result(), None
+            await asyncio.to_thread(self.store.transition, run_id, ("running",), status, output, error)
+            self._statuses[status] = self._statuses.get(status, 0) + 1
+        finally:
+            self._done.pop(run_id, None)
+            if done is not None:
+                done.set()
+
+    async def _call(self, thread_id: str, run: Run) -> dict:
+        # Runs the agent of the assistant, and adds the exchange to the thread as a new checkpoint.
+        query = get_query(run.kwargs.get("input"))
+        response = await BACKENDS[str(run.assistant_id)](query)
+        thread_store = get_thread_store()
+        state = await asyncio.to_thread(thread_store.get_state, thread_id)
+        values = state.values if state is not None and isinstance(state.values, dict) else {}
+        messages = list(values.get("messages") or [])
+        messages.append({"type": "human", "content": query})
+        messages.append({"type": "ai", "content": response["content"], "response_metadata": {
+            key: value for key, value in response.items() if key != "content"
+        }})
+        await asyncio.to_thread(thread_store.update_state, thread_id, {"messages": messages})
+        return {**values, "messages": messages}
+
+    async def cancel(self, thread_id: str, run_id: str, rollback: bool = False) -> bool:
+        """
+        Interrupts a run, queued or running. With `rollback` the run is deleted as well.
+
+        Returns:
+            bool: True if the run exists.
+        """
+        found = await asyncio.to_thread(self.store.get, thread_id, run_id)
+        if found is None:
+            return False
+        # A queued run is skipped by the worker that dequeues it, its waiters are released at once.
+        if await asyncio.to_thread(self.store.transition, run_id, ("pending",), "interrupted"):
+            done = self._done.pop(run_id, None)
+            if done is not None:
+                done.set()
+        handle = self._scheduled.pop(run_id, None)
+        if handle is not None:
+            handle.cancel()
+            self._queued -= 1
+        task = self._running.get(run_id)
+        if task is not None:
+            task.cancel()
+            await asyncio.wait({task})
+        if rollback:
+            await asyncio.to_thread(self.store.delete, thread_id, run_id)
+        return True
+
+    async def join(self, thread_id: str, run_id: str, poll_interval: float = 0.5):
+        """
+        Waits until a run ended.
+
+        Returns:
+            tuple: The Run, its output and its error, or None if the run does not exist.
+        """
+        while True:
+            found = await asyncio.to_thread(self.store.get, thread_id, run_id)
+            if found is None or found[0].status.value in FINAL_STATUSES:
+                return found
+            done = self._done.get(run_id)
+            if done is not None:
+                await done.wait()
+            else:
+                # Executed by another worker process.
+                await asyncio.sleep(poll_interval)
+
+    def forget_threads(self, thread_ids: list):
+        """
+        Cancels the running runs of threads and deletes all their runs, for threads that were collected.
+        """
+        thread_ids = set(thread_ids)
+        for run_id, task in list(self._running.items()):
+            if task.get_name() in thread_ids:
+                task.cancel()
+        self.store.delete_threads(list(thread_ids))
+
+    def stats(self):
+        """
+        Returns the size of the pool and queue, and the number of runs ended by status.
+        """
+        return {
+            "workers": self.workers,
+            "max_queued": self.max_queued,
+            "queued": self._queued,
+            "running": len(self._running),
+            "ready_threads": self._ready.qsize() if self._ready is not None else 0,
+            "ended": dict(self._statuses),
+        }
+
+
+_run_executor = None
+
+
+def get_run_executor():
+    """
+    Returns the process-wide RunExecutor, configured from RUN_WORKERS and RUN_MAX_QUEUED.
+    """
+    global _run_executor
+    if _run_executor is None:
+        _run_executor = RunExecutor(
+            get_run_store(),
+            workers=int(os.getenv("RUN_WORKERS", "4")),
+            max_queued=int(os.getenv("RUN_MAX_QUEUED", "1000")),
+        )
+    return _run_executor
+
+
+async def close_run_executor():
+    """
+    Stops the process-wide RunExecutor, if started. The next `get_run_executor` call creates a new one.
+    """
+    global _run_executor
+    if _run_executor is not None:
+        await _run_executor.stop()
+        _run_executor = None
@@ -0,0 +1,433 @@
+import hashlib
+import json
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    parent_seq INTEGER,
+    depth INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    data TEXT NOT NULL,
+    blobs TEXT,
+    PRIMARY KEY (thread_id, seq)
+);
+CREATE UNIQUE INDEX IF NOT EXISTS checkpoints_id ON checkpoints (thread_id, checkpoint_id);
+CREATE TABLE IF NOT EXISTS thread_bases (
+    thread_id TEXT PRIMARY KEY,
+    base_thread_id TEXT NOT NULL,
+    base_seq INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS thread_bases_base ON thread_bases (base_thread_id);
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    refs INTEGER NOT NULL
+);
+"""
+
+# `checkpoints.blobs` lists the distinct blobs a checkpoint references, and the triggers keep the reference
+# counts: a blob is deleted with the last checkpoint referencing it, whichever statement deletes it.
+BLOB_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS checkpoints_blobs_insert AFTER INSERT ON checkpoints WHEN NEW.blobs IS NOT NULL
+BEGIN
+    UPDATE blobs SET refs = refs + 1 WHERE hash IN (SELECT value FROM json_each(NEW.blobs));
+END;
+CREATE TRIGGER IF NOT EXISTS checkpoints_blobs_delete AFTER DELETE ON checkpoints WHEN OLD.blobs IS NOT NULL
+BEGIN
+    UPDATE blobs SET refs = refs - 1 WHERE hash IN (SELECT value FROM json_each(OLD.blobs));
+    DELETE FROM blobs WHERE refs <= 0 AND hash IN (SELECT value FROM json_each(OLD.blobs));
+END;
+"""
+
+# Upper bound of the seqs of the last segment of a thread.
+MAX_SEQ = 2 ** 62
+
+# The checkpoints a thread sees: its own, and those of the threads it was copied from up to the copy
+# points. `:segments` is the JSON list of the (thread_id, lo, hi] seq ranges, see `CheckpointLog.segments`.
+VISIBLE_CTE = """
+segments (thread_id, lo, hi) AS (
+    SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]'), json_extract(value, '$[2]')
+    FROM json_each(:segments)
+), visible AS NOT MATERIALIZED (
+    SELECT c.* FROM segments s JOIN checkpoints c ON c.thread_id = s.thread_id AND c.seq > s.lo AND c.seq <= s.hi
+)"""
+
+# The visible checkpoints matching the seed query, and all their ancestors up to a full snapshot.
+CHAIN_SQL = "WITH RECURSIVE" + VISIBLE_CTE + """, chain (seq) AS (
+    SELECT seq FROM ({seed})
+    UNION
+    SELECT v.parent_seq FROM visible v JOIN chain ON v.seq = chain.seq WHERE v.kind = 'delta'
+)
+SELECT seq, checkpoint_id, parent_seq, depth, kind, data, blobs FROM visible WHERE seq IN (SELECT seq FROM chain)
+ORDER BY seq
+"""
+
+# Drops the checkpoints of a thread older than the retention window, except the ancestors of the ones
+# kept and of the copy points of the threads copied from it.
+PRUNE_SQL = """
+WITH RECURSIVE bound (cutoff) AS (
+    SELECT MAX(seq) - :retention FROM checkpoints WHERE thread_id = :thread_id
+), keep (seq) AS (
+    SELECT seq FROM checkpoints WHERE thread_id = :thread_id AND seq > (SELECT cutoff FROM bound)
+    UNION
+    SELECT base_seq FROM thread_bases WHERE base_thread_id = :thread_id
+    UNION
+    SELECT c.parent_seq FROM checkpoints c JOIN keep ON c.thread_id = :thread_id AND c.seq = keep.seq
+    WHERE c.kind = 'delta'
+)
+DELETE FROM checkpoints
+WHERE thread_id = :thread_id AND seq <= (SELECT cutoff FROM bound) AND seq NOT IN (SELECT seq FROM keep)
+"""
+
+# Deletes up to :limit checkpoints of a deleted thread, except the copy points of the threads copied from
+# it and their chains.
+RECLAIM_SQL = """
+WITH RECURSIVE keep (seq) AS (
+    SELECT base_seq FROM thread_bases WHERE base_thread_id = :thread_id
+    UNION
+    SELECT c.parent_seq FROM checkpoints c JOIN keep ON c.thread_id = :thread_id AND c.seq = keep.seq
+    WHERE c.kind = 'delta'
+)
+DELETE FROM checkpoints WHERE thread_id = :thread_id AND seq IN (
+    SELECT seq FROM checkpoints WHERE thread_id = :thread_id AND seq NOT IN (SELECT seq FROM keep) LIMIT :limit
+)
+"""
+
+
+def create_tables(connection):
+    """
+    Creates the checkpoint tables, and adds the blob references to a checkpoints table that predates them.
+    """
+    connection.executescript(SCHEMA)
+    if "blobs" not in [row[1] for row in connection.execute("PRAGMA table_info(checkpoints)")]:
+        connection.execute("ALTER TABLE checkpoints ADD COLUMN blobs TEXT")
+    connection.executescript(BLOB_TRIGGERS)
+
+
+def externalize(value, min_size: int, blobs: dict):
+    """
+    Returns a JSON value with its strings of `min_size` characters or more replaced by `{"$blob": hash}`
+    references, the SHA-256 of their text, and adds the texts to `blobs` by hash. A dict that would
+    read as a reference is wrapped as `{"$literal": dict}`.
+    """
+    if isinstance(value, str):
+        if len(value) < min_size:
+            return value
+        digest = hashlib.sha256(value.encode("utf-8")).hexdigest()
+        blobs[digest] = value
+        return {"$blob": digest}
+    if isinstance(value, list):
+        return [externalize(item, min_size, blobs) for item in value]
+    if isinstance(value, dict):
+        mapped = {key: externalize(item, min_size, blobs) for key, item in value.items()}
+        if len(value) == 1 and ("$blob" in value or "$literal" in value):
+            return {"$literal": mapped}
+        return mapped
+    return value
+
+
+def internalize(value, blobs: dict):
+    """
+    Reverses `externalize`, with the texts of the referenced blobs by hash.
+    """
+    if isinstance(value, list):
+        return [internalize(item, blobs) for item in value]
+    if isinstance(value, dict):
+        if len(value) == 1:
+            if "$blob" in value:
+                return blobs[value["$blob"]]
+            if "$literal" in value:
+                return {key: internalize(item, blobs) for key, item in value["$literal"].items()}
+        return {key: internalize(item, blobs) for key, item in value.items()}
+    return value
+
+
+def encode_delta(parent_values, values) -> dict:
+    """
+    Encodes the top-level changes from the values of a parent state to the values of its child.
+
+    A list that only grew is stored as the appended elements, so a conversation adding one message
+    per checkpoint stores one message per checkpoint. Other changed keys are stored whole, removed
+    keys as unset.
+    """
+    if not isinstance(parent_values, dict) or not isinstance(values, dict):
+        return {"replace": values}
+    changes = {}
+    for key, value in values.items():
+        if key not in parent_values:
+            changes[key] = {"set": value}
+            continue
+        previous = parent_values[key]
+        if value == previous:
+            continue
+        if isinstance(value, list) and isinstance(previous, list) and len(value) > len(previous) \
+                and value[:len(previous)] == previous:
+            changes[key] = {"append": value[len(previous):]}
+        else:
+            changes[key] = {"set": value}
+    for key in parent_values:
+        if key not in values:
+            changes[key] = {"unset": True}
+    return {"changes": changes}
+
+
+def apply_delta(parent_values, delta: dict):
+    """
+    Rebuilds the values of a state from the values of its parent and an `encode_delta` delta.
+    """
+    if "replace" in delta:
+        return delta["replace"]
+    values = dict(parent_values)
+    for key, change in delta["changes"].items():
+        if "append" in change:
+            values[key] = values[key] + change["append"]
+        elif "set" in change:
+            values[key] = change["set"]
+        else:
+            values.pop(key, None)
+    return values
+
+
+class CheckpointLog:
+    """
+    The checkpoints of the threads, stored in the `checkpoints` table of the thread store database.
+
+    Every state of a thread is a checkpoint, numbered per thread by `seq`. A checkpoint is stored as a
+    delta of its values against its parent checkpoint, plus its (small) other fields; every
+    `snapshot_interval` checkpoints along a parent chain a full snapshot is stored instead, so
+    rebuilding any checkpoint replays at most `snapshot_interval` deltas. The chain is walked by a
+    recursive CTE, in a single query.
+
+    A copied thread shares the checkpoints of the thread it was copied from: `thread_bases` records the
+    copy point, and the queries on a thread see its own checkpoints plus those of its bases up to the
+    copy points. Copying a thread is O(1) whatever its length, and only the checkpoints added after
+    the copy are stored for it.
+
+    Long strings, typically message contents, are stored once in the `blobs` table, keyed by the hash
+    of their text, and checkpoints reference them: a story repeated in every snapshot and every
+    `set` of a thread, or in the threads forked from it, takes its space once. Blobs are reference
+    counted per checkpoint and deleted with the last checkpoint that references them.
+
+    The log only builds statements and decodes rows: the ThreadStore runs the statements in its
+    write transactions and the queries on its connections.
+
+    Attributes:
+        snapshot_interval (int): Maximum number of deltas between a checkpoint and its full snapshot.
+        retention (int): Number of checkpoints kept per thread, with the ancestors they need.
+        blob_min_size (int): Length from which strings are stored as blobs, 0 never uses blobs.
+    """
+
+    def __init__(self, snapshot_interval: int = 20, retention: int = 1000, blob_min_size: int = 256):
+        self.snapshot_interval = max(1, snapshot_interval)
+        self.retention = max(1, retention)
+        self.blob_min_size = blob_min_size
+
+    def insert_statements(self, thread_id: str, state: dict, parent, full: bool = False) -> list:
+        """
+        Returns the statements storing a new checkpoint.
+
+        Args:
+            thread_id (str): The thread of the checkpoint.
+            state (dict): The ThreadState of the checkpoint, as a dict.
+            parent (tuple, optional): The (seq, depth, state dict) of the parent checkpoint, None for a first one.
+            full (bool, optional): Store a full snapshot whatever the depth of the parent.
+
+        Returns:
+            list: (sql, params) statements.
+        """
+        checkpoint_id = state["checkpoint"]["checkpoint_id"]
+        if full or parent is None or parent[1] + 1 >= self.snapshot_interval:
+            parent_seq = parent[0] if parent is not None else None
+            depth, kind, data = 0, "full", state
+        else:
+            parent_seq, parent_depth, parent_state = parent
+            fields = {name: value for name, value in state.items() if name != "values"}
+            depth, kind = parent_depth + 1, "delta"
+            data = {"state": fields, "values": encode_delta(parent_state["values"], state["values"])}
+        blobs = {}
+        if self.blob_min_size > 0:
+            data = externalize(data, self.blob_min_size, blobs)
+        statements = []
+        if blobs:
+            # New blobs start unreferenced, the insert trigger of the checkpoint counts its references.
+            statements.append(("INSERT OR IGNORE INTO blobs SELECT key, value, 0 FROM json_each(?)", (json.dumps(blobs),)))
+        # The seqs of a copy continue after its copy point, so they never shadow the seqs it shares.
+        statements.append((
+            "INSERT INTO checkpoints VALUES (?, (SELECT COALESCE(MAX(seq), "
+            "(SELECT base_seq FROM thread_bases WHERE thread_id = ?), 0) + 1 FROM checkpoints WHERE thread_id = ?), "
+            "?, ?, ?, ?, ?, ?)",
+            (thread_id, thread_id, thread_id, checkpoint_id, parent_seq, depth, kind, json.dumps(data),
+             json.dumps(sorted(blobs)) if blobs else None),
+        ))
+        if kind == "full":
+            # Pruning walks the retained chains, do it once per snapshot rather than on every checkpoint.
+            statements.append((PRUNE_SQL, {"thread_id": thread_id, "retention": self.retention}))
+        return statements
+
+    @staticmethod
+    def base(connection, thread_id: str):
+        """
+        Returns the (base_thread_id, base_seq) a thread was copied from, or None if it is not a copy.
+        """
+        return connection.execute(
+            "SELECT base_thread_id, base_seq FROM thread_bases WHERE thread_id = ?", (thread_id,)
+        ).fetchone()
+
+    def copy_statements(self, connection, thread_id: str, base_thread_id: str, base_seq: int) -> list:
+        """
+        Returns the statements making a thread a copy of another one at one of its checkpoints.
+
+        Nothing is copied: the copy sees the checkpoints of its base up to `base_seq`, and stores only
+        the checkpoints added to it afterwards. The copy point is recorded against the thread that owns
+        it, so pruning that thread keeps the copy point and its chain.
+
+        Returns:
+            list: (sql, params) statements.
+        """
+        base = self.base(connection, base_thread_id)
+        while base is not None and base_seq <= base[1]:
+            base_thread_id = base[0]
+            base = self.base(connection, base_thread_id)
+        return [("INSERT INTO thread_bases VALUES (?, ?, ?)", (thread_id, base_thread_id, base_seq))]
+
+    @staticmethod
+    def reclaim(connection, thread_id: str, limit: int):
+        """
+        Deletes up to `limit` checkpoints of a deleted thread, in the caller's transaction. The checkpoints
+        its copies still reference are kept; once it has no copies left, the thread is released
+        entirely, and its own base, if any, may now be reclaimed further.
+
+        Returns:
+            tuple: The number of checkpoints deleted, and whether the thread is fully released: False
+            if checkpoints are left, `limit` was reached or copies still reference it.
+        """
+        connection.execute(RECLAIM_SQL, {"thread_id": thread_id, "limit": limit})
+        # sqlite3 reports no rowcount for statements starting with WITH.
+        deleted = connection.execute("SELECT changes()").fetchone()[0]
+        if deleted >= limit or connection.execute(
+            "SELECT 1 FROM thread_bases WHERE base_thread_id = ? LIMIT 1", (thread_id,)
+        ).fetchone():
+            return deleted, False
+        connection.execute("DELETE FROM thread_bases WHERE thread_id = ?", (thread_id,))
+        return deleted, True
+
+    @staticmethod
+    def segments(connection, thread_id: str) -> str:
+        """
+        Returns the `:segments` parameter of the queries on the checkpoints of a thread: the thread's own
+        seqs, then for every thread it was copied from, transitively, its seqs up to the copy point.
+        """
+        segments = []
+        hi = MAX_SEQ
+        while thread_id is not None:
+            row = CheckpointLog.base(connection, thread_id)
+            lo = row[1] if row else 0
+            segments.append((thread_id, lo, hi))
+            thread_id, hi = (row[0], row[1]) if row else (None, 0)
+        return json.dumps(segments)
+
+    def parent(self, connection, thread_id: str, checkpoint_id: str):
+        """
+        Returns the (seq, depth) of a checkpoint, or None if it does not exist.
+        """
+        sql = "WITH" + VISIBLE_CTE + " SELECT seq, depth FROM visible WHERE checkpoint_id = :checkpoint_id"
+        return connection.execute(
+            sql, {"segments": self.segments(connection, thread_id), "checkpoint_id": checkpoint_id}
+        ).fetchone()
+
+    @staticmethod
+    def _read_chain(connection, seed: str, params: dict) -> tuple:
+        # Runs a chain query and reads the blobs its rows reference, within the caller's transaction.
+        rows = connection.execute(CHAIN_SQL.format(seed=seed), params).fetchall()
+        hashes = set()
+        for row in rows:
+            if row[6] is not None:
+                hashes.update(json.loads(row[6]))
+        blobs = {}
+        if hashes:
+            blobs = dict(connection.execute(
+                "SELECT hash, data FROM blobs WHERE hash IN (SELECT value FROM json_each(?))",
+                (json.dumps(sorted(hashes)),),
+            ))
+        return rows, blobs
+
+    @staticmethod
+    def _rebuild(rows, blobs: dict) -> dict:
+        # Replays the rows of a chain query, parents come first as seq grows along a chain.
+        states = {}
+        for seq, _, parent_seq, _, kind, data, row_blobs in rows:
+            data = json.loads(data)
+            if row_blobs is not None:
+                data = internalize(data, blobs)
+            if kind == "full":
+                states[seq] = data
+            else:
+                parent_state = states[parent_seq]
+                states[seq] = {**data["state"], "values": apply_delta(parent_state["values"], data["values"])}
+        return states
+
+    @staticmethod
+    def owned(state: dict, thread_id: str) -> dict:
+        """
+        Returns a checkpoint state dict as seen from a thread that shares it.
+        """
+        if state["checkpoint"].get("thread_id") == thread_id:
+            return state
+        state = {**state, "checkpoint": {**state["checkpoint"], "thread_id": thread_id}}
+        if state.get("parent_checkpoint"):
+            state["parent_checkpoint"] = {**state["parent_checkpoint"], "thread_id": thread_id}
+        return state
+
+    def get(self, connection, thread_id: str, checkpoint_id: str):
+        """
+        Rebuilds a checkpoint.
+
+        Returns:
+            tuple: The (seq, depth, state dict) of the checkpoint, or None if it does not exist.
+        """
+        seed = "SELECT seq FROM visible WHERE checkpoint_id = :checkpoint_id"
+        # Read the chain and its blobs from the same snapshot.
+        connection.execute("BEGIN")
+        try:
+            rows, blobs = self._read_chain(connection, seed, {
+                "segments": self.segments(connection, thread_id), "checkpoint_id": checkpoint_id,
+            })
+        finally:
+            connection.execute("COMMIT")
+        states = self._rebuild(rows, blobs)
+        for seq, row_checkpoint_id, _, depth, _, _, _ in rows:
+            if row_checkpoint_id == checkpoint_id:
+                return seq, depth, self.owned(states[seq], thread_id)
+        return None
+
+    def history(self, connection, thread_id: str, limit: int = 10, before: str = None) -> list:
+        """
+        Rebuilds a page of the checkpoints of a thread, newest first.
+
+        Pages are keyed by checkpoint id rather than offset: `before` is the id of the last checkpoint
+        of the previous page, and only the page and the chains it needs are read.
+
+        Returns:
+            list: The state dicts, empty if `before` does not exist.
+        """
+        page_sql = "WITH" + VISIBLE_CTE + " SELECT seq FROM visible"
+        if before is not None:
+            page_sql += " WHERE seq < (SELECT seq FROM visible WHERE checkpoint_id = :before)"
+        page_sql += " ORDER BY seq DESC LIMIT :limit"
+        # Read the segments, the page, its chains and their blobs from the same snapshot.
+        connection.execute("BEGIN")
+        try:
+            segments = self.segments(connection, thread_id)
+            page = [seq for seq, in connection.execute(
+                page_sql, {"segments": segments, "before": before, "limit": limit}
+            )]
+            if not page:
+                return []
+            seed = "SELECT value AS seq FROM json_each(:page)"
+            rows, blobs = self._read_chain(connection, seed, {"segments": segments, "page": json.dumps(page)})
+        finally:
+            connection.execute("COMMIT")
+        states = self._rebuild(rows, blobs)
+        return [self.owned(states[seq], thread_id) for seq in page]
@@ -0,0 +1,72 @@
+import importlib
+import logging
+import os
+import re
+import zlib
+
+import numpy as np
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class HashingEmbedding:
+    """
+    A local embedding function that needs no model: the words and word pairs of a text are hashed
+    into a fixed number of buckets, with a hashed sign, and the vector is L2-normalized.
+
+    Texts sharing vocabulary end up close in cosine similarity. It is fast and deterministic across
+    processes, but knows nothing about synonyms; plug in a real model with STORE_EMBEDDING_FUNCTION
+    when that matters.
+
+    Attributes:
+        dim (int): The dimension of the vectors.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def __call__(self, texts: list) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = TOKEN_PATTERN.findall(text.lower())
+            tokens = words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+            if not tokens:
+                continue
+            hashes = np.fromiter((zlib.crc32(token.encode("utf-8")) for token in tokens), dtype=np.uint32,
+                                 count=len(tokens))
+            signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+            np.add.at(vectors[row], hashes % self.dim, signs)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+
+def item_text(value) -> str:
+    """
+    Returns the text of an item value that gets embedded: its string and number leaves, in order.
+    """
+    if isinstance(value, dict):
+        return " ".join(item_text(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return " ".join(item_text(v) for v in value)
+    if value is None or isinstance(value, bool):
+        return ""
+    return str(value)
+
+
+def get_embedding_function():
+    """
+    Returns the embedding function of the store. STORE_EMBEDDING_FUNCTION can name a callable as
+    `module:attribute`, which takes a list of texts and returns one vector per text; otherwise a
+    HashingEmbedding of STORE_EMBEDDING_DIM dimensions is used.
+    """
+    name = os.getenv("STORE_EMBEDDING_FUNCTION")
+    if name:
+        module_name, _, attribute = name.partition(":")
+        function = getattr(importlib.import_module(module_name), attribute)
+        logging.info(f"Store items are embedded with {name}.")
+        return function
+    return HashingEmbedding(dim=int(os.getenv("STORE_EMBEDDING_DIM", "256")))
@@ -0,0 +1,616 @@
+import asyncio
+import heapq
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+import pytz
+
+from models import Item, SearchItem
+from storage_util.embeddings import get_embedding_function, item_text
+from storage_util.namespace_trie import NamespaceTrie
+from storage_util.vector_index import VectorIndex
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    expires_at REAL,
+    vector BLOB,
+    PRIMARY KEY (namespace, key)
+);
+CREATE TABLE IF NOT EXISTS item_changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL
+);
+"""
+
+ROW_COLUMNS = "namespace, key, value, created_at, updated_at, expires_at, vector"
+
+
+class ItemStore:
+    """
+    Durable key-value storage for the /store API, backed by SQLite in WAL mode.
+
+    All items are resident in a NamespaceTrie, loaded at startup, so reads, prefix searches and
+    namespace listings never touch the disk and only walk the part of the trie that can match. Writes
+    are committed to SQLite before the trie is updated, an acknowledged write is on disk.
+
+    Every item is also embedded into a VectorIndex, kept up to date on each write, so a search with a
+    query ranks items by similarity. The vector is stored next to the value, so loading the store and
+    replaying the writes of other workers never call the embedding function; rows without a vector of
+    the current dimension, written before vectors were stored or by another embedding function, are
+    embedded once on load and their vector saved. Namespace prefixes holding fewer than `ivf_threshold` items are
+    searched exactly, larger ones through the inverted file of the index.
+
+    Items can expire: a put may carry a TTL, and otherwise inherits the TTL configured for the
+    longest matching namespace prefix. Expired items are hidden from reads right away and deleted by
+    `sweep`, which `run_sweeper` calls periodically off the event loop. The resident size of the items
+    (value and vector) is accounted for, and once it exceeds `memory_budget` the least recently read
+    or written items are evicted, that is deleted, so the store behaves like an LRU cache of bounded size.
+
+    The database can be shared by several worker processes, like the ThreadStore: every write also
+    appends its namespace and key to an `item_changes` log, and before serving a request a store
+    replays the entries committed by other connections since SQLite's `data_version` last moved.
+    Expirations and evictions are deletes like any other, so all workers drop the item.
+
+    Attributes:
+        path (str): The SQLite database file.
+        change_log_size (int): Number of `item_changes` entries kept, a store that falls further behind reloads.
+        ivf_threshold (int): Number of items from which vector searches are approximate.
+        namespace_ttls (dict): Seconds to live of the items put without a TTL, by namespace prefix tuple.
+        memory_budget (int): Resident bytes above which cold items are evicted, 0 for no limit.
+    """
+
+    def __init__(self, path: str = "store_db.sqlite3", change_log_size: int = 10000, embedding_function=None,
+                 ivf_threshold: int = 20000, namespace_ttls: dict = None, memory_budget: int = 0):
+        self.path = path
+        self.change_log_size = max(1, change_log_size)
+        self.ivf_threshold = ivf_threshold
+        self.namespace_ttls = {tuple(prefix): ttl for prefix, ttl in (namespace_ttls or {}).items()}
+        self.memory_budget = memory_budget
+        self._embed = embedding_function or get_embedding_function()
+        self._trie = NamespaceTrie()
+        self._vectors = VectorIndex(ivf_threshold=ivf_threshold)
+        # Resident size of every item, least recently used first.
+        self._lru = OrderedDict()
+        self._memory = 0
+        # Expiry time of the items with a TTL, and a heap of (expires_at, id) with stale entries skipped.
+        self._expires = {}
+        self._expiry_heap = []
+        self._last_seq = 0
+        self._data_version = None
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._synced_changes = 0
+        self._reloads = 0
+        self._expired = 0
+        self._evicted = 0
+
+        self._connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._connection.execute("PRAGMA synchronous=FULL")
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(SCHEMA)
+        columns = [row[1] for row in self._connection.execute("PRAGMA table_info(items)")]
+        if "expires_at" not in columns:
+            self._connection.execute("ALTER TABLE items ADD COLUMN expires_at REAL")
+        if "vector" not in columns:
+            self._connection.execute("ALTER TABLE items ADD COLUMN vector BLOB")
+        # Stored vectors of another size were made by another embedding function.
+        self._dim = len(self._embed([""])[0])
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS items_expires_at ON items (expires_at) WHERE expires_at IS NOT NULL"
+        )
+        with self._lock:
+            self._load()
+        logging.info(f"Item store {self.path} opened with {len(self._trie)} item(s).")
+
+    @staticmethod
+    def _encode_namespace(namespace) -> str:
+        return json.dumps(list(namespace))
+
+    def _decode_row(self, namespace: str, key: str, value: str, created_at: str, updated_at: str,
+                    expires_at: float, vector: bytes):
+        # Returns the item, the size of its value, its expiry time and its stored vector, None if it has none.
+        item = Item(namespace=json.loads(namespace), key=key, value=json.loads(value),
+                    created_at=datetime.fromisoformat(created_at), updated_at=datetime.fromisoformat(updated_at))
+        if vector is not None and len(vector) == self._dim * 4:
+            vector = np.frombuffer(vector, dtype=np.float32)
+        else:
+            vector = None
+        return item, len(value), expires_at, vector
+
+    def _embed_items(self, items: list):
+        return self._embed([item_text(item.value) for item in items])
+
+    def _expires_at(self, namespace, ttl: float, now: float):
+        if ttl is None:
+            for depth in range(len(namespace), 0, -1):
+                ttl = self.namespace_ttls.get(tuple(namespace[:depth]))
+                if ttl is not None:
+                    break
+        return now + ttl if ttl else None
+
+    def _is_expired(self, id, now: float) -> bool:
+        expires_at = self._expires.get(id)
+        return expires_at is not None and expires_at <= now
+
+    def _track(self, id, size: int, expires_at):
+        self._memory += size - self._lru.pop(id, 0)
+        self._lru[id] = size
+        if expires_at is None:
+            self._expires.pop(id, None)
+            return
+        self._expires[id] = expires_at
+        heapq.heappush(self._expiry_heap, (expires_at, id))
+        if len(self._expiry_heap) > 2 * len(self._expires) + 1024:
+            # Mostly stale entries left by rewrites, rebuild the heap from the live expiry times.
+            self._expiry_heap = [(expires_at, id) for id, expires_at in self._expires.items()]
+            heapq.heapify(self._expiry_heap)
+
+    def _put_resident(self, item: Item, vector, size: int, expires_at):
+        id = (tuple(item.namespace), item.key)
+        self._trie.put(*id, item)
+        self._vectors.add(id, vector)
+        self._track(id, size + vector.nbytes, expires_at)
+
+    def _delete_resident(self, namespace: tuple, key: str):
+        id = (namespace, key)
+        self._trie.delete(namespace, key)
+        self._vectors.remove(id)
+        self._memory -= self._lru.pop(id, 0)
+        self._expires.pop(id, None)
+
+    def _load(self):
+        self._trie = NamespaceTrie()
+        self._vectors = VectorIndex(ivf_threshold=self.ivf_threshold)
+        self._lru, self._memory, self._expires, self._expiry_heap = OrderedDict(), 0, {}, []
+        # Items without a usable stored vector, embedded here and saved after the load.
+        embedded = []
+        # Read the items and the position in the change log from the same snapshot.
+        self._connection.execute("BEGIN")
+        try:
+            self._last_seq = self._connection.execute("SELECT COALESCE(MAX(seq), 0) FROM item_changes").fetchone()[0]
+            rows = self._connection.execute(f"SELECT {ROW_COLUMNS} FROM items")
+            while batch := [self._decode_row(*row) for row in rows.fetchmany(1000)]:
+                missing = [item for item, _, _, vector in batch if vector is None]
+                fresh = iter(self._embed_items(missing) if missing else [])
+                vectors = [next(fresh) if vector is None else vector for _, _, _, vector in batch]
+                embedded.extend((item, vector) for (item, _, _, stored), vector in zip(batch, vectors)
+                                if stored is None)
+                ids = [(tuple(item.namespace), item.key) for item, _, _, _ in batch]
+                self._vectors.add_many(ids, np.stack(vectors), train=False)
+                for id, (item, size, expires_at, _), vector in zip(ids, batch, vectors):
+                    self._trie.put(*id, item)
+                    self._track(id, size + vector.nbytes, expires_at)
+        finally:
+            self._connection.execute("COMMIT")
+        self._vectors.maybe_train()
+        if embedded:
+            # The value is unchanged, other workers need not replay these updates. An item rewritten
+            # since the snapshot already has the vector of its new value.
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.executemany(
+                    "UPDATE items SET vector = ? WHERE namespace = ? AND key = ? AND updated_at = ?",
+                    [(np.asarray(vector, dtype=np.float32).tobytes(), self._encode_namespace(item.namespace),
+                      item.key, item.updated_at.isoformat()) for item, vector in embedded],
+                )
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+            logging.info(f"Item store {self.path} embedded and saved the vectors of {len(embedded)} item(s).")
+        self._data_version = self._connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def _sync(self):
+        # Replays the writes other processes committed since the last check. Commits made on this
+        # connection do not move `data_version`, so a store never replays its own writes.
+        data_version = self._connection.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return
+        self._data_version = data_version
+        changes = self._connection.execute(
+            "SELECT seq, namespace, key FROM item_changes WHERE seq > ? ORDER BY seq", (self._last_seq,)
+        ).fetchall()
+        if not changes:
+            return
+        if changes[0][0] > self._last_seq + 1:
+            # The entries this store missed were pruned from the log, start over from the table.
+            self._load()
+            self._reloads += 1
+            return
+        for namespace, key in {(namespace, key) for _, namespace, key in changes}:
+            row = self._connection.execute(
+                f"SELECT {ROW_COLUMNS} FROM items WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            if row is None:
+                self._delete_resident(tuple(json.loads(namespace)), key)
+            else:
+                item, size, expires_at, vector = self._decode_row(*row)
+                if vector is None:
+                    # Written by a worker that does not store vectors.
+                    vector = self._embed_items([item])[0]
+                self._put_resident(item, vector, size, expires_at)
+            self._synced_changes += 1
+        self._last_seq = changes[-1][0]
+
+    def _commit(self, statements: list) -> list:
+        # Runs (sql, params, namespace, key) statements in one transaction, logging each changed row.
+        rowcounts = []
+        seqs = []
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, params, namespace, key in statements:
+                rowcount = self._connection.execute(sql, params).rowcount
+                if rowcount:
+                    seq = self._connection.execute(
+                        "INSERT INTO item_changes (namespace, key) VALUES (?, ?)", (namespace, key)
+                    ).lastrowid
+                    seqs.append(seq)
+                    if seq % 1000 == 0:
+                        self._connection.execute("DELETE FROM item_changes WHERE seq <= ?",
+                                                 (seq - self.change_log_size,))
+                rowcounts.append(rowcount)
+            self._connection.execute("COMMIT")
+        except Exception:
+            self._connection.execute("ROLLBACK")
+            raise
+        if seqs and seqs[0] == self._last_seq + 1:
+            # Nothing was missed, the own writes do not need replaying.
+            self._last_seq = seqs[-1]
+        self._writes += len(statements)
+        return rowcounts
+
+    def _put_statement(self, item: Item, value: str, expires_at, vector) -> tuple:
+        encoded = self._encode_namespace(item.namespace)
+        return (
+            f"INSERT INTO items ({ROW_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (namespace, key) DO UPDATE "
+            "SET value = excluded.value, updated_at = excluded.updated_at, expires_at = excluded.expires_at, "
+            "vector = excluded.vector",
+            (encoded, item.key, value, item.created_at.isoformat(), item.updated_at.isoformat(), expires_at,
+             np.asarray(vector, dtype=np.float32).tobytes()),
+            encoded, item.key,
+        )
+
+    def _delete_statement(self, namespace: list, key: str) -> tuple:
+        encoded = self._encode_namespace(namespace)
+        return "DELETE FROM items WHERE namespace = ? AND key = ?", (encoded, key), encoded, key
+
+    def _current(self, id, now: float):
+        # The live item of an id, None if it does not exist or has expired.
+        item = self._trie.get(*id)
+        return None if item is None or self._is_expired(id, now) else item
+
+    def put(self, namespace: list, key: str, value: dict, ttl: float = None) -> Item:
+        """
+        Stores an item, replacing its value if the key exists. The creation time of an existing
+        item is kept and its update time moved forward.
+
+        Args:
+            namespace (list): The namespace of the item.
+            key (str): The key of the item.
+            value (dict): The value of the item.
+            ttl (float, optional): Seconds to live, the TTL of the namespace by default.
+
+        Returns:
+            Item: The stored item.
+        """
+        now = datetime.now(pytz.UTC)
+        encoded_value = json.dumps(value)
+        vector = self._embed([item_text(value)])[0]
+        expires_at = self._expires_at(namespace, ttl, now.timestamp())
+        id = (tuple(namespace), key)
+        with self._lock:
+            self._sync()
+            existing = self._current(id, now.timestamp())
+            item = Item(namespace=list(namespace), key=key, value=value,
+                        created_at=existing.created_at if existing else now, updated_at=now)
+            self._commit([self._put_statement(item, encoded_value, expires_at, vector)])
+            self._put_resident(item, vector, len(encoded_value), expires_at)
+            self._enforce_budget({id})
+        return item
+
+    def get(self, namespace: list, key: str):
+        """
+        Returns an item, or None if it does not exist or has expired.
+        """
+        id = (tuple(namespace), key)
+        with self._lock:
+            self._sync()
+            item = self._current(id, time.time())
+            if item is not None:
+                self._lru.move_to_end(id)
+            return item
+
+    def delete(self, namespace: list, key: str) -> bool:
+        """
+        Removes an item.
+
+        Returns:
+            bool: True if the item existed.
+        """
+        with self._lock:
+            self._sync()
+            deleted, = self._commit([self._delete_statement(namespace, key)])
+            self._delete_resident(tuple(namespace), key)
+        return bool(deleted)
+
+    def batch(self, operations: list) -> list:
+        """
+        Runs put, get and delete operations in order, in a single transaction.
+
+        Each operation sees the effect of the ones before it, a get after a put of the same key
+        returns the new item. The values of the puts are embedded up front, in one call. If any
+        write fails, none of them is applied.
+
+        Args:
+            operations (list): (op, namespace, key, value, ttl) tuples, op being "put", "get" or "delete".
+
+        Returns:
+            list: One result per operation: the stored item for a put, the item or None for a get,
+            and whether the item existed for a delete.
+        """
+        now = datetime.now(pytz.UTC)
+        timestamp = now.timestamp()
+        puts = [value for op, _, _, value, _ in operations if op == "put"]
+        vectors = iter(self._embed([item_text(value) for value in puts]) if puts else [])
+        with self._lock:
+            self._sync()
+            # The items written by the batch so far, None for the deleted ones.
+            pending = {}
+            statements = []
+            results = []
+            for op, namespace, key, value, ttl in operations:
+                id = (tuple(namespace), key)
+                current = pending[id][0] if id in pending else self._current(id, timestamp)
+                if op == "get":
+                    if current is not None and id not in pending:
+                        self._lru.move_to_end(id)
+                    results.append(current)
+                elif op == "put":
+                    item = Item(namespace=list(namespace), key=key, value=value,
+                                created_at=current.created_at if current else now, updated_at=now)
+                    encoded_value = json.dumps(value)
+                    expires_at = self._expires_at(namespace, ttl, timestamp)
+                    vector = next(vectors)
+                    pending[id] = (item, vector, len(encoded_value), expires_at)
+                    statements.append(self._put_statement(item, encoded_value, expires_at, vector))
+                    results.append(item)
+                else:
+                    pending[id] = (None, None, 0, None)
+                    statements.append(self._delete_statement(namespace, key))
+                    results.append(current is not None)
+            if statements:
+                self._commit(statements)
+            for (namespace, key), (item, vector, size, expires_at) in pending.items():
+                if item is None:
+                    self._delete_resident(namespace, key)
+                else:
+                    self._put_resident(item, vector, size, expires_at)
+            self._enforce_budget(pending)
+        return results
+
+    def _enforce_budget(self, protected):
+        # Evicts the least recently used items until the resident size fits the budget again.
+        # The items just written are never evicted, even if they alone exceed the budget.
+        if not self.memory_budget or self._memory <= self.memory_budget:
+            return
+        victims = []
+        excess = self._memory - self.memory_budget
+        for id, size in self._lru.items():
+            if excess <= 0:
+                break
+            if id in protected:
+                continue
+            victims.append(id)
+            excess -= size
+        if not victims:
+            return
+        try:
+            self._commit([self._delete_statement(*id) for id in victims])
+        except sqlite3.Error as e:
+            logging.error(f"Evicting {len(victims)} item(s) from {self.path} failed: {e}")
+            return
+        for id in victims:
+            self._delete_resident(*id)
+        self._evicted += len(victims)
+
+    def sweep(self, chunk: int = 1000) -> int:
+        """
+        Deletes the expired items, in transactions of up to `chunk` items so the store stays responsive.
+
+        Returns:
+            int: The number of items deleted.
+        """
+        swept = 0
+        while True:
+            now = time.time()
+            with self._lock:
+                self._sync()
+                victims = []
+                while self._expiry_heap and self._expiry_heap[0][0] <= now and len(victims) < chunk:
+                    expires_at, id = heapq.heappop(self._expiry_heap)
+                    if self._expires.get(id) == expires_at:
+                        victims.append(id)
+                if not victims:
+                    return swept
+                # The expiry is checked again in SQL, in case another worker just rewrote the item.
+                rowcounts = self._commit([
+                    ("DELETE FROM items WHERE namespace = ? AND key = ? AND expires_at <= ?",
+                     (self._encode_namespace(namespace), key, now), self._encode_namespace(namespace), key)
+                    for namespace, key in victims
+                ])
+                for id, rowcount in zip(victims, rowcounts):
+                    if rowcount:
+                        self._delete_resident(*id)
+                        swept += 1
+                self._expired += sum(rowcounts)
+
+    async def run_sweeper(self, interval: float = 60):
+        """
+        Calls `sweep` every `interval` seconds in a worker thread, until cancelled.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                swept = await asyncio.to_thread(self.sweep)
+                if swept:
+                    logging.info(f"Swept {swept} expired item(s) from {self.path}.")
+            except Exception as e:
+                logging.error(f"Sweeping expired items from {self.path} failed: {e}")
+
+    @staticmethod
+    def _matches(item: Item, filter: dict) -> bool:
+        return not filter or all(item.value.get(key) == value for key, value in filter.items())
+
+    def search(self, namespace_prefix: list = None, filter: dict = None, limit: int = 10, offset: int = 0,
+               query: str = None) -> list:
+        """
+        Searches the items below a namespace prefix.
+
+        Without a query, items come in lexicographic order of their namespaces: only the subtree of the
+        prefix is walked, and the walk stops once the page is full. With a query, items are ranked by
+        the cosine similarity of their embedding to the query's; a prefix holding fewer than
+        `ivf_threshold` items is ranked exactly, larger ones through the inverted file.
+
+        Args:
+            namespace_prefix (list, optional): The namespace prefix, all namespaces by default.
+            filter (dict, optional): Top-level value pairs the items must match.
+            limit (int, optional): Maximum number of items returned.
+            offset (int, optional): Number of matches to skip.
+            query (str, optional): Text the items are ranked by similarity to.
+
+        Returns:
+            list: The matching items, as SearchItems.
+        """
+        prefix = tuple(namespace_prefix or ())
+        if query is not None:
+            return self._vector_search(prefix, filter, limit, offset, self._embed([query])[0])
+
+        items = []
+        skipped = 0
+        now = time.time()
+        with self._lock:
+            self._sync()
+            for namespace, key, item in self._trie.iter_items(prefix):
+                if self._is_expired((namespace, key), now) or not self._matches(item, filter):
+                    continue
+                if skipped < offset:
+                    skipped += 1
+                    continue
+                if len(items) == limit:
+                    break
+                items.append(item)
+            self._touch(items)
+        return [SearchItem(**dict(item)) for item in items]
+
+    def _touch(self, items: list):
+        for item in items:
+            self._lru.move_to_end((tuple(item.namespace), item.key))
+
+    def _vector_search(self, prefix: tuple, filter: dict, limit: int, offset: int, vector) -> list:
+        now = time.time()
+        with self._lock:
+            self._sync()
+            node = self._trie.get_node(prefix)
+            if node is None:
+                return []
+
+            def accept(id) -> bool:
+                namespace, key = id
+                return namespace[:len(prefix)] == prefix and not self._is_expired(id, now) and \
+                    self._matches(self._trie.get(namespace, key), filter)
+
+            candidates = None
+            if prefix and node.size < self.ivf_threshold:
+                candidates = [(namespace, key) for namespace, key, _ in self._trie.iter_items(prefix)]
+            hits = self._vectors.search(vector, offset + limit, accept, candidates)
+            items = [(self._trie.get(*id), score) for id, score in hits[offset:]]
+            self._touch([item for item, _ in items])
+        return [SearchItem(**dict(item), score=score) for item, score in items]
+
+    def list_namespaces(self, prefix: list = None, suffix: list = None, max_depth: int = None, limit: int = 100,
+                        offset: int = 0) -> list:
+        """
+        Lists the namespaces holding items, see `NamespaceTrie.list_namespaces`.
+        """
+        with self._lock:
+            self._sync()
+            return self._trie.list_namespaces(prefix, suffix, max_depth, limit, offset)
+
+    def stats(self):
+        """
+        Returns the size, memory, expiry, eviction, write and cross-process sync counters of the store.
+        """
+        with self._lock:
+            self._sync()
+            return {
+                "path": self.path,
+                "items": len(self._trie),
+                "memory_bytes": self._memory,
+                "memory_budget": self.memory_budget,
+                "expiring_items": len(self._expires),
+                "expired": self._expired,
+                "evicted": self._evicted,
+                "vector_index": self._vectors.stats(),
+                "writes": self._writes,
+                "last_seq": self._last_seq,
+                "synced_changes": self._synced_changes,
+                "reloads": self._reloads,
+            }
+
+    def close(self):
+        """
+        Closes the database connection.
+        """
+        with self._lock:
+            self._connection.close()
+
+
+_item_store = None
+_item_store_lock = threading.Lock()
+
+
+def get_item_store():
+    """
+    Returns the process-wide ItemStore, opened on STORE_PATH on first use.
+
+    STORE_NAMESPACE_TTLS is a JSON object mapping dot-joined namespace prefixes to seconds to live,
+    e.g. `{"scratch": 3600}`, and STORE_MEMORY_BUDGET the resident bytes above which cold items are evicted.
+    """
+    global _item_store
+    with _item_store_lock:
+        if _item_store is None:
+            namespace_ttls = json.loads(os.getenv("STORE_NAMESPACE_TTLS", "{}"))
+            _item_store = ItemStore(
+                path=os.getenv("STORE_PATH", "store_db.sqlite3"),
+                ivf_threshold=int(os.getenv("STORE_IVF_THRESHOLD", "20000")),
+                namespace_ttls={tuple(prefix.split(".")): float(ttl) for prefix, ttl in namespace_ttls.items()},
+                memory_budget=int(os.getenv("STORE_MEMORY_BUDGET", "0")),
+            )
+    return _item_store
+
+
+def close_item_store():
+    """
+    Closes the process-wide ItemStore, if open. The next `get_item_store` call reopens it.
+    """
+    global _item_store
+    with _item_store_lock:
+        if _item_store is not None:
+            _item_store.close()
+            _item_store = None
@@ -0,0 +1,155 @@
+class NamespaceNode:
+    """
+    A node of the namespace trie: the items stored directly in its namespace, its child labels and
+    the number of items in its whole subtree.
+    """
+
+    __slots__ = ("children", "items", "size")
+
+    def __init__(self):
+        self.children = {}
+        self.items = {}
+        self.size = 0
+
+
+class NamespaceTrie:
+    """
+    Trie of store namespaces, one node per namespace label.
+
+    Every node knows how many items live in its subtree and empty nodes are pruned on delete, so
+    prefix searches and namespace listings only walk the subtree that can match, in lexicographic
+    order of the namespaces, and stop as soon as the requested page is full.
+
+    The trie is not thread-safe, the ItemStore serializes access to it.
+    """
+
+    def __init__(self):
+        self.root = NamespaceNode()
+
+    def __len__(self) -> int:
+        return self.root.size
+
+    def get_node(self, namespace) -> NamespaceNode:
+        """
+        Returns the node of a namespace, or None if no item lives in or below it.
+        """
+        node = self.root
+        for label in namespace:
+            node = node.children.get(label)
+            if node is None:
+                return None
+        return node
+
+    def get(self, namespace, key: str):
+        node = self.get_node(namespace)
+        return node.items.get(key) if node is not None else None
+
+    def put(self, namespace, key: str, item) -> bool:
+        """
+        Stores an item under a namespace and key.
+
+        Returns:
+            bool: True if the key is new in the namespace.
+        """
+        path = [self.root]
+        for label in namespace:
+            path.append(path[-1].children.setdefault(label, NamespaceNode()))
+        created = key not in path[-1].items
+        path[-1].items[key] = item
+        if created:
+            for node in path:
+                node.size += 1
+        return created
+
+    def delete(self, namespace, key: str):
+        """
+        Removes an item and prunes the nodes left empty.
+
+        Returns:
+            The removed item, or None if it did not exist.
+        """
+        path = [self.root]
+        for label in namespace:
+            node = path[-1].children.get(label)
+            if node is None:
+                return None
+            path.append(node)
+        item = path[-1].items.pop(key, None)
+        if item is None:
+            return None
+        for node in path:
+            node.size -= 1
+        for depth in range(len(namespace), 0, -1):
+            if path[depth].size:
+                break
+            del path[depth - 1].children[namespace[depth - 1]]
+        return item
+
+    def iter_items(self, prefix=()):
+        """
+        Yields the (namespace, key, item) triples below a namespace prefix, namespaces in lexicographic order.
+        """
+        node = self.get_node(prefix)
+        if node is None:
+            return
+        stack = [(node, tuple(prefix))]
+        while stack:
+            node, namespace = stack.pop()
+            for key, item in node.items.items():
+                yield namespace, key, item
+            for label in sorted(node.children, reverse=True):
+                stack.append((node.children[label], namespace + (label,)))
+
+    @staticmethod
+    def _ends_with(namespace: tuple, suffix) -> bool:
+        if len(suffix) > len(namespace):
+            return False
+        tail = namespace[len(namespace) - len(suffix):]
+        return all(label == "*" or label == actual for label, actual in zip(suffix, tail))
+
+    def _has_suffix(self, node: NamespaceNode, namespace: tuple, suffix) -> bool:
+        stack = [(node, namespace)]
+        while stack:
+            node, namespace = stack.pop()
+            if node.items and self._ends_with(namespace, suffix):
+                return True
+            stack.extend((child, namespace + (label,)) for label, child in node.children.items())
+        return False
+
+    def list_namespaces(self, prefix=None, suffix=None, max_depth: int = None, limit: int = 100,
+                        offset: int = 0) -> list:
+        """
+        Lists the namespaces holding items, in lexicographic order.
+
+        Args:
+            prefix (list, optional): Only namespaces starting with these labels.
+            suffix (list, optional): Only namespaces ending with these labels, "*" matches any label.
+            max_depth (int, optional): Namespaces deeper than this are truncated to it, and deduplicated.
+            limit (int, optional): Maximum number of namespaces returned.
+            offset (int, optional): Number of namespaces to skip.
+
+        Returns:
+            list: The namespaces, as lists of labels.
+        """
+        prefix = tuple(prefix or ())
+        node = self.get_node(prefix)
+        if node is None:
+            return []
+
+        wanted = offset + limit
+        namespaces = []
+        stack = [(node, prefix)]
+        while stack and len(namespaces) < wanted:
+            node, namespace = stack.pop()
+            if max_depth is not None and len(namespace) >= max_depth:
+                # The whole subtree collapses into one truncated namespace.
+                truncated = list(namespace[:max_depth])
+                if (not suffix or self._has_suffix(node, namespace, suffix)) and \
+                        (not namespaces or namespaces[-1] != truncated):
+                    namespaces.append(truncated)
+                continue
+            if node.items and (not suffix or self._ends_with(namespace, suffix)):
+                namespaces.append(list(namespace))
+            for label in sorted(node.children, reverse=True):
+                stack.append((node.children[label], namespace + (label,)))
+        return namespaces[offset:offset + limit]
@@ -0,0 +1,223 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+import pytz
+
+from models import Run
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    thread_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    data TEXT NOT NULL,
+    output TEXT,
+    error TEXT,
+    owner TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_thread ON runs (thread_id, created_at);
+CREATE INDEX IF NOT EXISTS runs_status ON runs (status);
+"""
+
+# Statuses after which a run does not change any more.
+FINAL_STATUSES = ("success", "error", "timeout", "interrupted")
+
+
+class RunStore:
+    """
+    Durable storage for the runs of threads, backed by SQLite in WAL mode.
+
+    A run is stored as its Run record plus, once it ended, its output or error. Status changes are
+    conditional transitions (`transition`), so a run that was cancelled while queued is never started,
+    and a run that finished is never marked again, whichever worker process gets there first. Each run
+    also records its owner, the executor that runs it, so the runs of an executor that died without
+    stopping can be found (`owners`) and interrupted (`interrupt_owners`).
+
+    Attributes:
+        path (str): The SQLite database file.
+    """
+
+    def __init__(self, path: str = "runs_db.sqlite3"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        columns = [row[1] for row in self._connection.execute("PRAGMA table_info(runs)")]
+        if columns and "owner" not in columns:
+            # Databases created before runs had owners
+            self._connection.execute("ALTER TABLE runs ADD COLUMN owner TEXT")
+        self._connection.executescript(SCHEMA)
+
+    def put(self, run: Run, owner: str = None):
+        """
+        Stores a new run.
+
+        Args:
+            run (Run): The run.
+            owner (str, optional): The executor that runs it.
+        """
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO runs (run_id, thread_id, status, created_at, data, owner) VALUES (?, ?, ?, ?, ?, ?)",
+                (str(run.run_id), str(run.thread_id), run.status.value, run.created_at.isoformat(),
+                 run.model_dump_json(), owner),
+            )
+
+    def transition(self, run_id: str, from_statuses: tuple, status: str, output=None, error: str = None) -> bool:
+        """
+        Moves a run to `status` if it currently is in one of `from_statuses`.
+
+        Args:
+            run_id (str): The run.
+            from_statuses (tuple): The statuses the run may be moved from.
+            status (str): The new status.
+            output (optional): The output of the run, stored as JSON.
+            error (str, optional): The error of the run.
+
+        Returns:
+            bool: True if the run was moved.
+        """
+        placeholders = ", ".join("?" * len(from_statuses))
+        now = datetime.now(pytz.UTC).isoformat()
+        with self._lock:
+            cursor = self._connection.execute(
+                "UPDATE runs SET status = ?, data = json_set(data, '$.status', ?, '$.updated_at', ?), "
+                f"output = ?, error = ? WHERE run_id = ? AND status IN ({placeholders})",
+                (status, status, now, json.dumps(output) if output is not None else None, error, run_id,
+                 *from_statuses),
+            )
+        return cursor.rowcount > 0
+
+    def get(self, thread_id: str, run_id: str):
+        """
+        Returns a run of a thread with its output and error, or None if it does not exist.
+
+        Returns:
+            tuple: The Run, its output and its error.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT data, output, error FROM runs WHERE run_id = ? AND thread_id = ?", (run_id, thread_id)
+            ).fetchone()
+        if row is None:
+            return None
+        data, output, error = row
+        return Run.model_validate_json(data), json.loads(output) if output is not None else None, error
+
+    def list(self, thread_id: str, limit: int = 10, offset: int = 0) -> list:
+        """
+        Returns the runs of a thread, newest first.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT data FROM runs WHERE thread_id = ? ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                (thread_id, limit, offset),
+            ).fetchall()
+        return [Run.model_validate_json(data) for data, in rows]
+
+    def active(self, thread_id: str) -> list:
+        """
+        Returns the ids of the pending and running runs of a thread, oldest first.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT run_id FROM runs WHERE thread_id = ? AND status IN ('pending', 'running') ORDER BY created_at",
+                (thread_id,),
+            ).fetchall()
+        return [run_id for run_id, in rows]
+
+    def owners(self) -> list:
+        """
+        Returns the owners of the pending and running runs, None for runs stored without an owner.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT DISTINCT owner FROM runs WHERE status IN ('pending', 'running')"
+            ).fetchall()
+        return [owner for owner, in rows]
+
+    def interrupt_owners(self, owners: list) -> int:
+        """
+        Moves the pending and running runs of `owners` to interrupted, None standing for the runs without
+        an owner.
+
+        Returns:
+            int: The number of runs interrupted.
+        """
+        now = datetime.now(pytz.UTC).isoformat()
+        with self._lock:
+            cursor = self._connection.execute(
+                "UPDATE runs SET status = 'interrupted', "
+                "data = json_set(data, '$.status', 'interrupted', '$.updated_at', ?) "
+                "WHERE status IN ('pending', 'running') AND (owner IN (SELECT value FROM json_each(?)) "
+                "OR (owner IS NULL AND ?))",
+                (now, json.dumps([owner for owner in owners if owner is not None]), None in owners),
+            )
+        return cursor.rowcount
+
+    def delete(self, thread_id: str, run_id: str) -> bool:
+        """
+        Deletes a run of a thread.
+
+        Returns:
+            bool: True if the run existed.
+        """
+        with self._lock:
+            cursor = self._connection.execute(
+                "DELETE FROM runs WHERE run_id = ? AND thread_id = ?", (run_id, thread_id)
+            )
+        return cursor.rowcount > 0
+
+    def delete_threads(self, thread_ids: list) -> int:
+        """
+        Deletes the runs of several threads.
+
+        Returns:
+            int: The number of runs deleted.
+        """
+        with self._lock:
+            cursor = self._connection.execute(
+                "DELETE FROM runs WHERE thread_id IN (SELECT value FROM json_each(?))", (json.dumps(thread_ids),)
+            )
+        return cursor.rowcount
+
+    def close(self):
+        """
+        Closes the database connection.
+        """
+        with self._lock:
+            self._connection.close()
+
+
+_run_store = None
+_run_store_lock = threading.Lock()
+
+
+def get_run_store():
+    """
+    Returns the process-wide RunStore, opened on RUN_STORE_PATH on first use.
+    """
+    global _run_store
+    with _run_store_lock:
+        if _run_store is None:
+            _run_store = RunStore(os.getenv("RUN_STORE_PATH", "runs_db.sqlite3"))
+    return _run_store
+
+
+def close_run_store():
+    """
+    Closes the process-wide RunStore, if open. The next `get_run_store` call reopens it.
+    """
+    global _run_store
+    with _run_store_lock:
+        if _run_store is not None:
+            _run_store.close()
+            _run_store = None
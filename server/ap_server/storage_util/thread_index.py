@@ -0,0 +1,264 @@
+import bisect
+import heapq
+import itertools
+import json
+import sys
+import threading
+import zlib
+from collections import defaultdict
+from datetime import datetime, timezone
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def epoch_micros(timestamp: str) -> int:
+    """
+    Returns an ISO 8601 timestamp as integer microseconds since the epoch.
+    """
+    moment = datetime.fromisoformat(timestamp)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    delta = moment - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def metadata_posting(key: str, value) -> tuple:
+    """
+    Returns the inverted index key of a metadata pair. Values are compared by their canonical JSON,
+    so nested dicts and lists can be indexed too. Both halves are interned: the same keys and values
+    recur across threads, and are then stored once.
+    """
+    return sys.intern(key), sys.intern(json.dumps(value, sort_keys=True, default=str))
+
+
+class ThreadEntry:
+    """
+    The resident fields of a thread, as a slotted record: the status (interned), the creation and last
+    update times in integer microseconds since the epoch, the metadata postings and the position of
+    the thread's last write in the change log.
+    """
+
+    __slots__ = ("status", "created_ts", "updated_ts", "postings", "seq")
+
+    def __init__(self, status: str, created_ts: int, updated_ts: int, postings: tuple, seq: int):
+        self.status = status
+        self.created_ts = created_ts
+        self.updated_ts = updated_ts
+        self.postings = postings
+        self.seq = seq
+
+
+class ThreadIndex:
+    """
+    In-memory index of the threads of a ThreadStore.
+
+    Besides the ThreadEntry and the latest state of each thread, it keeps secondary indexes, so a search only visits the threads that can match:
+    a bucket of thread ids per status, an inverted index from each top-level metadata key/value pair
+    to the thread ids that have it, and the thread ids sorted by creation time. States are kept as
+    their UTF-8 JSON, a fraction of the size of the ThreadState models, and only turned back into
+    models when they are served.
+
+    The index is not thread-safe, the ThreadStore serializes access to it.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._states = {}
+        self._by_status = defaultdict(set)
+        self._by_metadata = defaultdict(set)
+        self._by_created_at = []
+
+    @staticmethod
+    def make_entry(status: str, created_at: str, updated_at: str, metadata: dict, seq: int) -> ThreadEntry:
+        """
+        Builds the entry of a thread from its stored fields.
+        """
+        return ThreadEntry(
+            sys.intern(status),
+            epoch_micros(created_at),
+            epoch_micros(updated_at),
+            tuple(metadata_posting(key, value) for key, value in (metadata or {}).items()),
+            seq,
+        )
+
+    def __contains__(self, thread_id: str) -> bool:
+        return thread_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, thread_id: str):
+        return self._entries.get(thread_id)
+
+    def get_state(self, thread_id: str):
+        return self._states.get(thread_id)
+
+    def put(self, thread_id: str, entry: ThreadEntry, state):
+        """
+        Adds or replaces a thread and updates the secondary indexes.
+        """
+        previous = self._entries.get(thread_id)
+        if previous is not None:
+            self._unindex(thread_id, previous)
+        # Replaced in place rather than removed and added, so lookups never miss an existing thread.
+        self._entries[thread_id] = entry
+        self._states[thread_id] = state
+        self._by_status[entry.status].add(thread_id)
+        for posting in entry.postings:
+            self._by_metadata[posting].add(thread_id)
+        bisect.insort(self._by_created_at, (entry.created_ts, thread_id))
+
+    def remove(self, thread_id: str):
+        """
+        Drops a thread from the index and the secondary indexes, if present.
+        """
+        entry = self._entries.pop(thread_id, None)
+        if entry is None:
+            return
+        self._states.pop(thread_id, None)
+        self._unindex(thread_id, entry)
+
+    def _unindex(self, thread_id: str, entry: ThreadEntry):
+        self._discard(self._by_status, entry.status, thread_id)
+        for posting in entry.postings:
+            self._discard(self._by_metadata, posting, thread_id)
+        position = bisect.bisect_left(self._by_created_at, (entry.created_ts, thread_id))
+        if position < len(self._by_created_at) and self._by_created_at[position][1] == thread_id:
+            del self._by_created_at[position]
+
+    @staticmethod
+    def _discard(index: dict, key, thread_id: str):
+        thread_ids = index.get(key)
+        if thread_ids is not None:
+            thread_ids.discard(thread_id)
+            if not thread_ids:
+                del index[key]
+
+    def search(self, status: str = None, metadata: dict = None, offset: int = 0, limit: int = None) -> list:
+        """
+        Returns the ids of the threads matching a status and metadata pairs, newest first.
+
+        Without filters the page is sliced straight out of the creation order index. With filters, when
+        even the smallest posting set holds most threads (a filter on the dominant status, say), the
+        creation order index is walked newest first until the page is full, checking each thread against
+        the posting sets. Otherwise the smallest posting set is intersected with the others, and only
+        the newest `offset + limit` matches are picked, never sorting the whole match set.
+
+        Args:
+            status (str, optional): The status to match.
+            metadata (dict, optional): The top-level metadata pairs to match.
+            offset (int, optional): Number of matches to skip.
+            limit (int, optional): Maximum number of ids returned, all by default.
+
+        Returns:
+            list: The matching thread ids.
+        """
+        postings = []
+        if status is not None:
+            postings.append(self._by_status.get(status, set()))
+        for key, value in (metadata or {}).items():
+            postings.append(self._by_metadata.get(metadata_posting(key, value), set()))
+
+        if not postings:
+            end = len(self._by_created_at) - offset
+            start = 0 if limit is None else max(0, end - limit)
+            return [thread_id for _, thread_id in reversed(self._by_created_at[start:max(0, end)])]
+
+        postings.sort(key=len)
+        if limit is not None and 2 * len(postings[0]) > len(self._entries):
+            newest = (thread_id for _, thread_id in reversed(self._by_created_at)
+                      if all(thread_id in thread_ids for thread_ids in postings))
+            return list(itertools.islice(newest, offset, offset + limit))
+
+        # Intersections build new sets, the posting sets themselves are only read.
+        matches = postings[0]
+        for thread_ids in postings[1:]:
+            if not matches:
+                break
+            matches = matches & thread_ids
+        # Ordered like the creation order index, ties broken by thread id.
+        key = lambda thread_id: (self._entries[thread_id].created_ts, thread_id)  # noqa: E731
+        if limit is None:
+            return sorted(matches, key=key, reverse=True)[offset:]
+        return heapq.nlargest(offset + limit, matches, key=key)[offset:]
+
+
+class ShardedThreadIndex:
+    """
+    A ThreadIndex split into shards by a hash of the thread id, each guarded by its own lock.
+
+    Writes to different threads mostly land in different shards and do not contend. Lookups by id
+    (`in`, `get`, `get_state`) take no lock at all: they are single dict reads, and a ThreadIndex
+    replaces entries in place, so a lookup sees either the previous or the new version of a thread.
+    Searches run shard by shard and merge the per-shard results by creation time.
+
+    Attributes:
+        shards (int): The number of shards.
+    """
+
+    def __init__(self, shards: int = 64):
+        self.shards = max(1, shards)
+        self._shards = [ThreadIndex() for _ in range(self.shards)]
+        self._locks = [threading.Lock() for _ in range(self.shards)]
+
+    def _shard(self, thread_id: str) -> int:
+        return zlib.crc32(thread_id.encode("utf-8")) % self.shards
+
+    def __contains__(self, thread_id: str) -> bool:
+        return thread_id in self._shards[self._shard(thread_id)]
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+    def get(self, thread_id: str):
+        return self._shards[self._shard(thread_id)].get(thread_id)
+
+    def get_state(self, thread_id: str):
+        return self._shards[self._shard(thread_id)].get_state(thread_id)
+
+    def put(self, thread_id: str, entry: ThreadEntry, state):
+        """
+        Adds or replaces a thread.
+        """
+        shard = self._shard(thread_id)
+        with self._locks[shard]:
+            self._shards[shard].put(thread_id, entry, state)
+
+    def remove(self, thread_id: str):
+        """
+        Drops a thread, if present.
+        """
+        shard = self._shard(thread_id)
+        with self._locks[shard]:
+            self._shards[shard].remove(thread_id)
+
+    def apply(self, thread_id: str, seq: int, entry, state):
+        """
+        Replaces a thread with the version written at position `seq` of the change log, or drops it
+        if `entry` is None, unless the index already holds a later version.
+        """
+        shard = self._shard(thread_id)
+        with self._locks[shard]:
+            index = self._shards[shard]
+            current = index.get(thread_id)
+            if current is not None and current.seq > seq:
+                return
+            if entry is None:
+                index.remove(thread_id)
+            else:
+                index.put(thread_id, entry, state)
+
+    def search(self, status: str = None, metadata: dict = None, offset: int = 0, limit: int = None) -> list:
+        """
+        Returns the ids of the threads matching a status and metadata pairs, newest first. See
+        `ThreadIndex.search`.
+        """
+        results = []
+        for index, lock in zip(self._shards, self._locks):
+            with lock:
+                # Each shard can hold the whole page.
+                thread_ids = index.search(status, metadata, 0, None if limit is None else offset + limit)
+                results.append([(index.get(thread_id).created_ts, thread_id) for thread_id in thread_ids])
+        merged = (thread_id for _, thread_id in heapq.merge(*results, reverse=True))
+        end = None if limit is None else offset + limit
+        return [thread_id for thread_id in itertools.islice(merged, offset, end)]
@@ -0,0 +1,794 @@
+import asyncio
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+from datetime import datetime
+from uuid import uuid4
+
+import pytz
+
+from models import CheckpointConfig, Status1, Thread, ThreadState
+from storage_util.checkpoints import CheckpointLog, create_tables as create_checkpoint_tables
+from storage_util.thread_index import ShardedThreadIndex, ThreadIndex
+from llamastack_agent_util.llamastack_utils import load_from_pickle
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS threads (
+    thread_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    data TEXT NOT NULL,
+    state TEXT
+);
+CREATE INDEX IF NOT EXISTS threads_updated_at ON threads (updated_at);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    thread_id TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS thread_garbage (
+    thread_id TEXT PRIMARY KEY,
+    deleted_at REAL NOT NULL,
+    pruned INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class ThreadStore:
+    """
+    Durable storage for threads, backed by SQLite in WAL mode.
+
+    Every write goes through a single writer thread that groups the writes queued at the same time
+    into one transaction, so concurrent requests share one commit (and one fsync) instead of paying
+    for their own. Callers block until their write is committed, a thread that was acknowledged is
+    on disk, and a crash can only lose writes that were never acknowledged.
+
+    The ids, status and timestamps of all threads are kept in an in-memory ThreadIndex, so existence
+    checks never touch the disk and a thread is read back by primary key. WAL mode lets these reads run
+    alongside the writer. The latest state of every thread is resident as well: it is loaded at
+    startup and replaced when a write commits, so state reads never touch the disk. The secondary
+    indexes of the ThreadIndex (status, metadata, creation time) narrow searches down to the matching
+    threads before anything is read from disk.
+
+    The database can be shared by several worker processes. Every write also appends the thread_id
+    to a `changes` log in the same transaction. Before serving a read, a store checks SQLite's
+    `data_version`, which only moves when another connection committed, and replays the log entries
+    it has not seen yet. Reads stay local to each worker and still see the writes of the others.
+
+    The states of a thread are checkpoints in a CheckpointLog, stored as deltas against their parent
+    with periodic full snapshots. The row of a thread only holds its latest values (`Thread.values`)
+    and its latest state, and a state update writes the checkpoint and the thread row in the same
+    transaction. A copy of a thread shares the checkpoints of its source instead of duplicating them.
+
+    Deleting a thread, explicitly or because it stayed idle for longer than `thread_ttl`, only drops its
+    row and records it in `thread_garbage`; `collect` reclaims the checkpoints afterwards, a small
+    batch per transaction, keeping those that copies of the thread still reference until the copies
+    are gone as well. A deleted thread id cannot be reused until it is collected.
+
+    Requests run concurrently in the server's threadpool. The in-memory index is a ShardedThreadIndex,
+    locked per shard, and the read-modify-write operations (state updates, patches) hold one of
+    `stripes` locks picked by a hash of the thread id, so concurrent updates of one thread are applied
+    one after the other while updates of different threads never wait on each other.
+
+    Attributes:
+        path (str): The SQLite database file.
+        commit_interval (float): Seconds the writer waits for more writes before committing a batch.
+        max_batch (int): Maximum number of writes committed together.
+        sync_interval (float): Seconds between two checks for writes of other processes, 0 checks on every read.
+        change_log_size (int): Number of `changes` entries kept, a store that falls further behind reloads.
+        thread_ttl (float): Seconds after its last update after which an idle thread expires, 0 never expires.
+        stripes (int): Number of index shards and of thread locks.
+        blob_min_size (int): Length from which strings in checkpoints are stored once, as shared blobs.
+    """
+
+    def __init__(self, path: str = "threads_db.sqlite3", commit_interval: float = 0.0, max_batch: int = 256,
+                 legacy_pickle: str = "threads_db.pkl", sync_interval: float = 0.0, change_log_size: int = 10000,
+                 snapshot_interval: int = 20, checkpoint_retention: int = 1000, thread_ttl: float = 0,
+                 stripes: int = 64, blob_min_size: int = 256):
+        self.path = path
+        self._checkpoints = CheckpointLog(snapshot_interval, checkpoint_retention, blob_min_size)
+        self.commit_interval = commit_interval
+        self.max_batch = max(1, max_batch)
+        self.sync_interval = sync_interval
+        self.change_log_size = max(1, change_log_size)
+        self.thread_ttl = thread_ttl
+        self.stripes = max(1, stripes)
+        self._index = ShardedThreadIndex(self.stripes)
+        self._stripes = [threading.Lock() for _ in range(self.stripes)]
+        self._last_seq = 0
+        self._own_seqs = set()
+        self._sync_lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = queue.Queue()
+        self._commits = 0
+        self._committed_writes = 0
+        self._synced_changes = 0
+        self._reloads = 0
+        self._deleted = 0
+        self._expired = 0
+        self._collected_threads = 0
+        self._collected_checkpoints = 0
+
+        connection = self._connect()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(SCHEMA)
+        create_checkpoint_tables(connection)
+        if "state" not in [row[1] for row in connection.execute("PRAGMA table_info(threads)")]:
+            connection.execute("ALTER TABLE threads ADD COLUMN state TEXT")
+        self._migrate_pickle(connection, legacy_pickle)
+        self._migrate_states(connection)
+        self._load_index(connection)
+
+        self._writer = threading.Thread(target=self._write_loop, name="thread-store-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        connection.execute("PRAGMA synchronous=FULL")
+        return connection
+
+    def _reader(self):
+        # One read connection per thread, SQLite connections are not meant to be shared.
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._connect()
+            self._local.connection = connection
+            self._local.data_version = None
+            self._local.next_sync = 0.0
+        return connection
+
+    def _migrate_pickle(self, connection, legacy_pickle: str):
+        # One-time import of the pickle file the threads router used to rewrite on every create.
+        if not legacy_pickle or not os.path.exists(legacy_pickle):
+            return
+        # The emptiness check runs in the write transaction, so only one worker imports the file.
+        connection.execute("BEGIN IMMEDIATE")
+        if connection.execute("SELECT 1 FROM threads LIMIT 1").fetchone():
+            connection.execute("ROLLBACK")
+            return
+        threads = load_from_pickle(legacy_pickle)
+        for thread in threads.values():
+            connection.execute("INSERT OR IGNORE INTO threads VALUES (?, ?, ?, ?, ?, ?)", self._row(thread))
+            connection.execute("INSERT INTO changes (thread_id) VALUES (?)", (str(thread.thread_id),))
+        connection.execute("COMMIT")
+        logging.info(f"Migrated {len(threads)} thread(s) from {legacy_pickle} to {self.path}.")
+
+    def _migrate_states(self, connection):
+        # One-time conversion of the threads that kept all their states in `values["states"]`: the states
+        # become checkpoints, and the thread keeps the latest values.
+        connection.execute("BEGIN IMMEDIATE")
+        rows = connection.execute("SELECT data FROM threads WHERE state IS NULL").fetchall()
+        for data, in rows:
+            thread = Thread.model_validate_json(data)
+            thread_id = str(thread.thread_id)
+            parent = None
+            for state in (thread.values or {}).get("states") or []:
+                state = ThreadState.model_validate(state)
+                checkpoint_id = str(uuid4())
+                if parent is not None:
+                    state.parent_checkpoint = {"thread_id": thread_id, "checkpoint_ns": "",
+                                               "checkpoint_id": parent[2]["checkpoint"]["checkpoint_id"]}
+                state.checkpoint = CheckpointConfig(thread_id=thread_id, checkpoint_ns="", checkpoint_id=checkpoint_id)
+                state = state.model_dump(mode="json")
+                for sql, params in self._checkpoints.insert_statements(thread_id, state, parent):
+                    connection.execute(sql, params)
+                parent = (*self._checkpoints.parent(connection, thread_id, checkpoint_id), state)
+            latest = ThreadState.model_validate(parent[2]) if parent is not None else None
+            thread.values = latest.values if latest is not None else None
+            connection.execute("UPDATE threads SET data = ?, state = ? WHERE thread_id = ?",
+                               (thread.model_dump_json(), latest.model_dump_json() if latest else "null", thread_id))
+        connection.execute("COMMIT")
+        if rows:
+            logging.info(f"Moved the states of {len(rows)} thread(s) of {self.path} to checkpoints.")
+
+    def _load_index(self, connection):
+        index = ShardedThreadIndex(self.stripes)
+        # Read the threads and the position in the change log from the same snapshot.
+        connection.execute("BEGIN")
+        try:
+            last_seq = connection.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+            rows = connection.execute("SELECT thread_id, status, created_at, updated_at, data, state FROM threads")
+            for thread_id, status, created_at, updated_at, data, state in rows:
+                entry, state = self._decode_row(status, created_at, updated_at, data, state, last_seq)
+                index.put(thread_id, entry, state)
+        finally:
+            connection.execute("COMMIT")
+        self._index, self._last_seq = index, last_seq
+        logging.info(f"Thread store {self.path} opened with {len(index)} thread(s).")
+
+    def _sync(self):
+        # Replays the writes other processes committed since the last check.
+        connection = self._reader()
+        if self.sync_interval > 0:
+            now = time.monotonic()
+            if now < self._local.next_sync:
+                return
+            self._local.next_sync = now + self.sync_interval
+        data_version = connection.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._local.data_version:
+            return
+        self._local.data_version = data_version
+
+        with self._sync_lock:
+            changes = connection.execute(
+                "SELECT seq, thread_id FROM changes WHERE seq > ? ORDER BY seq", (self._last_seq,)
+            ).fetchall()
+            if not changes:
+                return
+            if changes[0][0] > self._last_seq + 1:
+                # The entries this store missed were pruned from the log, start over from the tables.
+                self._load_index(connection)
+                self._reloads += 1
+                return
+            latest = {}
+            for seq, thread_id in changes:
+                if seq not in self._own_seqs:
+                    latest[thread_id] = seq
+            for thread_id, seq in latest.items():
+                row = connection.execute(
+                    "SELECT status, created_at, updated_at, data, state FROM threads WHERE thread_id = ?", (thread_id,)
+                ).fetchone()
+                if row is None:
+                    self._apply(thread_id, seq, None, None)
+                    continue
+                self._apply(thread_id, seq, *self._decode_row(*row, seq))
+            self._last_seq = changes[-1][0]
+            self._own_seqs = {seq for seq in self._own_seqs if seq > self._last_seq}
+            self._synced_changes += len(latest)
+
+    def _apply(self, thread_id: str, seq: int, entry, state):
+        # Entries only move forward in the change log, whichever of the writer and `_sync` comes last.
+        self._index.apply(thread_id, seq, entry, state)
+
+    def _stripe(self, thread_id: str):
+        return self._stripes[zlib.crc32(thread_id.encode("utf-8")) % self.stripes]
+
+    @staticmethod
+    def _decode_row(status: str, created_at: str, updated_at: str, data: str, state: str, seq: int):
+        entry = ThreadIndex.make_entry(status, created_at, updated_at, json.loads(data).get("metadata"), seq)
+        # The state stays JSON, it is only validated into a ThreadState when served.
+        return entry, state.encode("utf-8") if state and state != "null" else None
+
+    @staticmethod
+    def _row(thread: Thread, state: ThreadState = None):
+        return (
+            str(thread.thread_id),
+            thread.status.value,
+            thread.created_at.isoformat(),
+            thread.updated_at.isoformat(),
+            thread.model_dump_json(),
+            state.model_dump_json() if state is not None else None,
+        )
+
+    def _write_loop(self):
+        connection = self._connect()
+        while True:
+            batch = [self._writes.get()]
+            if batch[0] is None:
+                return
+            # Group commit: collect the writes queued while the previous batch was committing,
+            # optionally waiting `commit_interval` for more.
+            try:
+                while len(batch) < self.max_batch:
+                    if self.commit_interval > 0:
+                        write = self._writes.get(timeout=self.commit_interval)
+                    else:
+                        write = self._writes.get_nowait()
+                    if write is None:
+                        self._writes.put(None)
+                        break
+                    batch.append(write)
+            except queue.Empty:
+                pass
+            self._commit(connection, batch)
+
+    def _commit(self, connection, batch):
+        # Each write runs in its own savepoint, so a failing write does not fail the rest of its batch.
+        results = []
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            for statements, thread_id, _, _ in batch:
+                connection.execute("SAVEPOINT write")
+                try:
+                    # The statements after the first only run if it changed the thread row.
+                    sql, params = statements[0]
+                    rowcount = connection.execute(sql, params).rowcount
+                    seq = None
+                    if rowcount:
+                        for sql, params in statements[1:]:
+                            connection.execute(sql, params)
+                        seq = connection.execute("INSERT INTO changes (thread_id) VALUES (?)", (thread_id,)).lastrowid
+                    connection.execute("RELEASE write")
+                    results.append((rowcount, seq))
+                except sqlite3.DatabaseError as e:
+                    connection.execute("ROLLBACK TO write")
+                    connection.execute("RELEASE write")
+                    results.append(e)
+            if self._commits % 1000 == 0:
+                connection.execute("DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?",
+                                   (self.change_log_size,))
+            connection.execute("COMMIT")
+        except Exception as e:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            logging.error(f"Thread store commit of {len(batch)} write(s) failed: {e}")
+            for _, _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        self._commits += 1
+        self._committed_writes += len(batch)
+        for (_, _, on_commit, future), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+                continue
+            rowcount, seq = result
+            if seq is not None:
+                with self._sync_lock:
+                    self._own_seqs.add(seq)
+                if on_commit is not None:
+                    on_commit(seq)
+            future.set_result(rowcount)
+
+    def _write(self, statements: list, thread_id: str, on_commit=None) -> int:
+        # Runs (sql, params) statements in one write, and returns the rowcount of the first one.
+        return self._write_many([(statements, thread_id, on_commit)])[0]
+
+    def _write_many(self, writes: list) -> list:
+        # Queues (statements, thread_id, on_commit) writes at once, so they share commits, and returns
+        # the rowcount of the first statement of each.
+        futures = []
+        for statements, thread_id, on_commit in writes:
+            future = Future()
+            self._writes.put((statements, thread_id, on_commit, future))
+            futures.append(future)
+        return [future.result() for future in futures]
+
+    def _on_commit(self, thread: Thread, state):
+        # Build the index entry before the write is queued, the writer thread only swaps it in. `state` is
+        # the resident form of the latest state: its JSON, as str or UTF-8 bytes.
+        thread_id = str(thread.thread_id)
+        entry = ThreadIndex.make_entry(
+            thread.status.value, thread.created_at.isoformat(), thread.updated_at.isoformat(), thread.metadata, 0
+        )
+        if isinstance(state, str):
+            state = state.encode("utf-8")
+
+        def apply(seq: int):
+            entry.seq = seq
+            self._apply(thread_id, seq, entry, state)
+        return apply
+
+    def create(self, thread: Thread, state: ThreadState) -> bool:
+        """
+        Stores a new thread, unless a thread with the same id exists, with its first state as first checkpoint.
+
+        Returns:
+            bool: True if the thread was created, False if the id was taken or belongs to a deleted thread
+            that is not collected yet.
+        """
+        thread_id = str(thread.thread_id)
+        row = self._row(thread, state)
+        statements = [("INSERT OR IGNORE INTO threads SELECT ?, ?, ?, ?, ?, ? "
+                       "WHERE NOT EXISTS (SELECT 1 FROM thread_garbage WHERE thread_id = ?)", (*row, thread_id))]
+        statements += self._checkpoints.insert_statements(thread_id, json.loads(row[5]), None)
+        created = self._write(statements, thread_id, self._on_commit(thread, row[5]))
+        return bool(created)
+
+    def put(self, thread: Thread):
+        """
+        Stores a thread, replacing the previous version if any. Its checkpoints are kept.
+        """
+        thread_id = str(thread.thread_id)
+        row = self._row(thread)
+        self._write(
+            [("INSERT INTO threads VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (thread_id) DO UPDATE "
+              "SET status = excluded.status, updated_at = excluded.updated_at, data = excluded.data", row)],
+            thread_id, self._on_commit(thread, self._index.get_state(thread_id)),
+        )
+
+    def update_state(self, thread_id: str, values: dict, checkpoint_id: str = None):
+        """
+        Adds a checkpoint to a thread, with the values of its parent updated by `values`, and makes it
+        the latest state of the thread.
+
+        Args:
+            thread_id (str): The thread.
+            values (dict): The values to update, top-level keys replace those of the parent.
+            checkpoint_id (str, optional): The parent checkpoint, the latest state by default.
+
+        Returns:
+            ThreadState: The new state, or None if the thread or the parent checkpoint does not exist.
+        """
+        with self._stripe(thread_id):
+            return self._update_state(thread_id, values, checkpoint_id)
+
+    def _update_state(self, thread_id: str, values: dict, checkpoint_id: str = None):
+        thread = self.get(thread_id)
+        latest = self._latest_state(thread_id)
+        if thread is None:
+            return None
+        connection = self._reader()
+        full = False
+        if latest is not None and checkpoint_id in (None, latest["checkpoint"]["checkpoint_id"]):
+            # The common case, the latest state is resident and only its position is read.
+            parent_id = latest["checkpoint"]["checkpoint_id"]
+            position = self._checkpoints.parent(connection, thread_id, parent_id)
+            parent = (*position, latest) if position else None
+        elif checkpoint_id is not None:
+            parent = self._checkpoints.get(connection, thread_id, checkpoint_id)
+            if parent is None:
+                return None
+            parent_id = checkpoint_id
+            # A fork from a checkpoint shared with a base thread before the copy point starts a new
+            # snapshot: the base only keeps the chain of the copy point.
+            base = self._checkpoints.base(connection, thread_id)
+            full = base is not None and parent[0] < base[1]
+        else:
+            parent, parent_id = None, None
+
+        parent_values = parent[2]["values"] if parent is not None else {}
+        if isinstance(parent_values, dict) and isinstance(values, dict):
+            new_values = {**parent_values, **values}
+        else:
+            new_values = values
+        now = datetime.now(pytz.UTC)
+        step = (parent[2]["metadata"].get("step", -1) if parent is not None else -1) + 1
+        parent_checkpoint = None
+        if parent_id is not None:
+            parent_checkpoint = {"thread_id": thread_id, "checkpoint_ns": "", "checkpoint_id": parent_id}
+        state = ThreadState(
+            values=new_values,
+            next=[],
+            checkpoint=CheckpointConfig(thread_id=thread_id, checkpoint_ns="", checkpoint_id=str(uuid4())),
+            metadata={"source": "update", "step": step},
+            created_at=now.isoformat(),
+            parent_checkpoint=parent_checkpoint,
+        )
+        thread.values = new_values
+        thread.updated_at = now
+        state_json = state.model_dump_json()
+        statements = [("UPDATE threads SET updated_at = ?, data = ?, state = ? WHERE thread_id = ?",
+                       (now.isoformat(), thread.model_dump_json(), state_json, thread_id))]
+        statements += self._checkpoints.insert_statements(thread_id, json.loads(state_json), parent, full)
+        if not self._write(statements, thread_id, self._on_commit(thread, state_json)):
+            # Deleted in the meantime.
+            return None
+        return state
+
+    def patch(self, thread_id: str, metadata: dict = None):
+        """
+        Merges metadata into a thread.
+
+        Returns:
+            Thread: The updated thread, or None if it does not exist.
+        """
+        with self._stripe(thread_id):
+            thread = self.get(thread_id)
+            if thread is None:
+                return None
+            thread.metadata = {**thread.metadata, **(metadata or {})}
+            thread.updated_at = datetime.now(pytz.UTC)
+            if not self._write(
+                [("UPDATE threads SET updated_at = ?, data = ? WHERE thread_id = ?",
+                  (thread.updated_at.isoformat(), thread.model_dump_json(), thread_id))],
+                thread_id, self._on_commit(thread, self._index.get_state(thread_id)),
+            ):
+                # Deleted in the meantime.
+                return None
+            return thread
+
+    def copy(self, thread_id: str):
+        """
+        Copies a thread under a new id, with its metadata, values and checkpoints.
+
+        The copy is copy-on-write: it references the checkpoints of the source up to its latest state
+        rather than duplicating them, so copying is O(1) however long the thread is, and the copy and
+        the source only store the checkpoints they add afterwards.
+
+        Returns:
+            Thread: The new thread, or None if the source does not exist.
+        """
+        source = self.get(thread_id)
+        latest = self._latest_state(thread_id)
+        if source is None:
+            return None
+        now = datetime.now(pytz.UTC)
+        thread = Thread(
+            thread_id=uuid4(), created_at=now, updated_at=now, metadata=dict(source.metadata),
+            status=Status1.idle, values=source.values,
+        )
+        new_id = str(thread.thread_id)
+        state = None
+        statements = []
+        if latest is not None:
+            connection = self._reader()
+            position = self._checkpoints.parent(connection, thread_id, latest["checkpoint"]["checkpoint_id"])
+            # The same checkpoint, seen from the copy.
+            state = ThreadState.model_validate(CheckpointLog.owned(latest, new_id))
+            if position is not None:
+                statements = self._checkpoints.copy_statements(connection, new_id, thread_id, position[0])
+        row = self._row(thread, state)
+        statements.insert(0, ("INSERT OR IGNORE INTO threads VALUES (?, ?, ?, ?, ?, ?)", row))
+        self._write(statements, new_id, self._on_commit(thread, row[5]))
+        return thread
+
+    def _delete_write(self, thread_id: str, updated_before: str = None) -> tuple:
+        # The thread row goes at once, its checkpoints are left to `collect`.
+        sql, params = "DELETE FROM threads WHERE thread_id = ?", (thread_id,)
+        if updated_before is not None:
+            # Expiry loses against a concurrent update.
+            sql, params = sql + " AND updated_at < ?", (thread_id, updated_before)
+        statements = [(sql, params), ("INSERT OR IGNORE INTO thread_garbage VALUES (?, ?, 0)", (thread_id, time.time()))]
+
+        def apply(seq: int):
+            self._apply(thread_id, seq, None, None)
+        return statements, thread_id, apply
+
+    def delete(self, thread_id: str) -> bool:
+        """
+        Deletes a thread. Its checkpoints are reclaimed in the background by `collect`.
+
+        Returns:
+            bool: True if the thread existed.
+        """
+        if thread_id not in self:
+            return False
+        deleted = bool(self._write(*self._delete_write(thread_id)))
+        self._deleted += deleted
+        return deleted
+
+    def expire(self, limit: int = 500) -> int:
+        """
+        Deletes up to `limit` threads that were not updated for `thread_ttl` seconds, busy ones excepted.
+
+        Returns:
+            int: The number of threads deleted.
+        """
+        if self.thread_ttl <= 0:
+            return 0
+        cutoff = datetime.fromtimestamp(time.time() - self.thread_ttl, pytz.UTC).isoformat()
+        rows = self._reader().execute(
+            "SELECT thread_id FROM threads WHERE updated_at < ? AND status != 'busy' LIMIT ?", (cutoff, limit)
+        ).fetchall()
+        expired = sum(1 for rowcount in self._write_many(
+            [self._delete_write(thread_id, cutoff) for thread_id, in rows]
+        ) if rowcount)
+        self._expired += expired
+        return expired
+
+    def collect(self, limit: int = 500):
+        """
+        Reclaims up to `limit` checkpoints of deleted threads, in one short transaction.
+
+        Returns:
+            tuple: The ids of the threads fully reclaimed by this call, and whether garbage is left.
+        """
+        connection = self._reader()
+        collected = []
+        reclaimed = 0
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            garbage = connection.execute(
+                "SELECT thread_id FROM thread_garbage WHERE pruned = 0 ORDER BY deleted_at LIMIT 100"
+            ).fetchall()
+            for thread_id, in garbage:
+                base = self._checkpoints.base(connection, thread_id)
+                deleted, released = self._checkpoints.reclaim(connection, thread_id, limit - reclaimed)
+                reclaimed += deleted
+                if released:
+                    connection.execute("DELETE FROM thread_garbage WHERE thread_id = ?", (thread_id,))
+                    if base is not None:
+                        # Its base may have more to reclaim now that this copy is gone.
+                        connection.execute("UPDATE thread_garbage SET pruned = 0 WHERE thread_id = ?", (base[0],))
+                    collected.append(thread_id)
+                elif reclaimed < limit:
+                    # Only what its copies reference is left, nothing to do until they are collected.
+                    connection.execute("UPDATE thread_garbage SET pruned = 1 WHERE thread_id = ?", (thread_id,))
+                if reclaimed >= limit:
+                    break
+            left = connection.execute("SELECT 1 FROM thread_garbage WHERE pruned = 0 LIMIT 1").fetchone()
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        self._collected_threads += len(collected)
+        self._collected_checkpoints += reclaimed
+        return collected, left is not None
+
+    async def run_sweeper(self, interval: float = 60, limit: int = 500, on_collect=None):
+        """
+        Every `interval` seconds, expires idle threads and collects deleted ones, `limit` at a time in a
+        worker thread so request handling is never blocked for long. Runs until cancelled.
+
+        Args:
+            interval (float, optional): Seconds between two sweeps.
+            limit (int, optional): Maximum number of threads or checkpoints handled per transaction.
+            on_collect (callable, optional): Called on the event loop with the ids of the collected
+                threads, to reclaim what other components keep per thread.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                expired = 0
+                while True:
+                    count = await asyncio.to_thread(self.expire, limit)
+                    expired += count
+                    if count < limit:
+                        break
+                collected = []
+                while True:
+                    thread_ids, left = await asyncio.to_thread(self.collect, limit)
+                    collected += thread_ids
+                    if on_collect is not None and thread_ids:
+                        on_collect(thread_ids)
+                    if not left:
+                        break
+                if expired or collected:
+                    logging.info(f"Expired {expired} and collected {len(collected)} thread(s) from {self.path}.")
+            except Exception as e:
+                logging.error(f"Sweeping threads from {self.path} failed: {e}")
+
+    def history(self, thread_id: str, limit: int = 10, before: str = None) -> list:
+        """
+        Returns the checkpoints of a thread, newest first, `limit` at a time. `before` is the
+        checkpoint id the previous page ended with.
+        """
+        states = self._checkpoints.history(self._reader(), thread_id, limit, before)
+        return [ThreadState.model_validate(state) for state in states]
+
+    def __contains__(self, thread_id: str) -> bool:
+        self._sync()
+        return thread_id in self._index
+
+    def get(self, thread_id: str):
+        """
+        Returns a thread, or None if it does not exist.
+        """
+        if thread_id not in self:
+            return None
+        row = self._reader().execute("SELECT data FROM threads WHERE thread_id = ?", (thread_id,)).fetchone()
+        return Thread.model_validate_json(row[0]) if row else None
+
+    def get_many(self, thread_ids: list) -> list:
+        """
+        Returns the threads of a list of ids, in the same order. Missing threads are skipped.
+        """
+        rows = {}
+        connection = self._reader()
+        # Stay well below SQLite's limit on the number of query parameters.
+        for start in range(0, len(thread_ids), 500):
+            chunk = thread_ids[start:start + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            rows.update(connection.execute(
+                f"SELECT thread_id, data FROM threads WHERE thread_id IN ({placeholders})", chunk
+            ).fetchall())
+        return [Thread.model_validate_json(rows[thread_id]) for thread_id in thread_ids if thread_id in rows]
+
+    def search(self, status: str = None, metadata: dict = None, values: dict = None, limit: int = 10,
+               offset: int = 0) -> list:
+        """
+        Searches threads, newest first.
+
+        Status and metadata are answered by the secondary indexes, only the page of matching threads
+        is read from disk. State values are not indexed: the threads matching the indexed filters are
+        read in pages and checked until the page of results is full.
+
+        Args:
+            status (str, optional): The status to match.
+            metadata (dict, optional): The top-level metadata pairs to match.
+            values (dict, optional): The top-level state values to match.
+            limit (int, optional): Maximum number of threads returned.
+            offset (int, optional): Number of matches to skip.
+
+        Returns:
+            list: The matching threads.
+        """
+        self._sync()
+        if not values:
+            thread_ids = self._index.search(status, metadata, offset, limit)
+            return self.get_many(thread_ids)
+
+        thread_ids = self._index.search(status, metadata)
+        matches = []
+        skipped = 0
+        page = max(limit, 100)
+        for start in range(0, len(thread_ids), page):
+            for thread in self.get_many(thread_ids[start:start + page]):
+                thread_values = thread.values or {}
+                if any(thread_values.get(key) != value for key, value in values.items()):
+                    continue
+                if skipped < offset:
+                    skipped += 1
+                    continue
+                matches.append(thread)
+                if len(matches) == limit:
+                    return matches
+        return matches
+
+    def get_state(self, thread_id: str):
+        """
+        Returns the latest state of a thread from memory, or None if the thread does not exist.
+        """
+        self._sync()
+        state = self._index.get_state(thread_id)
+        return ThreadState.model_validate_json(state) if state is not None else None
+
+    def _latest_state(self, thread_id: str):
+        # The latest state as a dict, without going through the ThreadState model.
+        self._sync()
+        state = self._index.get_state(thread_id)
+        return json.loads(state) if state is not None else None
+
+    def stats(self):
+        """
+        Returns the size, commit and cross-process sync counters of the store.
+        """
+        self._sync()
+        return {
+            "path": self.path,
+            "threads": len(self._index),
+            "commits": self._commits,
+            "writes": self._committed_writes,
+            "pending_writes": self._writes.qsize(),
+            "last_seq": self._last_seq,
+            "synced_changes": self._synced_changes,
+            "reloads": self._reloads,
+            "thread_ttl": self.thread_ttl,
+            "deleted": self._deleted,
+            "expired": self._expired,
+            "collected_threads": self._collected_threads,
+            "collected_checkpoints": self._collected_checkpoints,
+        }
+
+    def close(self):
+        """
+        Commits the queued writes and stops the writer thread.
+        """
+        self._writes.put(None)
+        self._writer.join()
+
+
+_thread_store = None
+_thread_store_lock = threading.Lock()
+
+
+def get_thread_store():
+    """
+    Returns the process-wide ThreadStore, opened on THREAD_STORE_PATH on first use.
+    A legacy threads_db.pkl file is imported into an empty store.
+    """
+    global _thread_store
+    with _thread_store_lock:
+        if _thread_store is None:
+            _thread_store = ThreadStore(
+                path=os.getenv("THREAD_STORE_PATH", "threads_db.sqlite3"),
+                commit_interval=float(os.getenv("THREAD_STORE_COMMIT_INTERVAL", "0")),
+                sync_interval=float(os.getenv("THREAD_STORE_SYNC_INTERVAL", "0")),
+                snapshot_interval=int(os.getenv("THREAD_SNAPSHOT_INTERVAL", "20")),
+                checkpoint_retention=int(os.getenv("THREAD_CHECKPOINT_RETENTION", "1000")),
+                thread_ttl=float(os.getenv("THREAD_TTL", "0")),
+                stripes=int(os.getenv("THREAD_STORE_STRIPES", "64")),
+                blob_min_size=int(os.getenv("THREAD_BLOB_MIN_SIZE", "256")),
+            )
+    return _thread_store
+
+
+def close_thread_store():
+    """
+    Closes the process-wide ThreadStore, if open. The next `get_thread_store` call reopens it.
+    """
+    global _thread_store
+    with _thread_store_lock:
+        if _thread_store is not None:
+            _thread_store.close()
+            _thread_store = None
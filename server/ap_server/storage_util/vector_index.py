@@ -0,0 +1,202 @@
+import math
+
+import numpy as np
+
+
+class VectorIndex:
+    """
+    In-memory cosine similarity index over L2-normalized vectors, keyed by arbitrary hashable ids.
+
+    Vectors live in one contiguous matrix that grows by doubling; a removal moves the last row into
+    the freed one, so adds and removals are O(1) and the matrix never has holes. Below `ivf_threshold`
+    vectors a search is an exact brute-force scan. From there on the index also keeps an inverted file
+    (IVF): the vectors are clustered with spherical k-means into about sqrt(n) lists, and a search only
+    scores the lists whose centroids are closest to the query. New vectors are assigned to their
+    closest list as they are added, and the clustering is retrained whenever the index doubled.
+
+    The index is not thread-safe, the ItemStore serializes access to it.
+
+    Attributes:
+        ivf_threshold (int): Number of vectors from which searches go through the inverted file.
+        nprobe (int): Number of lists scored first by an IVF search.
+    """
+
+    def __init__(self, ivf_threshold: int = 20000, nprobe: int = 16, seed: int = 0):
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self._vectors = None
+        self._assignments = None
+        self._centroids = None
+        self._trained_size = 0
+        self._ids = []
+        self._rows = {}
+        self._rng = np.random.default_rng(seed)
+        self._trainings = 0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, id) -> bool:
+        return id in self._rows
+
+    def _reserve(self, size: int, dim: int):
+        if self._vectors is None:
+            self._vectors = np.zeros((max(size, 1024), dim), dtype=np.float32)
+            self._assignments = np.zeros(len(self._vectors), dtype=np.int32)
+        elif size > len(self._vectors):
+            capacity = max(size, 2 * len(self._vectors))
+            self._vectors = np.resize(self._vectors, (capacity, self._vectors.shape[1]))
+            self._assignments = np.resize(self._assignments, capacity)
+
+    def add(self, id, vector):
+        """
+        Adds or replaces the vector of an id.
+        """
+        self.add_many([id], np.asarray(vector, dtype=np.float32).reshape(1, -1))
+
+    def add_many(self, ids: list, vectors: np.ndarray, train: bool = True):
+        """
+        Adds or replaces the vectors of several ids, one row of `vectors` per id.
+
+        Args:
+            ids (list): The ids.
+            vectors (np.ndarray): The vectors.
+            train (bool, optional): Set to False while bulk loading, and call `maybe_train` at the end.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self._reserve(len(self._ids) + len(ids), vectors.shape[1])
+        rows = []
+        for id in ids:
+            row = self._rows.get(id)
+            if row is None:
+                row = len(self._ids)
+                self._rows[id] = row
+                self._ids.append(id)
+            rows.append(row)
+        rows = np.asarray(rows, dtype=np.int64)
+        self._vectors[rows] = vectors
+        if self._centroids is not None:
+            self._assignments[rows] = np.argmax(vectors @ self._centroids.T, axis=1)
+        if train:
+            self.maybe_train()
+
+    def maybe_train(self):
+        """
+        Clusters the vectors into the inverted file once the index reaches `ivf_threshold`, and again
+        every time it doubled since.
+        """
+        if len(self._ids) >= self.ivf_threshold and len(self._ids) >= 2 * self._trained_size:
+            self._train()
+
+    def remove(self, id) -> bool:
+        """
+        Removes the vector of an id.
+
+        Returns:
+            bool: True if the id was indexed.
+        """
+        row = self._rows.pop(id, None)
+        if row is None:
+            return False
+        last = len(self._ids) - 1
+        if row != last:
+            moved = self._ids[last]
+            self._ids[row] = moved
+            self._rows[moved] = row
+            self._vectors[row] = self._vectors[last]
+            self._assignments[row] = self._assignments[last]
+        self._ids.pop()
+        if self._centroids is not None and len(self._ids) < self.ivf_threshold // 2:
+            # Shrunk well below the threshold, brute force is cheaper again.
+            self._centroids, self._trained_size = None, 0
+        return True
+
+    def _train(self, iterations: int = 5):
+        size = len(self._ids)
+        vectors = self._vectors[:size]
+        nlist = max(8, int(math.sqrt(size)))
+        sample = vectors[self._rng.choice(size, min(size, 16 * nlist), replace=False)]
+        centroids = sample[self._rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Lists that attracted no vector keep their previous centroid.
+            centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+        for start in range(0, size, 65536):
+            chunk = vectors[start:start + 65536]
+            self._assignments[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+        self._centroids = centroids
+        self._trained_size = size
+        self._trainings += 1
+
+    def _top(self, query: np.ndarray, rows, k: int, accept) -> list:
+        # Scores the rows, then walks them best first. Only a partition of the best scores is sorted,
+        # and it is widened when `accept` rejects too many of them.
+        vectors = self._vectors[:len(self._ids)] if rows is None else self._vectors[rows]
+        scores = vectors @ query
+        count = len(scores)
+        wanted = min(count, max(2 * k, 32))
+        while True:
+            if wanted < count:
+                best = np.argpartition(-scores, wanted - 1)[:wanted]
+            else:
+                best = np.arange(count)
+            best = best[np.argsort(-scores[best], kind="stable")]
+            results = []
+            for position in best:
+                id = self._ids[position if rows is None else rows[position]]
+                if accept is None or accept(id):
+                    results.append((id, float(scores[position])))
+                    if len(results) == k:
+                        return results
+            if wanted >= count:
+                return results
+            wanted = min(count, wanted * 4)
+
+    def search(self, vector, k: int, accept=None, candidates=None) -> list:
+        """
+        Returns the ids closest to a vector, best first.
+
+        Args:
+            vector: The query vector.
+            k (int): Maximum number of ids returned.
+            accept (callable, optional): Predicate on the ids, the rejected ones are skipped.
+            candidates (list, optional): Restricts an exact search to these ids.
+
+        Returns:
+            list: (id, cosine similarity) pairs.
+        """
+        if not self._ids or k <= 0:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        if candidates is not None:
+            rows = np.fromiter((self._rows[id] for id in candidates if id in self._rows), dtype=np.int64)
+            return self._top(query, rows, k, accept)
+        if self._centroids is None:
+            return self._top(query, None, k, accept)
+
+        # Probe the closest lists, and more of them until enough ids are accepted.
+        centroid_scores = self._centroids @ query
+        nlist = len(self._centroids)
+        nprobe = min(self.nprobe, nlist)
+        while nprobe < nlist:
+            probed = np.zeros(nlist, dtype=bool)
+            probed[np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]] = True
+            rows = np.flatnonzero(probed[self._assignments[:len(self._ids)]])
+            results = self._top(query, rows, k, accept)
+            if len(results) == k:
+                return results
+            nprobe *= 4
+        return self._top(query, None, k, accept)
+
+    def stats(self):
+        """
+        Returns the size and layout of the index.
+        """
+        return {
+            "vectors": len(self._ids),
+            "lists": 0 if self._centroids is None else len(self._centroids),
+            "trainings": self._trainings,
+        }